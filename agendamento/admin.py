@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Servico, Agendamento
+from .models import Servico, Agendamento, ExcecaoHorario, SerieAgendamento
 
 @admin.register(Servico)
 class ServicoAdmin(admin.ModelAdmin):
@@ -11,4 +11,16 @@ class AgendamentoAdmin(admin.ModelAdmin):
     list_display = ['cliente', 'profissional', 'servico', 'data_hora_inicio', 'data_hora_fim', 'status']
     list_filter = ['status', 'profissional', 'data_hora_inicio']
     # Não permitimos editar data_hora_fim pois é automático
-    readonly_fields = ['data_hora_fim']
\ No newline at end of file
+    readonly_fields = ['data_hora_fim']
+
+@admin.register(ExcecaoHorario)
+class ExcecaoHorarioAdmin(admin.ModelAdmin):
+    list_display = ['profissional', 'data_inicio', 'data_fim', 'fechado', 'motivo']
+    list_filter = ['fechado', 'profissional']
+    date_hierarchy = 'data_inicio'
+
+
+@admin.register(SerieAgendamento)
+class SerieAgendamentoAdmin(admin.ModelAdmin):
+    list_display = ['cliente', 'profissional', 'servico', 'intervalo_semanas', 'ocorrencias', 'primeira_data', 'ativa']
+    list_filter = ['ativa', 'intervalo_semanas', 'profissional']
@@ -0,0 +1,157 @@
+"""
+Cache da disponibilidade por (profissional, data, duração do serviço).
+
+Em vez de apagar chaves por padrão (o que o cache local do Django e o Redis fazem
+de formas diferentes), cada profissional tem um número de versão. A versão entra
+na chave dos slots; invalidar é só trocar a versão, e as entradas antigas expiram
+sozinhas. Funciona igual no LocMemCache e num cache compartilhado.
+
+Os contadores de acerto/erro ficam no próprio cache, então somam todos os workers
+quando o backend é compartilhado.
+
+Quem grava dentro de uma transação invalida com `invalidar_no_commit`: a versão
+trocada antes do commit deixaria uma leitura concorrente gravar na chave nova os
+dados de antes do commit (o horário recém-marcado apareceria livre até expirar).
+
+O cálculo de uma entrada nova lê do primário (setup/replica.py): com réplica de
+leitura, slots montados com dados atrasados ficariam no cache até a próxima troca.
+"""
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from setup.replica import no_primario
+
+PREFIXO = 'disponibilidade'
+TIMEOUT_PADRAO = 60 * 60
+
+CHAVE_HITS = f'{PREFIXO}:stats:hits'
+CHAVE_MISSES = f'{PREFIXO}:stats:misses'
+
+
+def _timeout():
+    return getattr(settings, 'DISPONIBILIDADE_CACHE_TIMEOUT', TIMEOUT_PADRAO)
+
+
+def _chave_versao(profissional_id):
+    return f'{PREFIXO}:versao:{profissional_id}'
+
+
+def _incrementar(chave):
+    try:
+        cache.incr(chave)
+    except ValueError:
+        # Chave ainda não existe (ou foi despejada): cria e tenta de novo
+        cache.add(chave, 0, None)
+        try:
+            cache.incr(chave)
+        except ValueError:
+            pass
+
+
+def versao_agenda(profissional_id):
+    """
+    Versão atual da agenda do profissional.
+    Se a chave sumiu (reinício, despejo), nasce com um valor novo baseado no relógio,
+    para nunca reaproveitar entradas gravadas sob uma versão antiga.
+    """
+    chave = _chave_versao(profissional_id)
+    versao = cache.get(chave)
+    if versao is None:
+        cache.add(chave, time.time_ns(), None)
+        versao = cache.get(chave)
+    return versao
+
+
+def invalidar_agenda(profissional_id):
+    """Descarta todos os slots em cache do profissional (todas as datas e durações)."""
+    chave = _chave_versao(profissional_id)
+    try:
+        cache.incr(chave)
+    except ValueError:
+        cache.set(chave, time.time_ns(), None)
+
+
+def invalidar_no_commit(invalidar, profissional_id):
+    """
+    Chama `invalidar(profissional_id)` agora (para as leituras da própria transação)
+    e de novo depois do commit, descartando o que outra requisição tenha guardado
+    na versão nova com dados de antes do commit. Fora de transação, roda duas vezes
+    seguidas, o que é inofensivo.
+    """
+    invalidar(profissional_id)
+    transaction.on_commit(partial(invalidar, profissional_id))
+
+
+def obter_disponibilidade(profissional_id, data, duracao, calcular):
+    """
+    Devolve o valor em cache para (profissional, data, duração) ou chama `calcular()`
+    e guarda o resultado. O valor não pode depender do horário atual.
+    """
+    chave = f'{PREFIXO}:{profissional_id}:{versao_agenda(profissional_id)}:{data.isoformat()}:{duracao}'
+    valor = cache.get(chave)
+    if valor is not None:
+        _incrementar(CHAVE_HITS)
+        return valor
+
+    _incrementar(CHAVE_MISSES)
+    with no_primario():
+        valor = calcular()
+    cache.set(chave, valor, _timeout())
+    return valor
+
+
+async def _aincrementar(chave):
+    try:
+        await cache.aincr(chave)
+    except ValueError:
+        await cache.aadd(chave, 0, None)
+        try:
+            await cache.aincr(chave)
+        except ValueError:
+            pass
+
+
+async def aversao_agenda(profissional_id):
+    """Versão async de `versao_agenda` (mesmas chaves, os dois lados convivem)."""
+    chave = _chave_versao(profissional_id)
+    versao = await cache.aget(chave)
+    if versao is None:
+        await cache.aadd(chave, time.time_ns(), None)
+        versao = await cache.aget(chave)
+    return versao
+
+
+async def aobter_disponibilidade(profissional_id, data, duracao, calcular):
+    """Versão async de `obter_disponibilidade`: `calcular` é uma corrotina."""
+    chave = f'{PREFIXO}:{profissional_id}:{await aversao_agenda(profissional_id)}:{data.isoformat()}:{duracao}'
+    valor = await cache.aget(chave)
+    if valor is not None:
+        await _aincrementar(CHAVE_HITS)
+        return valor
+
+    await _aincrementar(CHAVE_MISSES)
+    with no_primario():
+        valor = await calcular()
+    await cache.aset(chave, valor, _timeout())
+    return valor
+
+
+def estatisticas_cache():
+    """Contadores de acerto/erro do cache de disponibilidade."""
+    valores = cache.get_many([CHAVE_HITS, CHAVE_MISSES])
+    hits = valores.get(CHAVE_HITS, 0)
+    misses = valores.get(CHAVE_MISSES, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'taxa_acerto': round(hits / total, 4) if total else 0,
+    }
+
+
+def zerar_estatisticas():
+    cache.delete_many([CHAVE_HITS, CHAVE_MISSES])
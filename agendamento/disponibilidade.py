@@ -0,0 +1,236 @@
+"""
+Motor de disponibilidade da agenda.
+
+Tudo aqui trabalha com "minutos desde a meia-noite" (hora local) de um único dia.
+Almoço, agendamentos existentes e o corte de "horário já passou" viram intervalos
+bloqueados [inicio, fim), que são ordenados e mesclados uma única vez.
+Depois disso, os slots são gerados com uma varredura linear (sweep): como os
+inícios dos slots só crescem, o ponteiro nos bloqueios também só anda para frente.
+
+Custo: O(B log B + S) por dia, em vez do antigo O(S x B) (S = slots, B = agendamentos).
+
+O módulo não faz consultas ao banco. Quem chama (view, clean, buscas em lote)
+busca os dados e passa para cá.
+"""
+import math
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+# Intervalo entre os inícios de slots oferecidos ao cliente
+PASSO_MINUTOS = 30
+
+# Status que ocupam a agenda do profissional (cancelados e faltas liberam o horário)
+STATUS_OCUPAM_AGENDA = ('AGENDADO', 'CONCLUIDO')
+
+MINUTOS_NO_DIA = 24 * 60
+
+# Busca de "próximo horário livre": janela padrão e teto aceito pela API
+HORIZONTE_PADRAO_DIAS = 60
+HORIZONTE_MAXIMO_DIAS = 180
+
+
+def minutos_do_horario(valor):
+    """Converte um `time` em minutos desde a meia-noite."""
+    return valor.hour * 60 + valor.minute + valor.second / 60
+
+
+def meia_noite(data):
+    """Meia-noite local de `data` como datetime aware."""
+    return timezone.make_aware(datetime.combine(data, time.min))
+
+
+def minutos_desde_meia_noite(data, momento, referencia=None):
+    """
+    Converte um datetime (aware) em minutos desde a meia-noite local de `data`.
+    Pode ser negativo (dia anterior) ou passar de 1440 (dia seguinte).
+    Em laços, passe `referencia=meia_noite(data)` para não recalcular o fuso a cada item.
+    """
+    return (momento - (referencia or meia_noite(data))).total_seconds() / 60
+
+
+def formatar_minutos(minutos):
+    return f"{int(minutos) // 60:02d}:{int(minutos) % 60:02d}"
+
+
+def mesclar_intervalos(intervalos):
+    """Ordena e junta intervalos que se sobrepõem ou se encostam."""
+    mesclados = []
+    for inicio, fim in sorted(intervalos):
+        if fim <= inicio:
+            continue
+        if mesclados and inicio <= mesclados[-1][1]:
+            if fim > mesclados[-1][1]:
+                mesclados[-1][1] = fim
+        else:
+            mesclados.append([inicio, fim])
+    return [(inicio, fim) for inicio, fim in mesclados]
+
+
+def corte_horario_passado(data, agora=None, referencia=None):
+    """
+    Primeiro minuto do dia em que ainda é possível começar um atendimento.
+    Dias passados ficam totalmente bloqueados; dias futuros não têm corte.
+    """
+    agora = agora or timezone.now()
+    minutos = minutos_desde_meia_noite(data, agora, referencia)
+    if minutos <= 0:
+        return 0
+    return min(math.ceil(minutos), MINUTOS_NO_DIA)
+
+
+def bloqueios_do_dia(horario, data, ocupados=(), agora=None):
+    """
+    Monta a lista ordenada e mesclada de intervalos bloqueados do dia.
+
+    `ocupados` é um iterável de pares (inicio, fim) em datetime aware,
+    normalmente vindo de `.values_list('data_hora_inicio', 'data_hora_fim')`.
+    Passe `agora=False` para ignorar o corte de horário já passado.
+    """
+    intervalos = []
+    referencia = meia_noite(data)
+
+    if horario.almoco_inicio and horario.almoco_fim:
+        intervalos.append((minutos_do_horario(horario.almoco_inicio), minutos_do_horario(horario.almoco_fim)))
+
+    for inicio, fim in ocupados:
+        if inicio is None or fim is None:
+            continue
+        intervalos.append((minutos_desde_meia_noite(data, inicio, referencia), minutos_desde_meia_noite(data, fim, referencia)))
+
+    if agora is not False:
+        corte = corte_horario_passado(data, agora, referencia)
+        if corte > 0:
+            intervalos.append((float('-inf'), corte))
+
+    return mesclar_intervalos(intervalos)
+
+
+def intervalo_livre(bloqueios, inicio, fim):
+    """Diz se [inicio, fim) não cruza nenhum bloqueio (busca binária na lista mesclada)."""
+    pos = bisect_right(bloqueios, (inicio, float('inf')))
+    # O bloqueio anterior pode ainda estar "aberto" em `inicio`
+    if pos > 0 and bloqueios[pos - 1][1] > inicio:
+        return False
+    # O próximo bloqueio não pode começar antes do fim do intervalo
+    if pos < len(bloqueios) and bloqueios[pos][0] < fim:
+        return False
+    return True
+
+
+def gerar_slots(horario, data, duracao, ocupados=(), agora=None, passo=PASSO_MINUTOS):
+    """
+    Retorna os horários livres do dia no formato 'HH:MM'.
+
+    `horario` é qualquer objeto com hora_inicio, hora_fim, almoco_inicio,
+    almoco_fim e folga (um HorarioTrabalho, por exemplo).
+    """
+    return [formatar_minutos(inicio) for inicio in gerar_inicios_livres(horario, data, duracao, ocupados, agora, passo)]
+
+
+def gerar_inicios_livres(horario, data, duracao, ocupados=(), agora=None, passo=PASSO_MINUTOS):
+    """Mesmo que `gerar_slots`, mas devolve os inícios em minutos (para buscas em lote)."""
+    if horario is None or horario.folga:
+        return []
+
+    bloqueios = bloqueios_do_dia(horario, data, ocupados, agora)
+    expediente_fim = minutos_do_horario(horario.hora_fim)
+
+    livres = []
+    j = 0
+    inicio = minutos_do_horario(horario.hora_inicio)
+    while inicio + duracao <= expediente_fim:
+        fim = inicio + duracao
+        # Descarta bloqueios que já terminaram antes deste slot
+        while j < len(bloqueios) and bloqueios[j][1] <= inicio:
+            j += 1
+        if j == len(bloqueios) or bloqueios[j][0] >= fim:
+            livres.append(inicio)
+        inicio += passo
+    return livres
+
+
+def aplicar_corte(data, inicios, agora=None):
+    """
+    Remove os inícios que já passaram. Permite guardar em cache a lista calculada
+    com `agora=False` e aplicar o corte só na hora de responder.
+    """
+    corte = corte_horario_passado(data, agora)
+    return [inicio for inicio in inicios if inicio >= corte]
+
+
+def slot_para_datetime(data, minutos):
+    """Converte um início em minutos de volta para datetime aware (fuso atual)."""
+    return meia_noite(data) + timedelta(minutes=minutos)
+
+
+def mensagem_sem_agenda(inicio_local):
+    """Erro de quando o profissional não tem regra de trabalho para o dia."""
+    return f"O profissional não configurou agenda para {inicio_local.strftime('%A')}."
+
+
+def mensagem_conflito(profissional):
+    return f"O profissional {profissional} já tem um agendamento neste horário."
+
+
+def validar_expediente(horario, inicio, fim):
+    """
+    Valida um agendamento [inicio, fim) contra a regra de trabalho do dia.
+    Levanta ValidationError com as mesmas mensagens usadas pelo Agendamento.clean().
+    """
+    if horario.folga:
+        # Exceções (feriado, férias) trazem o motivo
+        motivo = getattr(horario, 'motivo', '')
+        raise ValidationError(f"O profissional não trabalha neste dia ({motivo})." if motivo else "O profissional não trabalha neste dia.")
+
+    data = timezone.localtime(inicio).date()
+    ini = minutos_desde_meia_noite(data, inicio)
+    fim = minutos_desde_meia_noite(data, fim)
+
+    if ini < minutos_do_horario(horario.hora_inicio) or fim > minutos_do_horario(horario.hora_fim):
+        raise ValidationError(f"Fora do horário de expediente ({horario.hora_inicio.strftime('%H:%M')} às {horario.hora_fim.strftime('%H:%M')}).")
+
+    if horario.almoco_inicio and horario.almoco_fim:
+        almoco = [(minutos_do_horario(horario.almoco_inicio), minutos_do_horario(horario.almoco_fim))]
+        if not intervalo_livre(almoco, ini, fim):
+            raise ValidationError(f"Horário coincide com o intervalo de almoço ({horario.almoco_inicio.strftime('%H:%M')} às {horario.almoco_fim.strftime('%H:%M')}).")
+
+
+def agrupar_por_dia(ocupados):
+    """
+    Agrupa pares (inicio, fim) pelo dia local em que tocam.
+    Um agendamento que atravessa a meia-noite entra nos dois dias.
+    """
+    por_dia = {}
+    for inicio, fim in ocupados:
+        if inicio is None or fim is None:
+            continue
+        dia = timezone.localtime(inicio).date()
+        ultimo_dia = timezone.localtime(fim - timedelta(microseconds=1)).date()
+        while dia <= ultimo_dia:
+            por_dia.setdefault(dia, []).append((inicio, fim))
+            dia += timedelta(days=1)
+    return por_dia
+
+
+def proximos_horarios_livres(regra_do_dia, ocupados_por_dia, duracao, data_inicial, dias, quantidade, agora=None):
+    """
+    Percorre os dias a partir de `data_inicial` e devolve até `quantidade`
+    pares (data, 'HH:MM') livres, em ordem cronológica.
+
+    `regra_do_dia` devolve a regra de trabalho de uma data (por exemplo,
+    `Expediente.regra`, que já considera feriados e férias);
+    `ocupados_por_dia` é o resultado de `agrupar_por_dia` para a janela inteira.
+    """
+    encontrados = []
+    for deslocamento in range(dias):
+        data = data_inicial + timedelta(days=deslocamento)
+        horario = regra_do_dia(data)
+        livres = gerar_inicios_livres(horario, data, duracao, ocupados_por_dia.get(data, ()), agora)
+        for inicio in livres:
+            encontrados.append((data, formatar_minutos(inicio)))
+            if len(encontrados) >= quantidade:
+                return encontrados
+    return encontrados
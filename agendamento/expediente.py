@@ -0,0 +1,252 @@
+"""
+Expediente efetivo de cada profissional, data a data.
+
+A regra semanal (as 7 linhas de HorarioTrabalho) e as exceções por período
+(ExcecaoHorario: feriados, férias, horário estendido) são compiladas uma vez num
+`Expediente`: a semana indexada pelo weekday e as exceções achatadas em trechos
+sem sobreposição, ordenados pela data inicial. A regra de uma data sai de uma
+busca binária nos trechos; se nenhuma exceção cobre o dia, vale a semanal.
+
+O Expediente compilado fica no cache por profissional. Como em cache.py, a chave
+leva um número de versão, trocado pelos signals de HorarioTrabalho e
+ExcecaoHorario (o formset de configurar_horarios salva linha a linha, então
+também passa por eles). O clean() do Agendamento, a API de horários e as buscas
+de vários dias consultam este módulo em vez de ir direto no HorarioTrabalho.
+
+Em cima do cache compartilhado há uma memória por processo, indexada pela
+versão: no caso comum só a versão é lida do cache e o Expediente já
+desserializado é reaproveitado. Como a versão é sempre conferida, a troca feita
+por outro worker é vista na próxima leitura. A compilação lê sempre do primário,
+nunca da réplica de leitura (ver setup/replica.py).
+"""
+import time
+from bisect import bisect_right
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+
+from setup.replica import no_primario
+
+from .models import ExcecaoHorario, HorarioTrabalho
+
+PREFIXO = 'expediente'
+TIMEOUT_PADRAO = 60 * 60 * 24
+# Teto de profissionais na memória do processo (passou disso, recomeça vazia)
+LIMITE_MEMORIA = 2000
+
+UM_DIA = timedelta(days=1)
+
+
+class RegraDia:
+    """Regra de trabalho de uma data, com os atributos que o motor de disponibilidade espera."""
+
+    __slots__ = ('hora_inicio', 'hora_fim', 'almoco_inicio', 'almoco_fim', 'folga', 'motivo')
+
+    def __init__(self, hora_inicio=None, hora_fim=None, almoco_inicio=None, almoco_fim=None, folga=False, motivo=''):
+        self.hora_inicio = hora_inicio
+        self.hora_fim = hora_fim
+        self.almoco_inicio = almoco_inicio
+        self.almoco_fim = almoco_fim
+        self.folga = folga
+        self.motivo = motivo
+
+    @classmethod
+    def do_horario(cls, horario):
+        return cls(horario.hora_inicio, horario.hora_fim, horario.almoco_inicio, horario.almoco_fim, horario.folga)
+
+    @classmethod
+    def da_excecao(cls, excecao):
+        if excecao.fechado:
+            return cls(folga=True, motivo=excecao.motivo)
+        return cls(excecao.hora_inicio, excecao.hora_fim, excecao.almoco_inicio, excecao.almoco_fim, motivo=excecao.motivo)
+
+
+def compilar_excecoes(excecoes):
+    """
+    Achata pares (data_inicio, data_fim, regra) em trechos disjuntos e ordenados.
+    As exceções vêm em ordem de cadastro; onde duas se cruzam, a mais nova vence.
+    Quadrático no número de exceções, que é pequeno (alguns feriados e férias).
+    """
+    excecoes = list(excecoes)
+    fronteiras = sorted({dia for inicio, fim, _ in excecoes for dia in (inicio, fim + UM_DIA)})
+
+    trechos = []
+    for inicio, proximo in zip(fronteiras, fronteiras[1:]):
+        # Entre duas fronteiras seguidas, cada exceção cobre o trecho todo ou nada dele
+        vencedora = None
+        for excecao_inicio, excecao_fim, regra in excecoes:
+            if excecao_inicio <= inicio <= excecao_fim:
+                vencedora = regra
+        if vencedora is None:
+            continue
+        if trechos and trechos[-1][2] is vencedora and trechos[-1][1] + UM_DIA == inicio:
+            trechos[-1] = (trechos[-1][0], proximo - UM_DIA, vencedora)
+        else:
+            trechos.append((inicio, proximo - UM_DIA, vencedora))
+    return trechos
+
+
+class Expediente:
+    """Regra semanal + exceções compiladas de um profissional."""
+
+    def __init__(self, semana, excecoes=()):
+        self.semana = semana
+        self.trechos = compilar_excecoes(excecoes)
+        self._inicios = [inicio for inicio, _, _ in self.trechos]
+
+    def regra(self, data):
+        """RegraDia valendo em `data`, ou None se o profissional não configurou aquele dia."""
+        pos = bisect_right(self._inicios, data) - 1
+        if pos >= 0 and data <= self.trechos[pos][1]:
+            return self.trechos[pos][2]
+        return self.semana.get(data.weekday())
+
+
+def _montar(horarios, excecoes):
+    """Agrupa linhas de HorarioTrabalho e ExcecaoHorario (já ordenadas) em Expedientes."""
+    semanas = {}
+    for horario in horarios:
+        semanas.setdefault(horario.profissional_id, {})[horario.dia_semana] = RegraDia.do_horario(horario)
+    por_profissional = {}
+    for excecao in excecoes:
+        por_profissional.setdefault(excecao.profissional_id, []).append(
+            (excecao.data_inicio, excecao.data_fim, RegraDia.da_excecao(excecao))
+        )
+    return semanas, por_profissional
+
+
+def carregar_expedientes(profissional_ids):
+    """Compila o expediente de vários profissionais em duas consultas."""
+    semanas, excecoes = _montar(
+        HorarioTrabalho.objects.filter(profissional_id__in=profissional_ids),
+        ExcecaoHorario.objects.filter(profissional_id__in=profissional_ids).order_by('id'),
+    )
+    return {pk: Expediente(semanas.get(pk, {}), excecoes.get(pk, ())) for pk in profissional_ids}
+
+
+async def acarregar_expediente(profissional_id):
+    """Versão async de `carregar_expedientes` para um profissional."""
+    semanas, excecoes = _montar(
+        [horario async for horario in HorarioTrabalho.objects.filter(profissional_id=profissional_id)],
+        [excecao async for excecao in ExcecaoHorario.objects.filter(profissional_id=profissional_id).order_by('id')],
+    )
+    return Expediente(semanas.get(profissional_id, {}), excecoes.get(profissional_id, ()))
+
+
+# --- Cache -------------------------------------------------------------------
+
+# {profissional_id: (versao, Expediente)} deste processo
+_memoria = {}
+
+
+def _timeout():
+    return getattr(settings, 'EXPEDIENTE_CACHE_TIMEOUT', TIMEOUT_PADRAO)
+
+
+def _chave_versao(profissional_id):
+    return f'{PREFIXO}:versao:{profissional_id}'
+
+
+def _chave(profissional_id, versao):
+    return f'{PREFIXO}:{profissional_id}:{versao}'
+
+
+def invalidar_expediente(profissional_id):
+    """Descarta o expediente compilado do profissional (regra semanal ou exceção mudou)."""
+    _memoria.pop(profissional_id, None)
+    chave = _chave_versao(profissional_id)
+    try:
+        cache.incr(chave)
+    except ValueError:
+        cache.set(chave, time.time_ns(), None)
+
+
+def _versoes(profissional_ids):
+    """Versão de cada profissional numa ida só ao cache (cria as que faltam)."""
+    chaves = {pk: _chave_versao(pk) for pk in profissional_ids}
+    encontradas = cache.get_many(chaves.values())
+    versoes = {}
+    for pk, chave in chaves.items():
+        if chave not in encontradas:
+            cache.add(chave, time.time_ns(), None)
+            encontradas[chave] = cache.get(chave)
+        versoes[pk] = encontradas[chave]
+    return versoes
+
+
+def _da_memoria(profissional_id, versao):
+    guardado = _memoria.get(profissional_id)
+    if guardado is not None and guardado[0] == versao:
+        return guardado[1]
+    return None
+
+
+def _memorizar(profissional_id, versao, expediente):
+    if len(_memoria) >= LIMITE_MEMORIA:
+        _memoria.clear()
+    _memoria[profissional_id] = (versao, expediente)
+
+
+def obter_expedientes(profissional_ids):
+    """
+    Expediente de cada profissional. Procura na memória do processo, depois no
+    cache compartilhado; só os que não estão em nenhum dos dois vão ao banco.
+    """
+    versoes = _versoes(profissional_ids)
+    expedientes = {}
+    for pk in profissional_ids:
+        expediente = _da_memoria(pk, versoes[pk])
+        if expediente is not None:
+            expedientes[pk] = expediente
+
+    faltando = [pk for pk in profissional_ids if pk not in expedientes]
+    if faltando:
+        chaves = {pk: _chave(pk, versoes[pk]) for pk in faltando}
+        em_cache = cache.get_many(chaves.values())
+        lidos = {pk: em_cache[chave] for pk, chave in chaves.items() if chave in em_cache}
+
+        sem_cache = [pk for pk in faltando if pk not in lidos]
+        if sem_cache:
+            with no_primario():
+                novos = carregar_expedientes(sem_cache)
+            cache.set_many({chaves[pk]: expediente for pk, expediente in novos.items()}, _timeout())
+            lidos.update(novos)
+
+        for pk, expediente in lidos.items():
+            _memorizar(pk, versoes[pk], expediente)
+        expedientes.update(lidos)
+    return expedientes
+
+
+def obter_expediente(profissional_id):
+    return obter_expedientes([profissional_id])[profissional_id]
+
+
+def regra_do_dia(profissional_id, data):
+    """Regra efetiva do profissional em `data` (semanal ou exceção), ou None."""
+    if profissional_id is None:
+        return None
+    return obter_expediente(profissional_id).regra(data)
+
+
+async def aobter_expediente(profissional_id):
+    """Versão async de `obter_expediente` (mesmas chaves de cache)."""
+    chave_versao = _chave_versao(profissional_id)
+    versao = await cache.aget(chave_versao)
+    if versao is None:
+        await cache.aadd(chave_versao, time.time_ns(), None)
+        versao = await cache.aget(chave_versao)
+
+    expediente = _da_memoria(profissional_id, versao)
+    if expediente is not None:
+        return expediente
+
+    chave = _chave(profissional_id, versao)
+    expediente = await cache.aget(chave)
+    if expediente is None:
+        with no_primario():
+            expediente = await acarregar_expediente(profissional_id)
+        await cache.aset(chave, expediente, _timeout())
+    _memorizar(profissional_id, versao, expediente)
+    return expediente
@@ -1,8 +1,23 @@
 from django import forms
-from .models import Agendamento, Servico
+from django.core.exceptions import ValidationError
+from django.forms.models import construct_instance
+from .models import Agendamento, ExcecaoHorario, SerieAgendamento, Servico
+from .series import OCORRENCIAS_MAXIMAS, OCORRENCIAS_MINIMAS
 from users.models import User
 
 class AgendamentoForm(forms.ModelForm):
+    # Série recorrente (opcional): vazio = agendamento avulso
+    repetir = forms.TypedChoiceField(
+        choices=[('', 'Não repetir')] + [(str(valor), rotulo) for valor, rotulo in SerieAgendamento.INTERVALOS],
+        coerce=int, empty_value=None, required=False,
+        widget=forms.Select(attrs={'class': 'form-control', 'id': 'id_repetir'}),
+    )
+    ocorrencias = forms.IntegerField(
+        min_value=OCORRENCIAS_MINIMAS, max_value=OCORRENCIAS_MAXIMAS, initial=4, required=False,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'id': 'id_ocorrencias'}),
+    )
+    pular_ocupadas = forms.BooleanField(required=False, label="Marcar só as datas livres")
+
     class Meta:
         model = Agendamento
         fields = ['servico', 'profissional', 'data_hora_inicio']
@@ -15,4 +30,31 @@ class AgendamentoForm(forms.ModelForm):
         
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['profissional'].queryset = User.objects.filter(tipo='CABELEIREIRO')
\ No newline at end of file
+        self.fields['profissional'].queryset = User.objects.filter(tipo='CABELEIREIRO')
+
+    def _post_clean(self):
+        # O clean() do modelo (expediente e conflitos) não roda aqui: no avulso ele roda
+        # no reservar(), já com a agenda travada, e rodar antes só repetiria as consultas;
+        # na série quem decide as datas é o validar_em_lote() (o clean() barraria a série
+        # inteira se só a primeira data estivesse ocupada). Aqui só montamos a instância
+        try:
+            self.instance = construct_instance(self, self.instance, self._meta.fields, self._meta.exclude)
+            self.instance.clean_fields(exclude=self._get_validation_exclusions())
+        except ValidationError as e:
+            self._update_errors(e)
+
+
+class ExcecaoHorarioForm(forms.ModelForm):
+    class Meta:
+        model = ExcecaoHorario
+        fields = ['data_inicio', 'data_fim', 'fechado', 'hora_inicio', 'hora_fim', 'almoco_inicio', 'almoco_fim', 'motivo']
+        widgets = {
+            'data_inicio': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+            'data_fim': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+            'fechado': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+            'hora_inicio': forms.TimeInput(attrs={'type': 'time', 'class': 'time-input'}),
+            'hora_fim': forms.TimeInput(attrs={'type': 'time', 'class': 'time-input'}),
+            'almoco_inicio': forms.TimeInput(attrs={'type': 'time', 'class': 'time-input'}),
+            'almoco_fim': forms.TimeInput(attrs={'type': 'time', 'class': 'time-input'}),
+            'motivo': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ex.: Feriado, férias, plantão de sábado'}),
+        }
@@ -0,0 +1,90 @@
+import time as cronometro
+from datetime import datetime, time, timedelta
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.timezone import make_aware
+
+from agendamento.disponibilidade import gerar_slots
+
+
+def slots_loop_aninhado(horario, data_obj, duracao, agendamentos, passo):
+    """Cópia do algoritmo antigo da view (slot x agendamento), usada como referência."""
+    slots = []
+    hora_atual = datetime.combine(data_obj, horario.hora_inicio)
+    hora_fim_trab = datetime.combine(data_obj, horario.hora_fim)
+    almoco_inicio = datetime.combine(data_obj, horario.almoco_inicio)
+    almoco_fim = datetime.combine(data_obj, horario.almoco_fim)
+
+    while hora_atual + timedelta(minutes=duracao) <= hora_fim_trab:
+        hora_termino = hora_atual + timedelta(minutes=duracao)
+        bloqueado = hora_atual < almoco_fim and hora_termino > almoco_inicio
+        if not bloqueado:
+            slot_inicio = make_aware(hora_atual)
+            slot_fim = make_aware(hora_termino)
+            for inicio, fim in agendamentos:
+                if slot_inicio < fim and slot_fim > inicio:
+                    bloqueado = True
+                    break
+        if not bloqueado:
+            agora = timezone.now()
+            if data_obj == agora.date() and make_aware(hora_atual) < agora:
+                bloqueado = True
+        if not bloqueado:
+            slots.append(hora_atual.strftime("%H:%M"))
+        hora_atual += timedelta(minutes=passo)
+    return slots
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark do cálculo de horários disponíveis: loop aninhado antigo x varredura de intervalos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duracao', type=int, default=15, help='Duração do serviço em minutos')
+        parser.add_argument('--passo', type=int, default=5, help='Intervalo entre inícios de slot em minutos')
+        parser.add_argument('--repeticoes', type=int, default=200)
+        parser.add_argument('--densidades', default='0,10,50,100,200,400',
+                            help='Quantidades de agendamentos no dia, separadas por vírgula')
+
+    def handle(self, *args, **options):
+        duracao = options['duracao']
+        passo = options['passo']
+        repeticoes = options['repeticoes']
+        densidades = [int(d) for d in options['densidades'].split(',')]
+
+        # Dia longo (06h às 23h) numa data futura, para não cair no corte de "já passou"
+        data_obj = timezone.localdate() + timedelta(days=7)
+        horario = SimpleNamespace(
+            hora_inicio=time(6, 0), hora_fim=time(23, 0),
+            almoco_inicio=time(12, 0), almoco_fim=time(13, 0), folga=False,
+        )
+        abertura = make_aware(datetime.combine(data_obj, horario.hora_inicio))
+        minutos_expediente = 17 * 60
+
+        self.stdout.write(f'Dia {data_obj} | expediente 06:00-23:00 | serviço {duracao}min | passo {passo}min | {repeticoes} repetições')
+        self.stdout.write(f"{'agendamentos':>12} {'antigo (ms)':>12} {'varredura (ms)':>15} {'ganho':>8}")
+
+        for densidade in densidades:
+            # Agendamentos curtos e espalhados pelo dia (podem se sobrepor, como na vida real com cancelamentos)
+            agendamentos = []
+            if densidade:
+                espaco = minutos_expediente / densidade
+                for i in range(densidade):
+                    inicio = abertura + timedelta(minutes=int(i * espaco))
+                    agendamentos.append((inicio, inicio + timedelta(minutes=duracao)))
+
+            antigo = self._medir(lambda: slots_loop_aninhado(horario, data_obj, duracao, agendamentos, passo), repeticoes)
+            novo = self._medir(lambda: gerar_slots(horario, data_obj, duracao, agendamentos, passo=passo), repeticoes)
+
+            if slots_loop_aninhado(horario, data_obj, duracao, agendamentos, passo) != gerar_slots(horario, data_obj, duracao, agendamentos, passo=passo):
+                self.stdout.write(self.style.ERROR(f'Resultados divergentes com {densidade} agendamentos!'))
+
+            ganho = antigo / novo if novo else 0
+            self.stdout.write(f'{densidade:>12} {antigo:>12.3f} {novo:>15.3f} {ganho:>7.1f}x')
+
+    def _medir(self, funcao, repeticoes):
+        inicio = cronometro.perf_counter()
+        for _ in range(repeticoes):
+            funcao()
+        return (cronometro.perf_counter() - inicio) * 1000 / repeticoes
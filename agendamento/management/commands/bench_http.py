@@ -0,0 +1,134 @@
+import http.client
+import json
+import threading
+import time as cronometro
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from agendamento.models import Servico
+
+User = get_user_model()
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0
+    indice = min(len(valores_ordenados) - 1, int(round(p / 100 * (len(valores_ordenados) - 1))))
+    return valores_ordenados[indice]
+
+
+class Command(BaseCommand):
+    help = (
+        'Carga HTTP nas APIs do formulário de agendamento (horários disponíveis e serviços) '
+        'contra um servidor já rodando. Rode uma vez contra o gunicorn WSGI e outra contra o '
+        'perfil ASGI e compare requisições/s e latência de cauda (ver README).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base', default='http://127.0.0.1:8000', help='Endereço do servidor em teste')
+        parser.add_argument('--requisicoes', type=int, default=2000)
+        parser.add_argument('--concorrencia', type=int, default=50, help='Clientes simultâneos (conexões keep-alive)')
+        parser.add_argument('--aquecimento', type=int, default=100, help='Requisições descartadas antes de medir')
+        parser.add_argument('--profissional', type=int, help='Padrão: primeiro cabeleireiro com serviço ativo')
+        parser.add_argument('--rotulo', default='', help='Nome da rodada no relatório (ex.: wsgi, asgi)')
+        parser.add_argument('--saida', help='Arquivo JSON onde salvar o resultado')
+
+    def handle(self, *args, **options):
+        destino = urlsplit(options['base'])
+        if destino.scheme != 'http' or not destino.hostname:
+            raise CommandError('Use um endereço http://host:porta')
+        self.destino = destino
+
+        caminhos = self._caminhos(options['profissional'])
+        self.stdout.write(f"Alvo {options['base']} | {options['requisicoes']} requisições | concorrência {options['concorrencia']}")
+
+        resultado = {'rotulo': options['rotulo'], 'base': options['base'], 'endpoints': {}}
+        for nome, caminho in caminhos.items():
+            self._rodada(caminho, options['aquecimento'], options['concorrencia'])
+            medicao = self._rodada(caminho, options['requisicoes'], options['concorrencia'])
+            resultado['endpoints'][nome] = medicao
+            self.stdout.write(
+                f"{nome:<22} {medicao['rps']:>9.1f} req/s | p50 {medicao['p50_ms']:>7.2f}ms | "
+                f"p95 {medicao['p95_ms']:>7.2f}ms | p99 {medicao['p99_ms']:>7.2f}ms | erros {medicao['erros']}"
+            )
+
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultado salvo em {options['saida']}"))
+
+    def _caminhos(self, profissional_id):
+        servicos = Servico.objects.filter(ativo=True, profissional__tipo='CABELEIREIRO')
+        if profissional_id:
+            servicos = servicos.filter(profissional_id=profissional_id)
+        servico = servicos.order_by('profissional_id', 'id').first()
+        if servico is None:
+            raise CommandError('Nenhum cabeleireiro com serviço ativo (rode populate_salao).')
+
+        # Próximo dia que não é domingo (folga padrão)
+        data = timezone.localdate() + timedelta(days=1)
+        if data.weekday() == 6:
+            data += timedelta(days=1)
+
+        return {
+            'horarios_disponiveis': (
+                f'/agendamento/api/horarios-disponiveis/?profissional_id={servico.profissional_id}'
+                f'&data={data.isoformat()}&servico_id={servico.id}'
+            ),
+            'servicos': f'/agendamento/api/servicos/{servico.profissional_id}/',
+        }
+
+    def _rodada(self, caminho, total, concorrencia):
+        latencias = []
+        erros = 0
+        trava = threading.Lock()
+        restantes = iter(range(total))
+
+        def cliente():
+            nonlocal erros
+            conexao = http.client.HTTPConnection(self.destino.hostname, self.destino.port or 80, timeout=30)
+            locais = []
+            falhas = 0
+            while True:
+                with trava:
+                    if next(restantes, None) is None:
+                        break
+                inicio = cronometro.perf_counter()
+                try:
+                    conexao.request('GET', caminho)
+                    resposta = conexao.getresponse()
+                    resposta.read()
+                    if resposta.status != 200:
+                        falhas += 1
+                except (OSError, http.client.HTTPException):
+                    falhas += 1
+                    conexao.close()
+                    conexao = http.client.HTTPConnection(self.destino.hostname, self.destino.port or 80, timeout=30)
+                locais.append(cronometro.perf_counter() - inicio)
+            conexao.close()
+            with trava:
+                latencias.extend(locais)
+                erros += falhas
+
+        inicio = cronometro.perf_counter()
+        with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+            for _ in range(concorrencia):
+                executor.submit(cliente)
+        duracao = cronometro.perf_counter() - inicio
+
+        latencias.sort()
+        return {
+            'requisicoes': len(latencias),
+            'erros': erros,
+            'segundos': round(duracao, 3),
+            'rps': round(len(latencias) / duracao, 1) if duracao else 0,
+            'p50_ms': round(percentil(latencias, 50) * 1000, 2),
+            'p95_ms': round(percentil(latencias, 95) * 1000, 2),
+            'p99_ms': round(percentil(latencias, 99) * 1000, 2),
+            'max_ms': round(latencias[-1] * 1000, 2) if latencias else 0,
+        }
@@ -0,0 +1,213 @@
+import json
+import platform
+import subprocess
+import time as cronometro
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from agendamento.disponibilidade import gerar_inicios_livres, meia_noite
+from agendamento.massa import Desfazer, popular_massa
+from setup.metricas import ContadorConsultas
+
+# Sem o manifest do collectstatic a tag {% static %} falharia fora do deploy
+STORAGES_BENCH = {
+    'default': settings.STORAGES['default'],
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0
+    indice = min(len(valores_ordenados) - 1, int(round(p / 100 * (len(valores_ordenados) - 1))))
+    return valores_ordenados[indice]
+
+
+class Command(BaseCommand):
+    help = (
+        'Suite de benchmark das views principais sobre uma massa grande de dados. '
+        'A massa é criada numa transação desfeita no fim; o resultado (latência e consultas '
+        'por view) vai para um JSON que pode ser comparado com uma rodada anterior.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profissionais', type=int, default=20)
+        parser.add_argument('--clientes', type=int, default=2000)
+        parser.add_argument('--meses', type=int, default=12, help='Meses de histórico')
+        parser.add_argument('--densidade', type=float, default=0.6, help='Chance de cada horário livre estar ocupado (0 a 1)')
+        parser.add_argument('--repeticoes', type=int, default=30, help='Requisições medidas por cenário')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--saida', default='bench_views.json', help='Arquivo JSON do resultado')
+        parser.add_argument('--comparar', help='JSON de uma rodada anterior para mostrar a diferença')
+
+    def handle(self, *args, **options):
+        anterior = self._carregar(options['comparar']) if options['comparar'] else None
+
+        with override_settings(STORAGES=STORAGES_BENCH, ALLOWED_HOSTS=['*']):
+            try:
+                with transaction.atomic():
+                    inicio = cronometro.perf_counter()
+                    massa = popular_massa(
+                        profissionais=options['profissionais'], clientes=options['clientes'],
+                        meses_passados=options['meses'], densidade=options['densidade'],
+                        seed=options['seed'], prefixo=f"bench{options['seed']}", saida=self.stdout.write,
+                    )
+                    self.stdout.write(f'Massa criada em {cronometro.perf_counter() - inicio:.1f}s')
+                    cenarios = self._rodar(massa, options['repeticoes'])
+                    raise Desfazer
+            except Desfazer:
+                pass
+
+        resultado = {
+            'meta': {
+                'quando': timezone.now().isoformat(),
+                'commit': self._commit(),
+                'banco': connection.vendor,
+                'python': platform.python_version(),
+                'parametros': {k: options[k] for k in ('profissionais', 'clientes', 'meses', 'densidade', 'repeticoes', 'seed')},
+                'linhas': {'agendamentos': massa['agendamentos'], 'notificacoes': massa['notificacoes']},
+            },
+            'cenarios': cenarios,
+        }
+        with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+
+        self._relatorio(cenarios, anterior)
+        self.stdout.write(self.style.SUCCESS(f"Resultado salvo em {options['saida']}"))
+
+    # --- Cenários -----------------------------------------------------------
+
+    def _rodar(self, massa, repeticoes):
+        profissional = massa['profissionais'][0]
+        servico = massa['servicos'][profissional.id][0]
+        cliente = massa['clientes'][0]
+        hoje = timezone.localdate()
+
+        anonimo = Client()
+        como_profissional = Client()
+        como_profissional.force_login(profissional)
+        como_cliente = Client()
+        como_cliente.force_login(cliente)
+
+        def dias_uteis(a_partir, quantidade):
+            dias = []
+            dia = a_partir
+            while len(dias) < quantidade:
+                if dia.weekday() != 6:
+                    dias.append(dia)
+                dia += timedelta(days=1)
+            return dias
+
+        # Datas das consultas de disponibilidade: as primeiras repetições pegam o cache frio
+        datas_consulta = dias_uteis(hoje + timedelta(days=1), 28)
+        # Reservas novas bem depois da massa (sem conflito), dentro do expediente do profissional
+        horarios_reserva = [
+            meia_noite(dia) + timedelta(minutes=inicio)
+            for dia in dias_uteis(hoje + timedelta(days=200), repeticoes)
+            for inicio in gerar_inicios_livres(
+                massa['horarios'][profissional.id][dia.weekday()], dia, servico.duracao_minutos, agora=False, passo=60
+            )
+        ]
+
+        def dashboard(dias):
+            inicio = (hoje - timedelta(days=dias)).isoformat()
+            return lambda i: como_profissional.get(reverse('listar_agendamentos'), {'data_inicio': inicio, 'data_fim': hoje.isoformat()})
+
+        cenarios = {
+            'home': lambda i: anonimo.get(reverse('home')),
+            'horarios_disponiveis': lambda i: anonimo.get(reverse('api_horarios_disponiveis'), {
+                'profissional_id': profissional.id, 'servico_id': servico.id,
+                'data': datas_consulta[i % len(datas_consulta)].isoformat(),
+            }),
+            'novo_agendamento_post': lambda i: como_cliente.post(reverse('novo_agendamento'), {
+                'profissional': profissional.id, 'servico': servico.id,
+                'data_hora_inicio': timezone.localtime(horarios_reserva[i]).strftime('%Y-%m-%d %H:%M'),
+            }),
+            'dashboard_dia': dashboard(0),
+            'dashboard_semana': dashboard(7),
+            'dashboard_mes': dashboard(30),
+            'listar_agendamentos_cliente': lambda i: como_cliente.get(reverse('listar_agendamentos')),
+            'listar_notificacoes': lambda i: como_cliente.get(reverse('listar_notificacoes')),
+        }
+
+        resultados = {}
+        for nome, requisicao in cenarios.items():
+            resultados[nome] = self._medir(requisicao, repeticoes)
+            medicao = resultados[nome]
+            self.stdout.write(
+                f"{nome:<28} p50 {medicao['p50_ms']:>8.2f}ms | p95 {medicao['p95_ms']:>8.2f}ms | "
+                f"consultas {medicao['consultas_min']}-{medicao['consultas_max']} | status {medicao['status']}"
+            )
+        return resultados
+
+    def _medir(self, requisicao, repeticoes):
+        # Cada cenário começa com o cache vazio; a primeira requisição é reportada à parte
+        cache.clear()
+        tempos, consultas, status = [], [], Counter()
+        for i in range(repeticoes):
+            contador = ContadorConsultas()
+            contador.instalar()
+            inicio = cronometro.perf_counter()
+            try:
+                resposta = requisicao(i)
+            finally:
+                contador.remover()
+            tempos.append(cronometro.perf_counter() - inicio)
+            consultas.append(contador.quantidade)
+            status[resposta.status_code] += 1
+
+        ordenados = sorted(tempos)
+        return {
+            'repeticoes': repeticoes,
+            'primeira_ms': round(tempos[0] * 1000, 2),
+            'primeira_consultas': consultas[0],
+            'p50_ms': round(percentil(ordenados, 50) * 1000, 2),
+            'p95_ms': round(percentil(ordenados, 95) * 1000, 2),
+            'max_ms': round(ordenados[-1] * 1000, 2),
+            'media_ms': round(sum(tempos) / len(tempos) * 1000, 2),
+            'consultas_min': min(consultas),
+            'consultas_max': max(consultas),
+            'status': {str(codigo): quantidade for codigo, quantidade in status.items()},
+        }
+
+    # --- Relatório ----------------------------------------------------------
+
+    def _relatorio(self, cenarios, anterior):
+        if not anterior:
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING('Comparação com a rodada anterior (p50 e consultas):'))
+        for nome, atual in cenarios.items():
+            antes = anterior.get('cenarios', {}).get(nome)
+            if not antes:
+                continue
+            variacao = (atual['p50_ms'] - antes['p50_ms']) / antes['p50_ms'] * 100 if antes['p50_ms'] else 0
+            estilo = self.style.ERROR if variacao > 20 or atual['consultas_max'] > antes['consultas_max'] else self.style.SUCCESS
+            self.stdout.write(estilo(
+                f"{nome:<28} {antes['p50_ms']:>8.2f} -> {atual['p50_ms']:>8.2f}ms ({variacao:+.0f}%) | "
+                f"consultas {antes['consultas_max']} -> {atual['consultas_max']}"
+            ))
+
+    def _carregar(self, caminho):
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError) as erro:
+            raise CommandError(f'Não foi possível ler {caminho}: {erro}')
+
+    def _commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,42 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from agendamento.models import Portfolio
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Gera as miniaturas/WebP das fotos de portfólio e avatares que ainda não têm (mídia antiga)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=100, help='Quantas fotos buscar por vez')
+        parser.add_argument('--todas', action='store_true', help='Regera também as que já têm variações')
+
+    def handle(self, *args, **options):
+        fotos = Portfolio.objects.exclude(imagem='')
+        usuarios = User.objects.exclude(foto='').exclude(foto__isnull=True)
+        if not options['todas']:
+            fotos = fotos.filter(variantes={})
+            usuarios = usuarios.filter(foto_variantes={})
+
+        # iterator() não carrega a tabela inteira na memória
+        total_fotos = self._processar(
+            fotos.order_by('id').iterator(chunk_size=options['lote']), lambda foto: foto.gerar_miniaturas()
+        )
+        total_usuarios = self._processar(
+            usuarios.order_by('id').iterator(chunk_size=options['lote']), lambda usuario: usuario.gerar_miniaturas_foto()
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{total_fotos} fotos de portfólio e {total_usuarios} avatares processados.'
+        ))
+
+    def _processar(self, objetos, gerar):
+        total = 0
+        for objeto in objetos:
+            gerar(objeto)
+            total += 1
+            if total % 100 == 0:
+                self.stdout.write(f'{total} processados...')
+        return total
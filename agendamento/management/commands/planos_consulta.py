@@ -0,0 +1,158 @@
+import json
+import random
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from agendamento.disponibilidade import STATUS_OCUPAM_AGENDA, meia_noite
+from agendamento.massa import Desfazer
+from agendamento.models import Agendamento, Servico
+from notificacoes.models import Notificacao
+
+User = get_user_model()
+
+# Índices compostos criados nas migrações 0004 e 0006 (agendamento) e 0002 (notificacoes)
+INDICES = [
+    'agend_prof_inicio_status_idx', 'agend_cliente_inicio_idx', 'agend_cliente_status_ini_idx', 'notif_dest_lida_idx',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Popula uma massa grande de dados (dentro de uma transação que é desfeita no fim) '
+        'e registra os planos de execução das consultas quentes antes e depois dos índices '
+        'e da troca de filtros __date por intervalos de datetime.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profissionais', type=int, default=20)
+        parser.add_argument('--clientes', type=int, default=2000)
+        parser.add_argument('--agendamentos', type=int, default=200000)
+        parser.add_argument('--notificacoes', type=int, default=100000)
+        parser.add_argument('--saida', help='Arquivo JSON onde salvar os planos')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        resultado = {}
+        try:
+            with transaction.atomic():
+                profissional, cliente = self._popular(options)
+                consultas = self._consultas(profissional, cliente)
+
+                resultado['depois'] = {nome: self._explicar(novo, 'depois') for nome, (antigo, novo) in consultas.items()}
+
+                # Remove os índices dentro da transação para ver como era antes
+                with connection.cursor() as cursor:
+                    for indice in INDICES:
+                        cursor.execute(f'DROP INDEX {connection.ops.quote_name(indice)}')
+                resultado['antes'] = {nome: self._explicar(antigo, 'antes') for nome, (antigo, novo) in consultas.items()}
+
+                raise Desfazer
+        except Desfazer:
+            pass
+
+        for nome in resultado['depois']:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {nome} =='))
+            self.stdout.write('ANTES:')
+            self.stdout.write(resultado['antes'][nome])
+            self.stdout.write('DEPOIS:')
+            self.stdout.write(resultado['depois'][nome])
+            self.stdout.write('')
+
+        if options['saida']:
+            resultado['banco'] = connection.vendor
+            resultado['parametros'] = {k: options[k] for k in ('profissionais', 'clientes', 'agendamentos', 'notificacoes', 'seed')}
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Planos salvos em {options['saida']}"))
+
+    def _explicar(self, queryset, fase):
+        """
+        EXPLAIN da consulta. O comentário com a fase deixa o SQL diferente entre as
+        duas rodadas; sem isso o cache de statements do SQLite devolve o plano antigo.
+        """
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} /* {fase} */ {sql}', params)
+            return '\n'.join(' '.join(str(coluna) for coluna in linha) for linha in cursor.fetchall())
+
+    def _consultas(self, profissional, cliente):
+        """Pares (forma antiga, forma nova) de cada consulta quente."""
+        hoje = timezone.localdate()
+        inicio_mes = hoje.replace(day=1)
+        amanha = hoje + timedelta(days=1)
+
+        return {
+            'dashboard_periodo': (
+                Agendamento.objects.filter(profissional=profissional, data_hora_inicio__date__range=[inicio_mes, hoje]),
+                Agendamento.objects.filter(profissional=profissional, data_hora_inicio__gte=meia_noite(inicio_mes), data_hora_inicio__lt=meia_noite(amanha)),
+            ),
+            'dashboard_futura': (
+                Agendamento.objects.filter(profissional=profissional, data_hora_inicio__date__gt=hoje),
+                Agendamento.objects.filter(profissional=profissional, data_hora_inicio__gte=meia_noite(amanha)),
+            ),
+            'disponibilidade_dia': (
+                Agendamento.objects.filter(profissional=profissional, data_hora_inicio__date=amanha, status='AGENDADO'),
+                Agendamento.objects.filter(profissional=profissional, data_hora_inicio__lt=meia_noite(amanha + timedelta(days=1)),
+                                           data_hora_fim__gt=meia_noite(amanha), status__in=STATUS_OCUPAM_AGENDA),
+            ),
+            'historico_cliente': (
+                Agendamento.objects.filter(cliente=cliente).order_by('-data_hora_inicio'),
+                Agendamento.objects.filter(cliente=cliente).order_by('-data_hora_inicio'),
+            ),
+            # Filtro "cancelados" do histórico, paginado por (data_hora_inicio, id)
+            'historico_cliente_status': (
+                Agendamento.objects.filter(cliente=cliente, status='CANCELADO').order_by('-data_hora_inicio', '-id'),
+                Agendamento.objects.filter(cliente=cliente, status='CANCELADO').order_by('-data_hora_inicio', '-id'),
+            ),
+            # Sem ordenação, como no .count() do sininho e no .update() de "marcar como lidas"
+            'notificacoes_nao_lidas': (
+                Notificacao.objects.filter(destinatario=cliente, lida=False).order_by(),
+                Notificacao.objects.filter(destinatario=cliente, lida=False).order_by(),
+            ),
+        }
+
+    def _popular(self, options):
+        self.stdout.write('Populando massa de dados temporária...')
+        sufixo = self.rng.randrange(10**9)
+        profissionais = User.objects.bulk_create([
+            User(username=f'plano_prof_{sufixo}_{i}', tipo='CABELEIREIRO') for i in range(options['profissionais'])
+        ])
+        clientes = User.objects.bulk_create([
+            User(username=f'plano_cli_{sufixo}_{i}', tipo='CLIENTE') for i in range(options['clientes'])
+        ])
+        servicos = Servico.objects.bulk_create([
+            Servico(profissional=p, nome='Corte', preco=50, duracao_minutos=30) for p in profissionais
+        ])
+
+        agora = timezone.now()
+        status = ['AGENDADO', 'CONCLUIDO', 'CONCLUIDO', 'CANCELADO', 'NAO_COMPARECEU']
+        lote = []
+        for _ in range(options['agendamentos']):
+            i = self.rng.randrange(len(profissionais))
+            inicio = agora + timedelta(minutes=30 * self.rng.randrange(-365 * 48, 90 * 48))
+            lote.append(Agendamento(
+                cliente=self.rng.choice(clientes), profissional=profissionais[i], servico=servicos[i],
+                data_hora_inicio=inicio, data_hora_fim=inicio + timedelta(minutes=30),
+                status=self.rng.choice(status),
+            ))
+            if len(lote) >= 5000:
+                Agendamento.objects.bulk_create(lote)
+                lote = []
+        Agendamento.objects.bulk_create(lote)
+
+        Notificacao.objects.bulk_create([
+            Notificacao(destinatario=self.rng.choice(clientes), mensagem='Teste', lida=self.rng.random() < 0.9)
+            for _ in range(options['notificacoes'])
+        ], batch_size=5000)
+
+        # Atualiza as estatísticas do planejador para a massa nova
+        if connection.vendor in ('postgresql', 'sqlite'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        return profissionais[0], clientes[0]
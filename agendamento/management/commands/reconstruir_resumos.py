@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from agendamento.models import ResumoDiario
+from agendamento.resumos import reconstruir_resumos
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o resumo diário (faturamento e ocupação) dos profissionais, em lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=50, help='Quantos profissionais por lote')
+        parser.add_argument('--desde', help='Data inicial (AAAA-MM-DD)')
+        parser.add_argument('--ate', help='Data final (AAAA-MM-DD)')
+        parser.add_argument('--se-vazio', action='store_true', help='Só reconstrói se a tabela de resumos estiver vazia (uso no deploy)')
+
+    def handle(self, *args, **options):
+        if options['se_vazio'] and ResumoDiario.objects.exists():
+            self.stdout.write(self.style.SUCCESS('Resumos já existem. Nenhuma ação necessária.'))
+            return
+
+        desde = self._data(options['desde'])
+        ate = self._data(options['ate'])
+
+        ids = list(User.objects.filter(tipo='CABELEIREIRO').order_by('id').values_list('id', flat=True))
+        total = 0
+        for i in range(0, len(ids), options['lote']):
+            lote = ids[i:i + options['lote']]
+            total += reconstruir_resumos(lote, desde, ate)
+            self.stdout.write(f'Lote {i // options["lote"] + 1}: {len(lote)} profissionais processados')
+
+        self.stdout.write(self.style.SUCCESS(f'{total} resumos diários gerados.'))
+
+    def _data(self, valor):
+        if not valor:
+            return None
+        try:
+            return datetime.strptime(valor, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Data inválida: {valor} (use AAAA-MM-DD)')
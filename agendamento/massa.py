@@ -0,0 +1,213 @@
+"""
+Geração de massa de dados grande e reprodutível (benchmarks e testes de escala).
+
+Os agendamentos são realistas: respeitam o HorarioTrabalho de cada profissional
+(expediente, almoço e folga) e nunca se sobrepõem. A `densidade` é a chance de
+cada horário livre do dia virar um agendamento.
+
+Tudo é inserido com bulk_create em lotes, a partir de geradores. Assim a memória
+fica constante mesmo com milhões de linhas. Como os signals não rodam, os
+horários de trabalho são criados aqui e os resumos diários são reconstruídos no
+fim. Com a mesma `seed` o conteúdo gerado é sempre o mesmo.
+"""
+import random
+from datetime import time, timedelta
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from notificacoes.models import Notificacao
+from .disponibilidade import meia_noite, minutos_do_horario
+from .models import Agendamento, HorarioTrabalho, Servico
+from .resumos import reconstruir_resumos
+
+User = get_user_model()
+
+LOTE = 5000
+PASSO_MINUTOS = 30
+
+SERVICOS_PADRAO = [
+    ('Corte', 50, 30),
+    ('Barba', 35, 30),
+    ('Escova', 60, 60),
+    ('Coloração', 150, 90),
+    ('Sobrancelha', 20, 15),
+]
+# Expedientes possíveis (início, fim); cada profissional sorteia um
+EXPEDIENTES = [(time(8, 0), time(17, 0)), (time(9, 0), time(18, 0)), (time(10, 0), time(19, 0)), (time(12, 0), time(21, 0))]
+STATUS_PASSADO = ['CONCLUIDO'] * 7 + ['CANCELADO', 'CANCELADO', 'NAO_COMPARECEU']
+STATUS_FUTURO = ['AGENDADO'] * 9 + ['CANCELADO']
+
+
+class Desfazer(Exception):
+    """Levantada dentro de transaction.atomic() para descartar a massa gerada."""
+
+
+def inserir_em_lotes(modelo, objetos, lote=LOTE):
+    """Consome um iterável de instâncias não salvas em bulk_create de `lote` em `lote`."""
+    total = 0
+    iterador = iter(objetos)
+    while True:
+        pedaco = list(islice(iterador, lote))
+        if not pedaco:
+            return total
+        modelo.objects.bulk_create(pedaco)
+        total += len(pedaco)
+
+
+def criar_profissionais(rng, quantidade, prefixo, lote=LOTE):
+    """Profissionais com expediente sorteado (domingo de folga) e o cardápio padrão de serviços."""
+    profissionais = User.objects.bulk_create([
+        User(username=f'{prefixo}_prof_{i}', first_name=f'Profissional {i}', tipo='CABELEIREIRO')
+        for i in range(quantidade)
+    ], batch_size=lote)
+
+    horarios = []
+    for prof in profissionais:
+        inicio, fim = rng.choice(EXPEDIENTES)
+        almoco = time(inicio.hour + 4, 0)
+        for dia in range(7):
+            horarios.append(HorarioTrabalho(
+                profissional=prof, dia_semana=dia, folga=(dia == 6),
+                hora_inicio=inicio, hora_fim=fim, almoco_inicio=almoco, almoco_fim=time(almoco.hour + 1, 0),
+            ))
+    HorarioTrabalho.objects.bulk_create(horarios, batch_size=lote)
+
+    servicos = Servico.objects.bulk_create([
+        Servico(profissional=prof, nome=nome, preco=preco, duracao_minutos=duracao)
+        for prof in profissionais for nome, preco, duracao in SERVICOS_PADRAO
+    ], batch_size=lote)
+
+    horarios_por_profissional = {}
+    for horario in horarios:
+        horarios_por_profissional.setdefault(horario.profissional_id, {})[horario.dia_semana] = horario
+    servicos_por_profissional = {}
+    for servico in servicos:
+        servicos_por_profissional.setdefault(servico.profissional_id, []).append(servico)
+    return profissionais, horarios_por_profissional, servicos_por_profissional
+
+
+def criar_clientes(quantidade, prefixo, lote=LOTE):
+    return User.objects.bulk_create((
+        User(username=f'{prefixo}_cli_{i}', first_name=f'Cliente {i}', telefone='(11) 90000-0000', tipo='CLIENTE')
+        for i in range(quantidade)
+    ), batch_size=lote)
+
+
+def agendamentos_do_dia(rng, horario, dia, servicos, clientes, densidade, passado):
+    """
+    Percorre o expediente do dia: em cada horário livre, com chance `densidade`,
+    marca um serviço que caiba antes do almoço/fim do expediente; senão pula um passo.
+    """
+    if horario.folga:
+        return
+    base = meia_noite(dia)
+    blocos = [(minutos_do_horario(horario.hora_inicio), minutos_do_horario(horario.hora_fim))]
+    if horario.almoco_inicio and horario.almoco_fim:
+        blocos = [
+            (blocos[0][0], minutos_do_horario(horario.almoco_inicio)),
+            (minutos_do_horario(horario.almoco_fim), blocos[0][1]),
+        ]
+
+    for abertura, fechamento in blocos:
+        cursor = abertura
+        while cursor + PASSO_MINUTOS <= fechamento:
+            servico = rng.choice(servicos)
+            if rng.random() < densidade and cursor + servico.duracao_minutos <= fechamento:
+                inicio = base + timedelta(minutes=cursor)
+                yield Agendamento(
+                    cliente=rng.choice(clientes), profissional_id=horario.profissional_id, servico=servico,
+                    data_hora_inicio=inicio, data_hora_fim=inicio + timedelta(minutes=servico.duracao_minutos),
+                    status=rng.choice(STATUS_PASSADO if passado else STATUS_FUTURO),
+                )
+                # Próximo início alinhado na grade de 30 em 30 minutos
+                cursor += -(-servico.duracao_minutos // PASSO_MINUTOS) * PASSO_MINUTOS
+            else:
+                cursor += PASSO_MINUTOS
+
+
+def gerar_agendamentos(rng, profissionais, horarios, servicos, clientes, primeiro_dia, ultimo_dia, densidade):
+    hoje = timezone.localdate()
+    dia = primeiro_dia
+    while dia <= ultimo_dia:
+        for prof in profissionais:
+            yield from agendamentos_do_dia(
+                rng, horarios[prof.id][dia.weekday()], dia, servicos[prof.id], clientes, densidade, dia < hoje
+            )
+        dia += timedelta(days=1)
+
+
+def gerar_notificacoes(rng, agendamentos, taxa, saida):
+    """
+    Repassa os agendamentos (para o bulk_create deles) e acumula, com chance `taxa`,
+    a notificação que o profissional teria recebido; cancelamentos avisam o cliente.
+    """
+    agora = timezone.now()
+    for agendamento in agendamentos:
+        yield agendamento
+        if rng.random() >= taxa:
+            continue
+        lida = agendamento.data_hora_inicio < agora
+        saida.append(Notificacao(
+            destinatario_id=agendamento.profissional_id, mensagem='Novo agendamento na sua agenda.',
+            link='/agendamento/meus-agendamentos/', lida=lida,
+        ))
+        if agendamento.status == 'CANCELADO':
+            saida.append(Notificacao(
+                destinatario_id=agendamento.cliente_id, mensagem='Seu agendamento foi cancelado.',
+                link='/agendamento/meus-agendamentos/', lida=lida,
+            ))
+
+
+def popular_massa(profissionais=20, clientes=2000, meses_passados=12, meses_futuros=3, densidade=0.6,
+                  notificacoes=1.0, seed=42, prefixo='massa', lote=LOTE, saida=None):
+    """
+    Cria profissionais (com horários e serviços), clientes, agendamentos entre
+    `meses_passados` atrás e `meses_futuros` à frente, e notificações (`notificacoes`
+    é a chance de cada agendamento gerar uma). Retorna as listas criadas e as contagens.
+    """
+    rng = random.Random(seed)
+    escrever = saida or (lambda mensagem: None)
+
+    escrever(f'Criando {profissionais} profissionais e {clientes} clientes...')
+    novos_profissionais, horarios, servicos = criar_profissionais(rng, profissionais, prefixo, lote)
+    novos_clientes = criar_clientes(clientes, prefixo, lote)
+
+    hoje = timezone.localdate()
+    primeiro_dia = hoje - timedelta(days=30 * meses_passados)
+    ultimo_dia = hoje + timedelta(days=30 * meses_futuros)
+    escrever(f'Gerando agendamentos de {primeiro_dia} a {ultimo_dia} (densidade {densidade:.0%})...')
+
+    # As notificações acompanham os agendamentos e são gravadas a cada lote
+    pendentes = []
+    agendamentos = gerar_notificacoes(
+        rng,
+        gerar_agendamentos(rng, novos_profissionais, horarios, servicos, novos_clientes, primeiro_dia, ultimo_dia, densidade),
+        notificacoes, pendentes,
+    )
+    total_agendamentos = 0
+    total_notificacoes = 0
+    while True:
+        pedaco = list(islice(agendamentos, lote))
+        if not pedaco:
+            break
+        Agendamento.objects.bulk_create(pedaco)
+        total_agendamentos += len(pedaco)
+        total_notificacoes += inserir_em_lotes(Notificacao, pendentes, lote)
+        pendentes.clear()
+        if total_agendamentos % (lote * 20) == 0:
+            escrever(f'  {total_agendamentos} agendamentos...')
+
+    escrever(f'{total_agendamentos} agendamentos e {total_notificacoes} notificações criados. Reconstruindo resumos diários...')
+    for i in range(0, len(novos_profissionais), 50):
+        reconstruir_resumos([prof.id for prof in novos_profissionais[i:i + 50]])
+
+    return {
+        'profissionais': novos_profissionais,
+        'clientes': novos_clientes,
+        'servicos': servicos,
+        'horarios': horarios,
+        'agendamentos': total_agendamentos,
+        'notificacoes': total_notificacoes,
+    }
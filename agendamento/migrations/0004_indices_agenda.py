@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agendamento', '0003_trava_agenda'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['profissional', 'data_hora_inicio', 'status'], name='agend_prof_inicio_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['cliente', 'data_hora_inicio'], name='agend_cliente_inicio_idx'),
+        ),
+    ]
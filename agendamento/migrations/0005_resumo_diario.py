@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agendamento', '0004_indices_agenda'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('faturamento', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_agendamentos', models.PositiveIntegerField(default=0)),
+                ('concluidos', models.PositiveIntegerField(default=0)),
+                ('cancelados', models.PositiveIntegerField(default=0)),
+                ('nao_compareceu', models.PositiveIntegerField(default=0)),
+                ('minutos_agendados', models.PositiveIntegerField(default=0, help_text='Minutos ocupados (agendados + concluídos)')),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('profissional', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos_diarios', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['data'],
+                'unique_together': {('profissional', 'data')},
+            },
+        ),
+    ]
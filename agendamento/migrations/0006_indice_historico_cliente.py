@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agendamento', '0005_resumo_diario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['cliente', 'status', 'data_hora_inicio'], name='agend_cliente_status_ini_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agendamento', '0006_indice_historico_cliente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agendamento',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
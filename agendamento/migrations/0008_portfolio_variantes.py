@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agendamento', '0007_atualizado_em'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portfolio',
+            name='variantes',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
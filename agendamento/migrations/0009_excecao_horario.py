@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agendamento', '0008_portfolio_variantes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExcecaoHorario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_inicio', models.DateField()),
+                ('data_fim', models.DateField(help_text='Último dia da exceção (inclusive)')),
+                ('fechado', models.BooleanField(default=True)),
+                ('hora_inicio', models.TimeField(blank=True, null=True)),
+                ('hora_fim', models.TimeField(blank=True, null=True)),
+                ('almoco_inicio', models.TimeField(blank=True, null=True)),
+                ('almoco_fim', models.TimeField(blank=True, null=True)),
+                ('motivo', models.CharField(blank=True, max_length=100)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('profissional', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='excecoes_horario', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['data_inicio'],
+                'indexes': [models.Index(fields=['profissional', 'data_fim'], name='excecao_prof_fim_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agendamento', '0009_excecao_horario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SerieAgendamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('intervalo_semanas', models.PositiveSmallIntegerField(choices=[(1, 'Toda semana'), (2, 'A cada 2 semanas'), (4, 'A cada 4 semanas')], default=1)),
+                ('ocorrencias', models.PositiveSmallIntegerField(help_text='Quantas datas foram pedidas')),
+                ('primeira_data', models.DateTimeField()),
+                ('ativa', models.BooleanField(default=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series_cliente', to=settings.AUTH_USER_MODEL)),
+                ('profissional', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series_profissional', to=settings.AUTH_USER_MODEL)),
+                ('servico', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='agendamento.servico')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='agendamento',
+            name='serie',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='agendamentos', to='agendamento.serieagendamento'),
+        ),
+    ]
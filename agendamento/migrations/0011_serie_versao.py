@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agendamento', '0010_serie_agendamento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='serieagendamento',
+            name='versao',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def criar_travas(apps, schema_editor):
+    # Profissionais que já existiam não passaram pelo signal que cria a trava
+    User = apps.get_model('users', 'User')
+    TravaAgenda = apps.get_model('agendamento', 'TravaAgenda')
+    sem_trava = User.objects.filter(tipo='CABELEIREIRO', trava_agenda__isnull=True).values_list('id', flat=True)
+    TravaAgenda.objects.bulk_create(
+        [TravaAgenda(profissional_id=profissional_id) for profissional_id in sem_trava],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agendamento', '0011_serie_versao'),
+        ('users', '0002_foto_variantes'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_travas, migrations.RunPython.noop),
+    ]
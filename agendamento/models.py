@@ -3,6 +3,8 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from datetime import timedelta
 from django.utils import timezone
+from setup.imagens import LARGURAS_PORTFOLIO, ImagemResponsiva, gerar_variantes
+from .disponibilidade import STATUS_OCUPAM_AGENDA, mensagem_conflito, mensagem_sem_agenda, validar_expediente
 
 class Servico(models.Model):
     # Adicionamos o vínculo com o profissional
@@ -15,15 +17,32 @@ class Servico(models.Model):
 
     def __str__(self):
         return f"{self.nome} ({self.duracao_minutos} min) - {self.profissional.first_name}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Preço e duração entram no resumo diário: se mudarem, ele é reconstruído
+        instance._valores_resumo = (instance.__dict__.get('preco'), instance.__dict__.get('duracao_minutos'))
+        return instance
     
 class Portfolio(models.Model):
     profissional = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='portfolio')
     imagem = models.ImageField(upload_to='portfolio/')
+    # Caminhos das versões reduzidas (ver setup/imagens.py)
+    variantes = models.JSONField(default=dict, blank=True)
     descricao = models.CharField(max_length=200, blank=True)
     criado_em = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Foto de {self.profissional}"
+
+    @property
+    def miniaturas(self):
+        return ImagemResponsiva(self.imagem, self.variantes)
+
+    def gerar_miniaturas(self):
+        self.variantes = gerar_variantes(self.imagem, LARGURAS_PORTFOLIO)
+        self.save(update_fields=['variantes'])
     
 class HorarioTrabalho(models.Model):
     DIAS_SEMANA = (
@@ -55,6 +74,88 @@ class HorarioTrabalho(models.Model):
     def __str__(self):
         return f"{self.get_dia_semana_display()} - {self.profissional}"
 
+
+class ExcecaoHorario(models.Model):
+    """
+    Exceção à regra semanal num intervalo de datas (feriado, férias, horário estendido).
+    Fechado: o profissional não atende no período. Senão, vale o horário informado
+    no lugar do HorarioTrabalho daqueles dias. Quem junta as duas coisas é o
+    resolvedor de expediente (agendamento/expediente.py).
+    """
+    profissional = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='excecoes_horario')
+    data_inicio = models.DateField()
+    data_fim = models.DateField(help_text="Último dia da exceção (inclusive)")
+    fechado = models.BooleanField(default=True)
+
+    hora_inicio = models.TimeField(blank=True, null=True)
+    hora_fim = models.TimeField(blank=True, null=True)
+    almoco_inicio = models.TimeField(blank=True, null=True)
+    almoco_fim = models.TimeField(blank=True, null=True)
+
+    motivo = models.CharField(max_length=100, blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['data_inicio']
+        indexes = [
+            models.Index(fields=['profissional', 'data_fim'], name='excecao_prof_fim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.profissional} - {self.data_inicio} a {self.data_fim}"
+
+    def clean(self):
+        if self.data_inicio and self.data_fim and self.data_fim < self.data_inicio:
+            raise ValidationError("A data final não pode ser anterior à inicial.")
+
+        if not self.fechado:
+            if not self.hora_inicio or not self.hora_fim:
+                raise ValidationError("Informe o horário de entrada e saída (ou marque como fechado).")
+            if self.hora_fim <= self.hora_inicio:
+                raise ValidationError("A saída precisa ser depois da entrada.")
+            if bool(self.almoco_inicio) != bool(self.almoco_fim):
+                raise ValidationError("Informe o início e o fim do almoço, ou deixe os dois em branco.")
+            if self.almoco_inicio and not (self.hora_inicio <= self.almoco_inicio < self.almoco_fim <= self.hora_fim):
+                raise ValidationError("O almoço precisa ficar dentro do expediente.")
+
+        # Períodos sobrepostos deixariam a regra do dia ambígua para o profissional
+        if self.profissional_id and self.data_inicio and self.data_fim:
+            sobrepostas = ExcecaoHorario.objects.filter(
+                profissional_id=self.profissional_id,
+                data_inicio__lte=self.data_fim,
+                data_fim__gte=self.data_inicio,
+            ).exclude(pk=self.pk)
+            if sobrepostas.exists():
+                raise ValidationError("Já existe uma exceção cadastrada que cruza este período.")
+
+
+class SerieAgendamento(models.Model):
+    """
+    Agendamentos recorrentes do mesmo cliente com o mesmo profissional e serviço
+    (toda semana, a cada 2 semanas...). As ocorrências são Agendamentos comuns
+    ligados pela FK `serie`; criar, remarcar e cancelar a série toda fica em
+    agendamento/series.py.
+    """
+    INTERVALOS = (
+        (1, 'Toda semana'),
+        (2, 'A cada 2 semanas'),
+        (4, 'A cada 4 semanas'),
+    )
+
+    cliente = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='series_cliente')
+    profissional = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='series_profissional')
+    servico = models.ForeignKey(Servico, on_delete=models.SET_NULL, null=True)
+    intervalo_semanas = models.PositiveSmallIntegerField(choices=INTERVALOS, default=1)
+    ocorrencias = models.PositiveSmallIntegerField(help_text="Quantas datas foram pedidas")
+    primeira_data = models.DateTimeField()
+    ativa = models.BooleanField(default=True)
+    # Sobe a cada remarcação que muda algo; entra na chave do aviso de alteração
+    versao = models.PositiveIntegerField(default=0)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.cliente} - {self.servico} ({self.get_intervalo_semanas_display().lower()})"
+
 class Agendamento(models.Model):
     STATUS_CHOICES = (
         ('AGENDADO', 'Agendado'),
@@ -67,6 +168,8 @@ class Agendamento(models.Model):
     cliente = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='agendamentos_cliente')
     profissional = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='agendamentos_profissional')
     servico = models.ForeignKey(Servico, on_delete=models.SET_NULL, null=True)
+    # Preenchido quando o agendamento é uma ocorrência de uma série recorrente
+    serie = models.ForeignKey(SerieAgendamento, on_delete=models.SET_NULL, null=True, blank=True, related_name='agendamentos')
     
     data_hora_inicio = models.DateTimeField()
     data_hora_fim = models.DateTimeField(editable=False, blank=True, null=True) 
@@ -74,9 +177,19 @@ class Agendamento(models.Model):
     
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='AGENDADO')
     criado_em = models.DateTimeField(auto_now_add=True)
+    # Usado no Last-Modified do prontuário (api_historico_cliente)
+    atualizado_em = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-data_hora_inicio']
+        indexes = [
+            # Agenda do profissional por período (disponibilidade, dashboard, conflitos)
+            models.Index(fields=['profissional', 'data_hora_inicio', 'status'], name='agend_prof_inicio_status_idx'),
+            # Histórico do cliente
+            models.Index(fields=['cliente', 'data_hora_inicio'], name='agend_cliente_inicio_idx'),
+            # Histórico do cliente filtrado por status (próximos / cancelados)
+            models.Index(fields=['cliente', 'status', 'data_hora_inicio'], name='agend_cliente_status_ini_idx'),
+        ]
     
     def __str__(self):
         return f"{self.cliente} - {self.servico} - {self.data_hora_inicio}"
@@ -98,41 +211,18 @@ class Agendamento(models.Model):
             return
 
         # --- NOVA VALIDAÇÃO: HORÁRIO DE TRABALHO ---
-        # 1. Descobre qual é o dia da semana da data escolhida (0=Seg, 6=Dom)
-        dia_semana_agendado = self.data_hora_inicio.weekday()
-        
-        try:
-            horario = HorarioTrabalho.objects.get(
-                profissional=self.profissional, 
-                dia_semana=dia_semana_agendado
-            )
-        except HorarioTrabalho.DoesNotExist:
+        # 1. Regra efetiva da data escolhida: a semanal ou uma exceção (feriado, férias...)
+        # Usamos a hora local: vindo do banco, o datetime está em UTC
+        # (import aqui dentro: expediente.py importa este módulo)
+        from .expediente import regra_do_dia
+        inicio_local = timezone.localtime(self.data_hora_inicio)
+        horario = regra_do_dia(self.profissional_id, inicio_local.date())
+        if horario is None:
             # Se o profissional não configurou horário, assumimos que não trabalha
-            raise ValidationError(f"O profissional não configurou agenda para {self.data_hora_inicio.strftime('%A')}.")
-
-        # 2. Verifica se é Folga
-        if horario.folga:
-            raise ValidationError("O profissional não trabalha neste dia.")
-
-        # 3. Verifica se está dentro do horário comercial
-        # Convertemos datetime para time para comparar apenas as horas
-        hora_inicio_agendamento = self.data_hora_inicio.time()
-        hora_fim_agendamento = self.data_hora_fim.time()
+            raise ValidationError(mensagem_sem_agenda(inicio_local))
 
-        if hora_inicio_agendamento < horario.hora_inicio or hora_fim_agendamento > horario.hora_fim:
-            raise ValidationError(f"Fora do horário de expediente ({horario.hora_inicio.strftime('%H:%M')} às {horario.hora_fim.strftime('%H:%M')}).")
-
-        # 4. Verifica intervalo de almoço (Se houver almoço configurado)
-        if horario.almoco_inicio and horario.almoco_fim:
-            # Se o corte começa DENTRO do almoço OU termina DENTRO do almoço
-            comeca_no_almoco = horario.almoco_inicio <= hora_inicio_agendamento < horario.almoco_fim
-            termina_no_almoco = horario.almoco_inicio < hora_fim_agendamento <= horario.almoco_fim
-            
-            # Ou se o corte "engole" o almoço inteiro (começa antes e termina depois)
-            engole_almoco = hora_inicio_agendamento <= horario.almoco_inicio and hora_fim_agendamento >= horario.almoco_fim
-
-            if comeca_no_almoco or termina_no_almoco or engole_almoco:
-                raise ValidationError(f"Horário coincide com o intervalo de almoço ({horario.almoco_inicio.strftime('%H:%M')} às {horario.almoco_fim.strftime('%H:%M')}).")
+        # 2, 3 e 4. Folga, horário comercial e almoço (mesma regra usada na geração de slots)
+        validar_expediente(horario, self.data_hora_inicio, self.data_hora_fim)
 
         # --- FIM DA NOVA VALIDAÇÃO ---
 
@@ -141,11 +231,22 @@ class Agendamento(models.Model):
             profissional=self.profissional,
             data_hora_inicio__lt=self.data_hora_fim,
             data_hora_fim__gt=self.data_hora_inicio,
-            status__in=['AGENDADO', 'CONCLUIDO']
+            status__in=STATUS_OCUPAM_AGENDA
         ).exclude(pk=self.pk)
 
         if conflitos.exists():
-            raise ValidationError(f"O profissional {self.profissional} já tem um agendamento neste horário.")
+            raise ValidationError(mensagem_conflito(self.profissional))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Guarda de onde o agendamento veio: se mudar de dia/profissional,
+        # o resumo diário antigo também precisa ser recalculado
+        instance._dia_original = (
+            instance.__dict__.get('profissional_id'),
+            instance.__dict__.get('data_hora_inicio'),
+        )
+        return instance
 
     def save(self, *args, **kwargs):
         # Garante o cálculo ao salvar também
@@ -163,4 +264,45 @@ class Agendamento(models.Model):
         if self.data_hora_inicio > agora:
             diferenca = self.data_hora_inicio - agora
             return diferenca > timedelta(hours=2)
-        return False
\ No newline at end of file
+        return False
+
+class TravaAgenda(models.Model):
+    """
+    Uma linha por profissional, usada só como trava para serializar reservas.
+    Quem vai marcar horário atualiza esta linha primeiro; enquanto a transação não
+    termina, outra reserva do mesmo profissional espera (row lock no PostgreSQL,
+    trava de escrita no SQLite). Reservas de profissionais diferentes não se bloqueiam.
+    """
+    profissional = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='trava_agenda')
+    versao = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Trava da agenda de {self.profissional_id}"
+
+
+class ResumoDiario(models.Model):
+    """
+    Totais do dia por profissional, para o dashboard não precisar somar os
+    agendamentos brutos em períodos longos (mês, ano).
+    Mantido pelos signals do Agendamento (recalcula só o dia afetado) e do
+    Servico (reconstrói os dias em que ele aparece quando o preço/duração muda
+    ou o serviço é apagado), e reconstruído em lote pelo comando `reconstruir_resumos`.
+    """
+    profissional = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='resumos_diarios')
+    data = models.DateField()
+
+    faturamento = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_agendamentos = models.PositiveIntegerField(default=0)
+    concluidos = models.PositiveIntegerField(default=0)
+    cancelados = models.PositiveIntegerField(default=0)
+    nao_compareceu = models.PositiveIntegerField(default=0)
+    minutos_agendados = models.PositiveIntegerField(default=0, help_text="Minutos ocupados (agendados + concluídos)")
+
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('profissional', 'data')
+        ordering = ['data']
+
+    def __str__(self):
+        return f"{self.profissional} - {self.data}"
@@ -0,0 +1,71 @@
+"""
+Paginação por chave (keyset) sobre (data_hora_inicio, id).
+
+Em vez de OFFSET (que fica mais lento a cada página, porque o banco precisa
+pular todas as linhas anteriores), cada página continua a partir do último item
+visto. Com um índice que termina em data_hora_inicio o custo de cada página é o
+mesmo, não importa o tamanho do histórico.
+
+O cursor é opaco para o front: base64 de "<datetime iso>|<id>".
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+TAMANHO_PAGINA = 20
+TAMANHO_MAXIMO_PAGINA = 100
+
+
+def codificar_cursor(momento, pk):
+    bruto = f'{momento.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """Levanta ValueError se o cursor estiver malformado."""
+    try:
+        preenchido = cursor + '=' * (-len(cursor) % 4)
+        momento, pk = base64.urlsafe_b64decode(preenchido.encode()).decode().split('|')
+        return datetime.fromisoformat(momento), int(pk)
+    except (TypeError, UnicodeDecodeError, binascii.Error) as erro:
+        raise ValueError('Cursor inválido') from erro
+
+
+def tamanho_pagina(valor, padrao=TAMANHO_PAGINA):
+    try:
+        return max(1, min(int(valor), TAMANHO_MAXIMO_PAGINA))
+    except (TypeError, ValueError):
+        return padrao
+
+
+def paginar_por_chave(queryset, cursor=None, tamanho=TAMANHO_PAGINA, campo='data_hora_inicio', decrescente=True):
+    """
+    Retorna (itens, proximo_cursor). `proximo_cursor` é None na última página.
+    O queryset não deve vir ordenado: a ordenação (campo, id) é aplicada aqui.
+    """
+    if decrescente:
+        queryset = queryset.order_by(f'-{campo}', '-id')
+    else:
+        queryset = queryset.order_by(campo, 'id')
+
+    if cursor:
+        momento, pk = decodificar_cursor(cursor)
+        if decrescente:
+            queryset = queryset.filter(Q(**{f'{campo}__lt': momento}) | Q(**{campo: momento, 'id__lt': pk}))
+        else:
+            queryset = queryset.filter(Q(**{f'{campo}__gt': momento}) | Q(**{campo: momento, 'id__gt': pk}))
+
+    # Busca um a mais só para saber se existe próxima página
+    itens = list(queryset[:tamanho + 1])
+    proximo_cursor = None
+    if len(itens) > tamanho:
+        itens = itens[:tamanho]
+        ultimo = itens[-1]
+        # Aceita tanto instâncias quanto dicionários de .values()
+        if isinstance(ultimo, dict):
+            proximo_cursor = codificar_cursor(ultimo[campo], ultimo['id'])
+        else:
+            proximo_cursor = codificar_cursor(getattr(ultimo, campo), ultimo.pk)
+    return itens, proximo_cursor
@@ -0,0 +1,85 @@
+"""
+Caminho transacional de reserva.
+
+O clean() do Agendamento confere conflitos com um `exists()`, mas entre essa
+consulta e o `save()` outro cliente pode marcar o mesmo horário. Aqui a
+validação e a gravação acontecem dentro da mesma transação, depois de travar
+a agenda do profissional (linha de TravaAgenda). Assim as reservas de um
+mesmo profissional ficam em fila e as de profissionais diferentes seguem em paralelo.
+
+No SQLite (desenvolvimento) o banco só tem uma trava de escrita global e, com
+várias threads no mesmo processo, a espera nem sempre acontece; por isso também
+usamos uma trava em memória, que não custa nada no PostgreSQL. São TRAVAS_LOCAIS
+travas fixas, escolhidas por `profissional_id % TRAVAS_LOCAIS`: a memória não
+cresce com o número de profissionais e, no pior caso, dois profissionais que
+caem na mesma trava esperam um pelo outro só no processo.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Agendamento, TravaAgenda
+
+TRAVAS_LOCAIS = 64
+
+_travas_locais = tuple(threading.Lock() for _ in range(TRAVAS_LOCAIS))
+
+
+@contextmanager
+def _trava_local(profissional_id):
+    # Nunca se pega a trava de dois profissionais ao mesmo tempo, então dividir
+    # a mesma trava não causa deadlock
+    with _travas_locais[profissional_id % TRAVAS_LOCAIS]:
+        yield
+
+
+def travar_agenda(profissional_id):
+    """
+    Trava a agenda do profissional até o fim da transação atual.
+    O UPDATE vem primeiro de propósito: no SQLite ele já pede a trava de escrita
+    (evitando o deadlock de "ler e depois escrever"), no PostgreSQL trava a linha.
+    """
+    atualizadas = TravaAgenda.objects.filter(profissional_id=profissional_id).update(versao=F('versao') + 1)
+    if not atualizadas:
+        # A linha é criada junto com o profissional (signals.criar_horario_padrao);
+        # isto só cobre quem ficou sem ela (ex.: usuário criado por bulk_create)
+        TravaAgenda.objects.get_or_create(profissional_id=profissional_id)
+        TravaAgenda.objects.filter(profissional_id=profissional_id).update(versao=F('versao') + 1)
+
+
+@contextmanager
+def agenda_travada(profissional_id):
+    """Transação com a agenda do profissional travada (reservas dele ficam em fila)."""
+    with _trava_local(profissional_id):
+        with transaction.atomic():
+            travar_agenda(profissional_id)
+            yield
+
+
+def reservar(agendamento, notificar=None):
+    """
+    Valida e grava um Agendamento sem risco de duplo agendamento.
+    Levanta ValidationError (mesmas mensagens do clean) se o horário não estiver livre.
+    `notificar(agendamento)`, se vier, roda na mesma transação logo depois do save:
+    o aviso na outbox só existe se a reserva for gravada, e vice-versa.
+    """
+    with agenda_travada(agendamento.profissional_id):
+        agendamento.full_clean()
+        agendamento.save()
+        if notificar:
+            notificar(agendamento)
+    return agendamento
+
+
+def criar_agendamento(cliente, profissional, servico, data_hora_inicio, notificar=None, **campos):
+    """Atalho para montar e reservar um Agendamento de uma vez."""
+    agendamento = Agendamento(
+        cliente=cliente,
+        profissional=profissional,
+        servico=servico,
+        data_hora_inicio=data_hora_inicio,
+        **campos
+    )
+    return reservar(agendamento, notificar=notificar)
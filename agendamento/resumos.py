@@ -0,0 +1,148 @@
+"""
+Resumo diário (rollup) de faturamento e ocupação por profissional.
+
+Os agendamentos continuam sendo a fonte da verdade; o ResumoDiario é só uma
+soma pré-calculada por (profissional, dia local). Cada mudança num agendamento
+recalcula apenas o(s) dia(s) afetado(s), o que é barato com o índice
+(profissional, data_hora_inicio, status).
+
+O faturamento e os minutos usam o preço e a duração atuais do serviço, igual à
+soma direta que o dashboard fazia. Por isso, quando um serviço muda de preço ou
+de duração, ou é apagado (os agendamentos ficam com servico=NULL por um UPDATE
+direto, sem signals), o signal do Servico reconstrói os dias em que ele aparece.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .disponibilidade import STATUS_OCUPAM_AGENDA, meia_noite
+from .models import Agendamento, ResumoDiario, TravaAgenda
+from .reservas import travar_agenda
+
+# A partir de quantos dias o dashboard lê os KPIs do resumo em vez dos agendamentos
+DIAS_MINIMOS_RESUMO = 7
+
+AGREGACOES = {
+    'faturamento': Sum('servico__preco', filter=Q(status='CONCLUIDO')),
+    'total_agendamentos': Count('id'),
+    'concluidos': Count('id', filter=Q(status='CONCLUIDO')),
+    'cancelados': Count('id', filter=Q(status='CANCELADO')),
+    'nao_compareceu': Count('id', filter=Q(status='NAO_COMPARECEU')),
+    'minutos_agendados': Sum('servico__duracao_minutos', filter=Q(status__in=STATUS_OCUPAM_AGENDA)),
+}
+
+
+def _normalizar(totais):
+    return {campo: totais.get(campo) or 0 for campo in AGREGACOES}
+
+
+def recalcular_dia(profissional_id, data):
+    """
+    Recalcula (ou apaga, se ficou vazio) o resumo de um profissional num dia.
+
+    A agenda do profissional é travada antes da soma e fica travada até o commit:
+    duas gravações concorrentes no mesmo dia recalculam uma depois da outra, e a
+    segunda já enxerga a mudança da primeira (senão a última a gravar venceria com
+    totais que não contam a outra).
+    """
+    with transaction.atomic():
+        travar_agenda(profissional_id)
+        totais = _normalizar(Agendamento.objects.filter(
+            profissional_id=profissional_id,
+            data_hora_inicio__gte=meia_noite(data),
+            data_hora_inicio__lt=meia_noite(data + timedelta(days=1)),
+        ).order_by().aggregate(**AGREGACOES))
+
+        if not totais['total_agendamentos']:
+            ResumoDiario.objects.filter(profissional_id=profissional_id, data=data).delete()
+            return None
+
+        resumo, _ = ResumoDiario.objects.update_or_create(
+            profissional_id=profissional_id, data=data, defaults=totais
+        )
+    return resumo
+
+
+def dias_afetados(agendamento):
+    """Pares (profissional_id, data local) que um agendamento salvo/apagado pode ter mudado."""
+    pares = set()
+    if agendamento.profissional_id and agendamento.data_hora_inicio:
+        pares.add((agendamento.profissional_id, timezone.localtime(agendamento.data_hora_inicio).date()))
+
+    profissional_id, inicio = getattr(agendamento, '_dia_original', (None, None))
+    if profissional_id and inicio:
+        pares.add((profissional_id, timezone.localtime(inicio).date()))
+    return pares
+
+
+def dias_do_servico(servico):
+    """
+    Dias locais em que o serviço entra no resumo (faturamento ou minutos ocupados).
+    Num pre_delete, ainda antes do SET_NULL, é o que o apagamento vai mudar.
+    """
+    return set(
+        Agendamento.objects.filter(servico=servico, status__in={'CONCLUIDO', *STATUS_OCUPAM_AGENDA})
+        .annotate(dia=TruncDate('data_hora_inicio'))
+        .order_by()
+        .values_list('dia', flat=True)
+        .distinct()
+    )
+
+
+def reconstruir_resumos(profissional_ids, desde=None, ate=None, dias=None):
+    """
+    Reconstrói os resumos de um lote de profissionais com uma única consulta agrupada
+    por (profissional, dia) e um bulk_create. `desde`/`ate` (datas) limitam o período;
+    `dias` (conjunto de datas) limita a esses dias.
+    """
+    agendamentos = Agendamento.objects.filter(profissional_id__in=profissional_ids)
+    resumos = ResumoDiario.objects.filter(profissional_id__in=profissional_ids)
+    if dias is not None:
+        if not dias:
+            return 0
+        # O intervalo deixa o banco usar o índice; o filtro por dia corta os buracos
+        desde, ate = max(desde or min(dias), min(dias)), min(ate or max(dias), max(dias))
+        agendamentos = agendamentos.alias(dia=TruncDate('data_hora_inicio')).filter(dia__in=dias)
+        resumos = resumos.filter(data__in=dias)
+    if desde:
+        agendamentos = agendamentos.filter(data_hora_inicio__gte=meia_noite(desde))
+        resumos = resumos.filter(data__gte=desde)
+    if ate:
+        agendamentos = agendamentos.filter(data_hora_inicio__lt=meia_noite(ate + timedelta(days=1)))
+        resumos = resumos.filter(data__lte=ate)
+
+    linhas = (
+        agendamentos
+        .annotate(dia=TruncDate('data_hora_inicio'))
+        .values('profissional_id', 'dia')
+        .order_by()
+        .annotate(**AGREGACOES)
+    )
+
+    with transaction.atomic():
+        # Mesma trava do recalcular_dia, antes de somar
+        TravaAgenda.objects.filter(profissional_id__in=profissional_ids).update(versao=F('versao') + 1)
+        novos = [
+            ResumoDiario(profissional_id=linha['profissional_id'], data=linha['dia'], **_normalizar(linha))
+            for linha in linhas
+        ]
+        resumos.delete()
+        ResumoDiario.objects.bulk_create(novos, batch_size=1000)
+    return len(novos)
+
+
+def kpis_do_resumo(profissional, data_inicio, data_fim):
+    """KPIs do dashboard lidos do resumo diário (custo proporcional a dias, não a agendamentos)."""
+    totais = ResumoDiario.objects.filter(
+        profissional=profissional,
+        data__gte=data_inicio,
+        data__lte=data_fim,
+    ).aggregate(
+        faturamento=Sum('faturamento'),
+        atendimentos_periodo=Sum('concluidos'),
+        total_agendados=Sum('total_agendamentos'),
+    )
+    return {campo: valor or 0 for campo, valor in totais.items()}
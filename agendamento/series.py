@@ -0,0 +1,154 @@
+"""
+Agendamentos recorrentes marcados como uma série.
+
+Em vez de N chamadas ao reservar() (cada uma com o seu clean()), a série inteira
+é validada de uma vez por validar_em_lote: uma consulta de conflitos cobrindo a
+janela da série, do primeiro ao último horário. As ocorrências livres são
+gravadas com um bulk_create, na mesma transação e com a agenda do profissional
+travada, como numa reserva avulsa.
+
+bulk_create, update e bulk_update não disparam os signals do Agendamento, então
+este módulo faz o que eles fariam: troca a versão do cache de disponibilidade e
+reconstrói os resumos diários da janela da série (uma consulta agrupada, em vez
+de um recálculo por dia). Assim o custo de gravar a série não cresce com N.
+"""
+from datetime import datetime, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import invalidar_agenda, invalidar_no_commit
+from .models import Agendamento, SerieAgendamento
+from .reservas import agenda_travada
+from .resumos import reconstruir_resumos
+from .validacao import validar_em_lote
+
+OCORRENCIAS_MINIMAS = 2
+OCORRENCIAS_MAXIMAS = 26
+
+
+class ConflitoSerie(ValidationError):
+    """Algumas datas da série não estão livres; `colisoes` traz (inicio, mensagem) de cada uma."""
+
+    def __init__(self, colisoes):
+        self.colisoes = colisoes
+        detalhes = "; ".join(
+            f"{timezone.localtime(inicio).strftime('%d/%m às %H:%M')}: {mensagem}" for inicio, mensagem in colisoes
+        )
+        super().__init__(f"{len(colisoes)} data(s) da série não estão livres. {detalhes}")
+
+
+def inicios_da_serie(inicio, ocorrencias, intervalo_semanas=1):
+    """Os `ocorrencias` inícios da série, mantendo a hora local (mesmo se o fuso mudar no meio)."""
+    local = timezone.localtime(inicio)
+    return [
+        timezone.make_aware(datetime.combine(local.date() + timedelta(weeks=intervalo_semanas * k), local.time()))
+        for k in range(ocorrencias)
+    ]
+
+
+def _depois_de_gravar(profissional_id, inicios):
+    """O que os signals fariam para cada agendamento: invalidar o cache e refazer os resumos."""
+    invalidar_no_commit(invalidar_agenda, profissional_id)
+    if inicios:
+        datas = [timezone.localtime(inicio).date() for inicio in inicios]
+        reconstruir_resumos([profissional_id], desde=min(datas), ate=max(datas))
+
+
+def criar_serie(cliente, profissional, servico, inicio, ocorrencias, intervalo_semanas=1, pular_ocupadas=False):
+    """
+    Cria a série e as suas ocorrências. Se alguma data não estiver livre, levanta
+    ConflitoSerie, ou, com `pular_ocupadas`, grava só as livres.
+    Devolve (serie, colisoes).
+    """
+    if not OCORRENCIAS_MINIMAS <= ocorrencias <= OCORRENCIAS_MAXIMAS:
+        raise ValidationError(f"Uma série tem de {OCORRENCIAS_MINIMAS} a {OCORRENCIAS_MAXIMAS} datas.")
+    if intervalo_semanas not in dict(SerieAgendamento.INTERVALOS):
+        raise ValidationError("Intervalo de repetição inválido.")
+
+    inicios = inicios_da_serie(inicio, ocorrencias, intervalo_semanas)
+    with agenda_travada(profissional.id):
+        vereditos = validar_em_lote([(profissional.id, servico.id, data) for data in inicios])
+        colisoes = [(data, veredito['erro']) for data, veredito in zip(inicios, vereditos) if not veredito['valido']]
+        if colisoes and (not pular_ocupadas or len(colisoes) == len(inicios)):
+            raise ConflitoSerie(colisoes)
+
+        serie = SerieAgendamento.objects.create(
+            cliente=cliente, profissional=profissional, servico=servico,
+            intervalo_semanas=intervalo_semanas, ocorrencias=ocorrencias, primeira_data=inicios[0],
+        )
+        livres = [(data, veredito['fim']) for data, veredito in zip(inicios, vereditos) if veredito['valido']]
+        Agendamento.objects.bulk_create([
+            Agendamento(
+                cliente=cliente, profissional=profissional, servico=servico, serie=serie,
+                data_hora_inicio=data, data_hora_fim=fim,
+            )
+            for data, fim in livres
+        ])
+        _depois_de_gravar(profissional.id, [data for data, _ in livres])
+    return serie, colisoes
+
+
+def _ocorrencias_futuras(serie, a_partir):
+    return serie.agendamentos.filter(status='AGENDADO', data_hora_inicio__gte=a_partir or timezone.now())
+
+
+def cancelar_serie(serie, a_partir=None):
+    """Cancela, num UPDATE só, as ocorrências ainda agendadas a partir de `a_partir` (padrão: agora)."""
+    with agenda_travada(serie.profissional_id):
+        ocorrencias = _ocorrencias_futuras(serie, a_partir)
+        inicios = list(ocorrencias.values_list('data_hora_inicio', flat=True))
+        canceladas = ocorrencias.update(status='CANCELADO', atualizado_em=timezone.now())
+        serie.ativa = False
+        serie.save(update_fields=['ativa'])
+        _depois_de_gravar(serie.profissional_id, inicios)
+    return canceladas
+
+
+def remarcar_serie(serie, nova_hora=None, servico=None, a_partir=None):
+    """
+    Muda o horário (mesma data, nova hora local) e/ou o serviço de todas as
+    ocorrências futuras. Tudo ou nada: se alguma não couber, levanta ConflitoSerie.
+    Devolve quantas ocorrências mudaram; `serie.versao` sobe se algo de fato mudou.
+    """
+    servico = servico or serie.servico
+    if servico is None:
+        raise ValidationError("Escolha um serviço para a série.")
+
+    with agenda_travada(serie.profissional_id):
+        ocorrencias = list(_ocorrencias_futuras(serie, a_partir).order_by('data_hora_inicio'))
+        if not ocorrencias:
+            return 0
+
+        antigos = [ocorrencia.data_hora_inicio for ocorrencia in ocorrencias]
+        novos = [
+            timezone.make_aware(datetime.combine(timezone.localtime(inicio).date(), nova_hora)) if nova_hora else inicio
+            for inicio in antigos
+        ]
+        # Cada ocorrência é validada ignorando a si mesma (ela está saindo do horário antigo)
+        vereditos = validar_em_lote([
+            (serie.profissional_id, servico.id, inicio, ocorrencia.pk) for ocorrencia, inicio in zip(ocorrencias, novos)
+        ])
+        colisoes = [(inicio, veredito['erro']) for inicio, veredito in zip(novos, vereditos) if not veredito['valido']]
+        if colisoes:
+            raise ConflitoSerie(colisoes)
+
+        # Reenviar o mesmo formulário não muda nada e mantém a versão (e a chave do aviso)
+        mudou = novos != antigos or any(ocorrencia.servico_id != servico.id for ocorrencia in ocorrencias)
+
+        agora = timezone.now()
+        for ocorrencia, inicio, veredito in zip(ocorrencias, novos, vereditos):
+            ocorrencia.data_hora_inicio = inicio
+            ocorrencia.data_hora_fim = veredito['fim']
+            ocorrencia.servico = servico
+            ocorrencia.atualizado_em = agora
+        Agendamento.objects.bulk_update(ocorrencias, ['data_hora_inicio', 'data_hora_fim', 'servico', 'atualizado_em'])
+
+        if mudou:
+            serie.servico = servico
+            serie.versao = F('versao') + 1
+            serie.save(update_fields=['servico', 'versao'])
+            serie.refresh_from_db(fields=['versao'])
+        _depois_de_gravar(serie.profissional_id, antigos + novos)
+    return len(ocorrencias)
@@ -1,10 +1,17 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from users.models import User
-from .models import HorarioTrabalho
+from users.vitrine import invalidar_cartao
+from .models import ExcecaoHorario, HorarioTrabalho, Agendamento, Portfolio, Servico, TravaAgenda
+from .cache import invalidar_agenda, invalidar_no_commit
+from .expediente import invalidar_expediente
+from .resumos import dias_afetados, dias_do_servico, recalcular_dia, reconstruir_resumos
 
 @receiver(post_save, sender=User)
-def criar_horario_padrao(sender, instance, created, **kwargs):
+def criar_horario_padrao(sender, instance, created, update_fields=None, **kwargs):
+    # O login só grava last_login: não vale uma consulta de horários a cada entrada
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
     # Se o usuário for criado ou atualizado e for CABELEIREIRO
     if instance.tipo == 'CABELEIREIRO':
         # Verifica se já tem horários. Se não tiver, cria os 7 dias.
@@ -16,4 +23,76 @@ def criar_horario_padrao(sender, instance, created, **kwargs):
                     profissional=instance,
                     dia_semana=dia,
                     folga=eh_folga
-                )
\ No newline at end of file
+                )
+            # A linha da trava já nasce com o profissional: a primeira reserva dele
+            # não paga o get_or_create dentro da transação
+            TravaAgenda.objects.get_or_create(profissional=instance)
+
+@receiver(post_save, sender=Agendamento)
+@receiver(post_delete, sender=Agendamento)
+@receiver(post_save, sender=HorarioTrabalho)
+@receiver(post_delete, sender=HorarioTrabalho)
+@receiver(post_save, sender=ExcecaoHorario)
+@receiver(post_delete, sender=ExcecaoHorario)
+def invalidar_cache_disponibilidade(sender, instance, **kwargs):
+    # Qualquer mudança na agenda ou na regra de trabalho derruba os slots em cache do profissional
+    invalidar_no_commit(invalidar_agenda, instance.profissional_id)
+
+
+@receiver(post_save, sender=HorarioTrabalho)
+@receiver(post_delete, sender=HorarioTrabalho)
+@receiver(post_save, sender=ExcecaoHorario)
+@receiver(post_delete, sender=ExcecaoHorario)
+def recompilar_expediente(sender, instance, **kwargs):
+    # A regra semanal ou uma exceção mudou: o expediente compilado é refeito na próxima leitura
+    invalidar_no_commit(invalidar_expediente, instance.profissional_id)
+
+
+@receiver(post_save, sender=Agendamento)
+@receiver(post_delete, sender=Agendamento)
+def atualizar_resumo_diario(sender, instance, **kwargs):
+    # Recalcula só o(s) dia(s) tocado(s) por este agendamento
+    for profissional_id, data in dias_afetados(instance):
+        recalcular_dia(profissional_id, data)
+    instance._dia_original = (instance.profissional_id, instance.data_hora_inicio)
+
+
+@receiver(pre_delete, sender=Servico)
+def guardar_dias_do_servico(sender, instance, **kwargs):
+    # Depois do delete os agendamentos já estão com servico=NULL: os dias são lidos antes
+    instance._dias_resumo = dias_do_servico(instance)
+
+
+@receiver(post_save, sender=Servico)
+@receiver(post_delete, sender=Servico)
+def reconstruir_resumo_do_servico(sender, instance, created=False, **kwargs):
+    # Serviço novo ainda não tem agendamentos; nome/descrição/ativo não entram no resumo
+    if created:
+        return
+    if kwargs['signal'] is post_save:
+        if getattr(instance, '_valores_resumo', None) == (instance.preco, instance.duracao_minutos):
+            return
+        dias = dias_do_servico(instance)
+    else:
+        dias = instance._dias_resumo
+    # Só os dias em que o serviço aparece, não o histórico inteiro do profissional
+    reconstruir_resumos([instance.profissional_id], dias=dias)
+    instance._valores_resumo = (instance.preco, instance.duracao_minutos)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidar_cartao_do_usuario(sender, instance, update_fields=None, **kwargs):
+    # O login só grava last_login, que não aparece no cartão da home
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    if instance.tipo == 'CABELEIREIRO':
+        invalidar_no_commit(invalidar_cartao, instance.pk)
+
+
+@receiver(post_save, sender=Servico)
+@receiver(post_delete, sender=Servico)
+@receiver(post_save, sender=Portfolio)
+@receiver(post_delete, sender=Portfolio)
+def invalidar_cartao_do_profissional(sender, instance, **kwargs):
+    invalidar_no_commit(invalidar_cartao, instance.profissional_id)
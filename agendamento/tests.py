@@ -1,3 +1,1527 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+from io import BytesIO
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, router
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from PIL import Image
+
+from notificacoes.models import EventoNotificacao
+from notificacoes.outbox import enfileirar_notificacao
+from setup.imagens import LARGURAS_AVATAR, LARGURAS_PORTFOLIO, ImagemResponsiva, gerar_variantes
+from setup.metricas import exportar_metricas, zerar_metricas
+from setup.orcamento import (
+    OrcamentoExcedido, OrcamentoMiddleware, consultas_lentas, orcamento_consultas, zerar_consultas_lentas,
+)
+from setup.replica import COOKIE, PRIMARIO, REPLICA, ReplicaMiddleware, na_replica, no_primario, somente_leitura
+from setup.testes import OrcamentoTestMixin
+from users.models import User
+from . import expediente as modulo_expediente
+from . import reservas, views, views_async
+from .cache import estatisticas_cache, obter_disponibilidade, versao_agenda, zerar_estatisticas
+from .disponibilidade import aplicar_corte, gerar_inicios_livres, gerar_slots, meia_noite, validar_expediente
+from .expediente import Expediente, RegraDia, regra_do_dia
+from .models import (
+    Agendamento, ExcecaoHorario, HorarioTrabalho, Portfolio, ResumoDiario, SerieAgendamento, Servico, TravaAgenda,
+)
+from .paginacao import TAMANHO_PAGINA, codificar_cursor, decodificar_cursor, paginar_por_chave
+from .reservas import criar_agendamento
+from .resumos import AGREGACOES, reconstruir_resumos
+from .series import ConflitoSerie, cancelar_serie, criar_serie, remarcar_serie
+from .validacao import MENSAGEM_ENTRE_SI, validar_em_lote
+
+
+# Nos testes não existe o manifest do collectstatic
+STORAGES_TESTE = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+def proximo_dia_util(dias=1):
+    """Próxima data (a partir de hoje + dias) que não cai no domingo (folga padrão)."""
+    data = timezone.localdate() + timedelta(days=dias)
+    if data.weekday() == 6:
+        data += timedelta(days=1)
+    return data
+
+
+class ReservaConcorrenteTest(TransactionTestCase):
+    """Muitos clientes tentando o mesmo horário ao mesmo tempo: só um pode ganhar."""
+
+    TENTATIVAS = 20
+
+    def setUp(self):
+        self.profissional = User.objects.create(username='prof', tipo='CABELEIREIRO')
+        self.servico = Servico.objects.create(profissional=self.profissional, nome='Corte', preco=50, duracao_minutos=45)
+        self.clientes = [
+            User.objects.create(username=f'cliente{i}')
+            for i in range(self.TENTATIVAS)
+        ]
+        self.inicio = timezone.make_aware(datetime.combine(proximo_dia_util(), time(10, 0)))
+
+    def _tentar(self, cliente):
+        try:
+            criar_agendamento(cliente, self.profissional, self.servico, self.inicio)
+            return True
+        except ValidationError:
+            return False
+        finally:
+            connection.close()
+
+    def test_apenas_uma_reserva_vence(self):
+        with ThreadPoolExecutor(max_workers=self.TENTATIVAS) as executor:
+            resultados = list(executor.map(self._tentar, self.clientes))
+
+        self.assertEqual(resultados.count(True), 1)
+        self.assertEqual(
+            Agendamento.objects.filter(profissional=self.profissional, data_hora_inicio=self.inicio).count(), 1
+        )
+
+    def test_travas_locais_nao_crescem_com_os_profissionais(self):
+        for profissional_id in range(1, 10 * reservas.TRAVAS_LOCAIS):
+            with reservas._trava_local(profissional_id):
+                pass
+        self.assertEqual(len(reservas._travas_locais), reservas.TRAVAS_LOCAIS)
+
+    def test_horarios_sobrepostos_tambem_conflitam(self):
+        # Cada cliente tenta um início diferente, todos sobrepostos ao primeiro (10:00-10:45)
+        inicios = [self.inicio + timedelta(minutes=5 * i) for i in range(9)]
+
+        def tentar(args):
+            cliente, inicio = args
+            try:
+                criar_agendamento(cliente, self.profissional, self.servico, inicio)
+                return True
+            except ValidationError:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(inicios)) as executor:
+            resultados = list(executor.map(tentar, zip(self.clientes, inicios)))
+
+        self.assertEqual(resultados.count(True), 1)
+        self.assertEqual(Agendamento.objects.filter(profissional=self.profissional).count(), 1)
+
+    def test_aviso_e_reserva_entram_juntos(self):
+        def avisar(agendamento):
+            enfileirar_notificacao(self.profissional, "Novo agendamento", chave=f'agendamento:{agendamento.pk}:novo')
+
+        criar_agendamento(self.clientes[0], self.profissional, self.servico, self.inicio, notificar=avisar)
+        self.assertEqual(EventoNotificacao.objects.count(), 1)
+
+        # Se o aviso falha, a reserva também volta atrás
+        def falhar(agendamento):
+            avisar(agendamento)
+            raise DatabaseError("outbox fora do ar")
+
+        with self.assertRaises(DatabaseError):
+            criar_agendamento(self.clientes[1], self.profissional, self.servico, self.inicio + timedelta(hours=4), notificar=falhar)
+        self.assertEqual(Agendamento.objects.filter(profissional=self.profissional).count(), 1)
+        self.assertEqual(EventoNotificacao.objects.count(), 1)
+
+
+@override_settings(STORAGES=STORAGES_TESTE)
+class DashboardProfissionalQueriesTest(TestCase):
+    """O número de consultas do dashboard não pode crescer com a quantidade de agendamentos."""
+
+    def setUp(self):
+        cache.clear()
+        self.profissional = User.objects.create(username='prof', tipo='CABELEIREIRO')
+        self.servico = Servico.objects.create(profissional=self.profissional, nome='Corte', preco=50, duracao_minutos=30)
+        self.client.force_login(self.profissional)
+        self.hoje = timezone.localdate()
+
+    def _criar_agendamentos(self, quantidade, data):
+        status = ['AGENDADO', 'CONCLUIDO', 'CANCELADO']
+        for i in range(quantidade):
+            cliente = User.objects.create(username=f'cli-{User.objects.count()}', first_name=f'Cliente {i}', telefone='1199999')
+            inicio = timezone.make_aware(datetime.combine(data, time(8, 0))) + timedelta(minutes=20 * i)
+            Agendamento.objects.create(
+                cliente=cliente, profissional=self.profissional, servico=self.servico,
+                data_hora_inicio=inicio, status=status[i % 3]
+            )
+
+    def _contar_consultas(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.client.get(reverse('listar_agendamentos'))
+        self.assertEqual(resposta.status_code, 200)
+        return len(contexto.captured_queries)
+
+    def test_consultas_constantes(self):
+        self._criar_agendamentos(1, self.hoje)
+        self._criar_agendamentos(1, self.hoje + timedelta(days=1))
+        com_poucos = self._contar_consultas()
+
+        self._criar_agendamentos(20, self.hoje)
+        self._criar_agendamentos(20, self.hoje + timedelta(days=2))
+        com_muitos = self._contar_consultas()
+
+        self.assertEqual(com_poucos, com_muitos)
+
+    def test_orcamento_de_consultas(self):
+        self._criar_agendamentos(10, self.hoje)
+        self._criar_agendamentos(10, self.hoje + timedelta(days=1))
+        # sessão, usuário, contador de notificações (cache frio), KPIs e agenda do período
+        # (a agenda futura chega depois, pela api_agenda_futura)
+        with self.assertNumQueries(5):
+            resposta = self.client.get(reverse('listar_agendamentos'))
+        self.assertEqual(resposta.context['total_agendados'], 10)
+        self.assertEqual(resposta.context['atendimentos_periodo'], 3)
+        self.assertEqual(resposta.context['faturamento'], 150)
+
+    def test_agenda_do_periodo_em_paginas(self):
+        self._criar_agendamentos(30, self.hoje)
+        periodo = {'data_inicio': self.hoje.isoformat(), 'data_fim': self.hoje.isoformat()}
+
+        resposta = self.client.get(reverse('listar_agendamentos'), periodo)
+        self.assertEqual(len(resposta.context['agenda_periodo']), TAMANHO_PAGINA)
+        self.assertEqual(resposta.context['total_agendados'], 30)
+        cursor = resposta.context['proximo_cursor']
+        self.assertContains(resposta, f'data-cursor="{cursor}"')
+
+        dados = self.client.get(reverse('api_agenda_periodo'), {**periodo, 'cursor': cursor}).json()
+        self.assertEqual(dados['html'].count('<tr'), 30 - TAMANHO_PAGINA)
+        self.assertIsNone(dados['proximo_cursor'])
+        # Continua de onde a página parou: o primeiro da API é o 21º horário do dia
+        self.assertIn('14:40', dados['html'].split('<tr')[1])
+
+        self.assertEqual(self.client.get(reverse('api_agenda_periodo'), {**periodo, 'cursor': 'lixo'}).status_code, 400)
+        self.client.force_login(User.objects.create(username='cliente'))
+        self.assertEqual(self.client.get(reverse('api_agenda_periodo'), periodo).status_code, 403)
+
+
+class ExpedienteTest(TestCase):
+    """Feriados, férias e horários especiais valem no lugar da regra semanal."""
+
+    def setUp(self):
+        cache.clear()
+        self.profissional = User.objects.create(username='prof', tipo='CABELEIREIRO')
+        self.cliente = User.objects.create(username='cliente')
+        self.servico = Servico.objects.create(profissional=self.profissional, nome='Corte', preco=50, duracao_minutos=30)
+        self.data = proximo_dia_util(7)
+
+    def _horarios(self, data):
+        resposta = self.client.get(reverse('api_horarios_disponiveis'), {
+            'profissional_id': self.profissional.id, 'servico_id': self.servico.id, 'data': data.isoformat(),
+        })
+        return resposta.json()
+
+    def _agendamento(self, hora):
+        return Agendamento(
+            cliente=self.cliente, profissional=self.profissional, servico=self.servico,
+            data_hora_inicio=timezone.make_aware(datetime.combine(self.data, hora)),
+        )
+
+    def test_feriado_fecha_a_agenda(self):
+        self.assertIn('09:00', self._horarios(self.data)['horarios'])
+        ExcecaoHorario.objects.create(profissional=self.profissional, data_inicio=self.data, data_fim=self.data, motivo='Feriado')
+
+        resposta = self._horarios(self.data)
+        self.assertEqual(resposta['horarios'], [])
+        self.assertIn('Feriado', resposta['erro'])
+        with self.assertRaisesMessage(ValidationError, 'Feriado'):
+            self._agendamento(time(10, 0)).full_clean()
+
+    def test_horario_especial_substitui_a_regra_semanal(self):
+        ExcecaoHorario.objects.create(
+            profissional=self.profissional, data_inicio=self.data, data_fim=self.data,
+            fechado=False, hora_inicio=time(14, 0), hora_fim=time(20, 0),
+        )
+        horarios = self._horarios(self.data)['horarios']
+        self.assertEqual((horarios[0], horarios[-1]), ('14:00', '19:30'))
+        # Fora do padrão (18h às 20h), mas dentro da exceção
+        criar_agendamento(self.cliente, self.profissional, self.servico, timezone.make_aware(datetime.combine(self.data, time(19, 0))))
+        with self.assertRaises(ValidationError):
+            self._agendamento(time(10, 0)).full_clean()
+
+    def test_proximos_horarios_pulam_as_ferias(self):
+        hoje = timezone.localdate()
+        ExcecaoHorario.objects.create(
+            profissional=self.profissional, data_inicio=hoje, data_fim=hoje + timedelta(days=9), motivo='Férias'
+        )
+        resposta = self.client.get(reverse('api_proximos_horarios'), {
+            'profissional_id': self.profissional.id, 'servico_id': self.servico.id, 'quantidade': 1,
+        })
+        primeiro = datetime.strptime(resposta.json()['horarios'][0]['data'], '%Y-%m-%d').date()
+        self.assertGreater(primeiro, hoje + timedelta(days=9))
+
+    def test_expediente_compilado_fica_em_cache(self):
+        regra_do_dia(self.profissional.id, self.data)
+        with self.assertNumQueries(0):
+            self.assertFalse(regra_do_dia(self.profissional.id, self.data).folga)
+
+        # Salvar uma exceção troca a versão e o expediente é recompilado
+        ExcecaoHorario.objects.create(profissional=self.profissional, data_inicio=self.data, data_fim=self.data)
+        self.assertTrue(regra_do_dia(self.profissional.id, self.data).folga)
+
+    def test_excecao_mais_nova_vence_na_sobreposicao(self):
+        dia = self.data
+        ferias = RegraDia(folga=True, motivo='Férias')
+        plantao = RegraDia(time(8, 0), time(12, 0), motivo='Plantão')
+        expediente = Expediente(
+            {dia.weekday(): RegraDia(time(9, 0), time(18, 0))},
+            [(dia - timedelta(days=3), dia + timedelta(days=3), ferias), (dia, dia, plantao)],
+        )
+        self.assertIs(expediente.regra(dia - timedelta(days=1)), ferias)
+        self.assertIs(expediente.regra(dia), plantao)
+        self.assertIs(expediente.regra(dia + timedelta(days=3)), ferias)
+        self.assertEqual(expediente.regra(dia + timedelta(days=7)).hora_inicio, time(9, 0))
+        self.assertEqual(len(expediente.trechos), 3)
+
+
+@override_settings(STORAGES=STORAGES_TESTE)
+class RegrasSemanaisEmCacheTest(TestCase):
+    """Validar e gerar horários não deve consultar HorarioTrabalho no caso comum."""
+
+    def setUp(self):
+        cache.clear()
+        self.profissional = User.objects.create(username='prof', tipo='CABELEIREIRO')
+        self.cliente = User.objects.create(username='cliente')
+        self.servico = Servico.objects.create(profissional=self.profissional, nome='Corte', preco=50, duracao_minutos=30)
+        self.data = proximo_dia_util(3)
+
+    def _agendamento(self, hora):
+        return Agendamento(
+            cliente=self.cliente, profissional=self.profissional, servico=self.servico,
+            data_hora_inicio=timezone.make_aware(datetime.combine(self.data, hora)),
+        )
+
+    def test_clean_so_consulta_conflitos(self):
+        self._agendamento(time(10, 0)).clean()
+        with self.assertNumQueries(1):
+            self._agendamento(time(11, 0)).clean()
+
+    def test_memoria_do_processo_dispensa_o_cache_compartilhado(self):
+        regra_do_dia(self.profissional.id, self.data)
+        # Some a entrada compilada do cache, mas a versão continua a mesma
+        versao = cache.get(modulo_expediente._chave_versao(self.profissional.id))
+        cache.delete(modulo_expediente._chave(self.profissional.id, versao))
+        with self.assertNumQueries(0):
+            self.assertEqual(regra_do_dia(self.profissional.id, self.data).hora_inicio, time(9, 0))
+
+        # Outro worker trocou a regra: a versão muda e a memória é descartada
+        cache.incr(modulo_expediente._chave_versao(self.profissional.id))
+        with self.assertNumQueries(2):
+            regra_do_dia(self.profissional.id, self.data)
+
+    def test_salvar_o_formset_invalida_as_regras(self):
+        self.assertEqual(regra_do_dia(self.profissional.id, self.data).hora_inicio, time(9, 0))
+
+        self.client.force_login(self.profissional)
+        horarios = list(self.profissional.horarios_trabalho.all())
+        dados = {'form-TOTAL_FORMS': len(horarios), 'form-INITIAL_FORMS': len(horarios)}
+        for i, horario in enumerate(horarios):
+            dados.update({
+                f'form-{i}-id': horario.id,
+                f'form-{i}-hora_inicio': '07:00' if horario.dia_semana == self.data.weekday() else '09:00',
+                f'form-{i}-hora_fim': '18:00',
+                f'form-{i}-almoco_inicio': '12:00',
+                f'form-{i}-almoco_fim': '13:00',
+                f'form-{i}-folga': 'on' if horario.folga else '',
+            })
+        resposta = self.client.post(reverse('configurar_horarios'), dados)
+        self.assertEqual(resposta.status_code, 302)
+
+        self.assertEqual(regra_do_dia(self.profissional.id, self.data).hora_inicio, time(7, 0))
+        self._agendamento(time(7, 30)).clean()
+
+
+class ValidacaoEmLoteTest(TestCase):
+    """Muitos candidatos validados em poucas consultas, com as mesmas mensagens do clean()."""
+
+    def setUp(self):
+        cache.clear()
+        self.profissional = User.objects.create(username='prof', tipo='CABELEIREIRO')
+        self.cliente = User.objects.create(username='cliente')
+        self.servico = Servico.objects.create(profissional=self.profissional, nome='Corte', preco=50, duracao_minutos=30)
+        self.data = proximo_dia_util(3)
+        self.existente = criar_agendamento(self.cliente, self.profissional, self.servico, self._em(time(10, 0)))
+
+    def _em(self, hora, data=None):
+        return timezone.make_aware(datetime.combine(data or self.data, hora))
+
+    def _erro_do_clean(self, inicio, pk=None):
+        agendamento = Agendamento(
+            pk=pk, cliente=self.cliente, profissional=self.profissional, servico=self.servico, data_hora_inicio=inicio
+        )
+        try:
+            agendamento.clean()
+        except ValidationError as erro:
+            return erro.messages[0]
+        return None
+
+    def test_mesmas_mensagens_do_clean(self):
+        domingo = self.data + timedelta(days=(6 - self.data.weekday()) % 7)
+        inicios = [
+            self._em(time(9, 0)),          # livre
+            self._em(time(10, 15)),        # conflito
+            self._em(time(12, 0)),         # almoço
+            self._em(time(7, 0)),          # antes do expediente
+            self._em(time(10, 0), domingo),  # folga
+        ]
+        resultados = validar_em_lote([(self.profissional.id, self.servico.id, inicio) for inicio in inicios])
+        self.assertEqual([r['erro'] for r in resultados], [self._erro_do_clean(inicio) for inicio in inicios])
+        self.assertEqual([r['valido'] for r in resultados], [True, False, False, False, False])
+
+    def test_remarcacao_ignora_o_proprio_agendamento(self):
+        inicio = self._em(time(10, 15))
+        resultado, = validar_em_lote([(self.profissional.id, self.servico.id, inicio, self.existente.pk)])
+        self.assertTrue(resultado['valido'])
+        self.assertIsNone(self._erro_do_clean(inicio, pk=self.existente.pk))
+
+    def test_candidatos_entre_si(self):
+        candidatos = [(self.profissional.id, self.servico.id, self._em(time(15, 0))),
+                      (self.profissional.id, self.servico.id, self._em(time(15, 15)))]
+        self.assertTrue(all(r['valido'] for r in validar_em_lote(candidatos)))
+        segundo = validar_em_lote(candidatos, entre_si=True)[1]
+        self.assertEqual(segundo['erro'], MENSAGEM_ENTRE_SI)
+
+    def test_consultas_nao_crescem_com_a_lista(self):
+        candidatos = [
+            (self.profissional.id, self.servico.id, self._em(time(9, 0)) + timedelta(days=dia, minutes=30 * i))
+            for dia in range(5) for i in range(10)
+        ]
+        validar_em_lote(candidatos[:1])
+        # serviços, profissionais e agendamentos da janela (expediente vem do cache)
+        with self.assertNumQueries(3):
+            resultados = validar_em_lote(candidatos)
+        self.assertEqual(len(resultados), 50)
+
+    def test_api(self):
+        self.client.force_login(self.cliente)
+        resposta = self.client.post(reverse('api_validar_horarios'), {'candidatos': [
+            {'profissional_id': self.profissional.id, 'servico_id': self.servico.id, 'inicio': f'{self.data}T09:00'},
+            {'profissional_id': self.profissional.id, 'servico_id': self.servico.id, 'inicio': f'{self.data}T10:00'},
+        ]}, content_type='application/json')
+        self.assertEqual([r['valido'] for r in resposta.json()['resultados']], [True, False])
+
+        resposta = self.client.post(reverse('api_validar_horarios'), {'candidatos': [{'inicio': 'x'}]}, content_type='application/json')
+        self.assertEqual(resposta.status_code, 400)
+
+
+@override_settings(STORAGES=STORAGES_TESTE)
+class SerieAgendamentoTest(TestCase):
+    """Agendamentos recorrentes validados e gravados de uma vez."""
+
+    def setUp(self):
+        cache.clear()
+        self.profissional = User.objects.create(username='prof', tipo='CABELEIREIRO')
+        self.cliente = User.objects.create(username='cliente')
+        self.outro = User.objects.create(username='outro')
+        self.servico = Servico.objects.create(profissional=self.profissional, nome='Corte', preco=50, duracao_minutos=30)
+        self.inicio = timezone.make_aware(datetime.combine(proximo_dia_util(1), time(10, 0)))
+
+    def _serie(self, ocorrencias=4, **kwargs):
+        return criar_serie(self.cliente, self.profissional, self.servico, self.inicio, ocorrencias, **kwargs)
+
+    def test_cria_todas_as_ocorrencias(self):
+        serie, colisoes = self._serie()
+        self.assertEqual(colisoes, [])
+        inicios = list(serie.agendamentos.order_by('data_hora_inicio').values_list('data_hora_inicio', flat=True))
+        self.assertEqual(inicios, [self.inicio + timedelta(weeks=k) for k in range(4)])
+        # Os signals não rodam no bulk_create: resumos e cache são tratados pela série
+        self.assertEqual(ResumoDiario.objects.filter(profissional=self.profissional).count(), 4)
+        resposta = self.client.get(reverse('api_horarios_disponiveis'), {
+            'profissional_id': self.profissional.id, 'servico_id': self.servico.id,
+            'data': (self.inicio + timedelta(weeks=2)).date().isoformat(),
+        })
+        self.assertNotIn('10:00', resposta.json()['horarios'])
+
+    def test_consultas_nao_crescem_com_a_serie(self):
+        self._serie(2)
+        cache.clear()
+        with CaptureQueriesContext(connection) as curta:
+            criar_serie(self.outro, self.profissional, self.servico, self.inicio + timedelta(hours=1), 2)
+        cache.clear()
+        with CaptureQueriesContext(connection) as longa:
+            criar_serie(self.outro, self.profissional, self.servico, self.inicio + timedelta(hours=3), 20)
+        self.assertEqual(len(curta.captured_queries), len(longa.captured_queries))
+
+    def test_informa_as_datas_que_colidem(self):
+        terceira = self.inicio + timedelta(weeks=2)
+        criar_agendamento(self.outro, self.profissional, self.servico, terceira)
+
+        with self.assertRaises(ConflitoSerie) as contexto:
+            self._serie()
+        self.assertEqual([inicio for inicio, _ in contexto.exception.colisoes], [terceira])
+        self.assertEqual(Agendamento.objects.filter(cliente=self.cliente).count(), 0)
+
+        serie, colisoes = self._serie(pular_ocupadas=True)
+        self.assertEqual(len(colisoes), 1)
+        self.assertEqual(serie.agendamentos.count(), 3)
+
+    def test_remarca_e_cancela_a_serie_toda(self):
+        serie, _ = self._serie()
+        bloqueio = criar_agendamento(self.outro, self.profissional, self.servico, self.inicio + timedelta(weeks=1, hours=5))
+
+        with self.assertRaises(ConflitoSerie):
+            remarcar_serie(serie, nova_hora=time(15, 0))
+        self.assertFalse(serie.agendamentos.filter(data_hora_inicio__hour=18).exists())
+
+        bloqueio.delete()
+        self.assertEqual(remarcar_serie(serie, nova_hora=time(15, 0)), 4)
+        self.assertEqual(
+            {timezone.localtime(inicio).time() for inicio in serie.agendamentos.values_list('data_hora_inicio', flat=True)},
+            {time(15, 0)},
+        )
+
+        self.assertEqual(cancelar_serie(serie), 4)
+        self.assertFalse(serie.agendamentos.exclude(status='CANCELADO').exists())
+        self.assertFalse(ResumoDiario.objects.filter(profissional=self.profissional, minutos_agendados__gt=0).exists())
+
+    def test_formulario_de_agendamento_cria_serie(self):
+        self.client.force_login(self.cliente)
+        resposta = self.client.post(reverse('novo_agendamento'), {
+            'profissional': self.profissional.id, 'servico': self.servico.id,
+            'data_hora_inicio': timezone.localtime(self.inicio).strftime('%Y-%m-%d %H:%M'),
+            'repetir': '2', 'ocorrencias': '3',
+        })
+        self.assertRedirects(resposta, reverse('listar_agendamentos'), fetch_redirect_response=False)
+        inicios = sorted(Agendamento.objects.filter(cliente=self.cliente).values_list('data_hora_inicio', flat=True))
+        self.assertEqual(inicios, [self.inicio + timedelta(weeks=2 * k) for k in range(3)])
+
+    def test_formulario_pula_a_primeira_data_ocupada(self):
+        criar_agendamento(self.outro, self.profissional, self.servico, self.inicio)
+        self.client.force_login(self.cliente)
+        dados = {
+            'profissional': self.profissional.id, 'servico': self.servico.id,
+            'data_hora_inicio': timezone.localtime(self.inicio).strftime('%Y-%m-%d %H:%M'),
+            'repetir': '1', 'ocorrencias': '3',
+        }
+        # Sem pular_ocupadas a série é recusada (pelo validar_em_lote, não pelo formulário)
+        self.client.post(reverse('novo_agendamento'), dados)
+        self.assertFalse(SerieAgendamento.objects.exists())
+
+        resposta = self.client.post(reverse('novo_agendamento'), {**dados, 'pular_ocupadas': 'on'})
+        self.assertRedirects(resposta, reverse('listar_agendamentos'), fetch_redirect_response=False)
+        inicios = sorted(Agendamento.objects.filter(cliente=self.cliente).values_list('data_hora_inicio', flat=True))
+        self.assertEqual(inicios, [self.inicio + timedelta(weeks=k) for k in (1, 2)])
+
+    def test_aviso_de_alteracao_so_para_mudanca_real(self):
+        serie, _ = self._serie()
+        self.client.force_login(self.cliente)
+
+        def editar(hora):
+            self.client.post(reverse('editar_serie', args=[serie.id]), {'hora': hora})
+
+        # Reenvio do mesmo formulário: a série não muda, o aviso não duplica
+        editar('15:00')
+        editar('15:00')
+        # Voltar para um horário já usado é outra remarcação e avisa de novo
+        editar('10:00')
+        editar('15:00')
+        self.assertEqual(
+            list(EventoNotificacao.objects.filter(chave__startswith=f'serie:{serie.id}:alterada:')
+                 .order_by('id').values_list('chave', flat=True)),
+            [f'serie:{serie.id}:alterada:{versao}' for versao in (1, 2, 3)],
+        )
+
+    def test_editar_serie_com_servico_invalido(self):
+        serie, _ = self._serie()
+        outro_prof = User.objects.create(username='prof2', tipo='CABELEIREIRO')
+        alheio = Servico.objects.create(profissional=outro_prof, nome='Barba', preco=30, duracao_minutos=30)
+        self.client.force_login(self.cliente)
+        for servico in ('abc', '1.5', str(alheio.id)):
+            with self.subTest(servico=servico):
+                resposta = self.client.post(reverse('editar_serie', args=[serie.id]), {'hora': '15:00', 'servico': servico})
+                self.assertRedirects(resposta, reverse('listar_agendamentos'), fetch_redirect_response=False)
+        # Nada mudou
+        self.assertFalse(serie.agendamentos.filter(data_hora_inicio__hour=15).exists())
+        self.assertFalse(serie.agendamentos.exclude(servico=self.servico).exists())
+
+
+@override_settings(DATABASE_ROUTERS=['setup.replica.RoteadorReplica'])
+class LeituraReplicaTest(TestCase):
+    """Roteamento de leituras: só o que foi marcado vai para a réplica, e quem escreve gruda no primário."""
+
+    def setUp(self):
+        self.fabrica = RequestFactory()
+        self.bancos = []
+
+    @somente_leitura
+    def _view_leitura(self, request):
+        self.bancos.append(router.db_for_read(Servico))
+        return HttpResponse()
+
+    def _view_escrita(self, request):
+        Servico.objects.filter(id=0).update(nome='x')
+        self.bancos.append(router.db_for_read(Servico))
+        return self._view_leitura(request)
+
+    def _requisicao(self, view, cookies=None):
+        request = self.fabrica.get('/')
+        request.COOKIES.update(cookies or {})
+        return ReplicaMiddleware(view)(request)
+
+    def test_so_le_da_replica_o_que_foi_marcado(self):
+        self.assertEqual(router.db_for_read(Servico), PRIMARIO)
+        with na_replica():
+            self.assertEqual(router.db_for_read(Servico), REPLICA)
+            # Preencher um cache nunca usa dados atrasados
+            with no_primario():
+                self.assertEqual(router.db_for_read(Servico), PRIMARIO)
+            self.assertEqual(router.db_for_read(Servico), REPLICA)
+        self.assertEqual(router.db_for_read(Servico), PRIMARIO)
+        self.assertEqual(router.db_for_write(Servico), PRIMARIO)
+
+    def test_view_somente_leitura_usa_a_replica_sem_gravar_cookie(self):
+        resposta = self._requisicao(self._view_leitura)
+        self.assertEqual(self.bancos, [REPLICA])
+        self.assertNotIn(COOKIE, resposta.cookies)
+
+    def test_quem_escreve_fica_no_primario(self):
+        resposta = self._requisicao(self._view_escrita)
+        # Na mesma requisição, depois da escrita, nada sai do primário
+        self.assertEqual(self.bancos, [PRIMARIO, PRIMARIO])
+        self.assertIn(COOKIE, resposta.cookies)
+
+        # Nas seguintes também, enquanto o cookie valer
+        self.bancos.clear()
+        self._requisicao(self._view_leitura, {COOKIE: resposta.cookies[COOKIE].value})
+        self.assertEqual(self.bancos, [PRIMARIO])
+
+
+MEDIA_TESTE = tempfile.mkdtemp()
+
+
+def imagem_png():
+    buffer = BytesIO()
+    Image.new('RGB', (800, 600), 'white').save(buffer, 'PNG')
+    return SimpleUploadedFile('foto.png', buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(STORAGES=STORAGES_TESTE, MEDIA_ROOT=MEDIA_TESTE)
+class OrcamentoConsultasTest(OrcamentoTestMixin, TestCase):
+    """
+    Cada view do agendamento cabe no @orcamento_consultas com o cache frio e
+    dados suficientes para uma N+1 aparecer (o executor de testes já quebra a
+    requisição que estoura; aqui também se confere que o orçamento existe).
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_TESTE, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.profissional = User.objects.create(username='prof', first_name='Ana', tipo='CABELEIREIRO')
+        self.outro_profissional = User.objects.create(username='prof2', tipo='CABELEIREIRO')
+        self.cliente = User.objects.create(username='cliente', first_name='Bia')
+        self.servicos = [
+            Servico.objects.create(profissional=self.profissional, nome=nome, preco=50, duracao_minutos=30)
+            for nome in ('Corte', 'Barba', 'Escova')
+        ]
+        Servico.objects.create(profissional=self.outro_profissional, nome='Corte', preco=40, duracao_minutos=45)
+        self.dia = proximo_dia_util(2)
+        self.agendamentos = [
+            Agendamento.objects.create(
+                cliente=self.cliente, profissional=self.profissional, servico=self.servicos[i % 3],
+                data_hora_inicio=timezone.make_aware(datetime.combine(self.dia, time(9 + i, 0))),
+            )
+            for i in range(3)
+        ]
+        for dias_atras in range(1, 4):
+            Agendamento.objects.create(
+                cliente=self.cliente, profissional=self.profissional, servico=self.servicos[dias_atras % 3],
+                data_hora_inicio=timezone.now() - timedelta(days=dias_atras), status='CONCLUIDO', anotacoes='Máquina 2',
+            )
+
+    def _get(self, usuario, nome, *args, **params):
+        cache.clear()
+        if usuario:
+            self.client.force_login(usuario)
+        else:
+            self.client.logout()
+        return self.assertDentroDoOrcamento(self.client.get(reverse(nome, args=args), params))
+
+    def _post(self, usuario, nome, *args, **kwargs):
+        cache.clear()
+        self.client.force_login(usuario)
+        return self.assertDentroDoOrcamento(self.client.post(reverse(nome, args=args), **kwargs))
+
+    def test_paginas_e_apis_de_leitura(self):
+        self._get(self.cliente, 'listar_agendamentos')
+        self._get(self.cliente, 'api_historico_agendamentos', tamanho=2)
+        self._get(self.cliente, 'novo_agendamento')
+        self._get(self.profissional, 'listar_agendamentos')
+        self._get(self.profissional, 'api_agenda_futura')
+        self._get(self.profissional, 'api_historico_cliente', self.cliente.id)
+        self._get(self.profissional, 'configurar_horarios')
+        self._get(self.profissional, 'gerenciar_servicos')
+        self._get(User.objects.create(username='equipe', is_staff=True), 'api_estatisticas_cache')
+
+    def test_apis_de_horarios(self):
+        self._get(None, 'api_servicos', self.profissional.id)
+        self._get(None, 'api_horarios_disponiveis', profissional_id=self.profissional.id,
+                  servico_id=self.servicos[0].id, data=self.dia.isoformat())
+        self._get(None, 'api_proximos_horarios', profissional_id=self.profissional.id, servico_id=self.servicos[0].id)
+        self._get(None, 'api_horarios_qualquer_profissional', servico='Corte', data=self.dia.isoformat())
+        candidatos = [
+            {'profissional_id': self.profissional.id, 'servico_id': servico.id,
+             'inicio': datetime.combine(self.dia, time(14 + i, 0)).isoformat()}
+            for i, servico in enumerate(self.servicos)
+        ]
+        self._post(self.cliente, 'api_validar_horarios', data=json.dumps({'candidatos': candidatos}),
+                   content_type='application/json')
+
+    def test_primeira_reserva_do_profissional(self):
+        # A trava nasce com o profissional: a primeira reserva não a cria na transação
+        self.assertTrue(TravaAgenda.objects.filter(profissional=self.outro_profissional).exists())
+        inicio = timezone.make_aware(datetime.combine(self.dia, time(15, 0)))
+        self._post(self.cliente, 'novo_agendamento', data={
+            'profissional': self.outro_profissional.id,
+            'servico': Servico.objects.get(profissional=self.outro_profissional).id,
+            'data_hora_inicio': inicio.strftime('%Y-%m-%d %H:%M'),
+        })
+        self.assertTrue(Agendamento.objects.filter(profissional=self.outro_profissional, data_hora_inicio=inicio).exists())
+
+    def test_agendar_e_cancelar(self):
+        inicio = timezone.make_aware(datetime.combine(self.dia, time(15, 0)))
+        self._post(self.cliente, 'novo_agendamento', data={
+            'profissional': self.profissional.id, 'servico': self.servicos[0].id,
+            'data_hora_inicio': inicio.strftime('%Y-%m-%d %H:%M'),
+        })
+        self._post(self.cliente, 'novo_agendamento', data={
+            'profissional': self.profissional.id, 'servico': self.servicos[1].id,
+            'data_hora_inicio': (inicio + timedelta(hours=1)).strftime('%Y-%m-%d %H:%M'),
+            'repetir': '1', 'ocorrencias': '6',
+        })
+        serie = SerieAgendamento.objects.get()
+        self._post(self.cliente, 'editar_serie', serie.id, data={'hora': '17:00'})
+        self.assertTrue(EventoNotificacao.objects.filter(chave=f'serie:{serie.id}:alterada:1').exists())
+
+        # Cancelar a série só por POST: um GET (link, prefetch) não mexe em nada
+        self._get(self.cliente, 'cancelar_serie', serie.id)
+        self.assertTrue(serie.agendamentos.filter(status='AGENDADO').exists())
+        self._post(self.cliente, 'cancelar_serie', serie.id)
+        self.assertFalse(serie.agendamentos.filter(status='AGENDADO').exists())
+        self._get(self.cliente, 'cancelar_agendamento', self.agendamentos[0].id)
+
+    def test_acoes_do_profissional(self):
+        self._get(self.profissional, 'mudar_status', self.agendamentos[1].id, 'CANCELADO')
+        self._post(self.profissional, 'concluir_agendamento', self.agendamentos[2].id, data={'anotacoes': 'Tesoura'})
+
+        self._post(self.profissional, 'adicionar_excecao_horario', data={
+            'data_inicio': self.dia.isoformat(), 'data_fim': self.dia.isoformat(), 'fechado': 'on', 'motivo': 'Feriado',
+        })
+        self._post(self.profissional, 'remover_excecao_horario', ExcecaoHorario.objects.get().id)
+
+        formset = self._get(self.profissional, 'configurar_horarios').context['formset']
+        dados = {f'form-{campo}': valor for campo, valor in formset.management_form.initial.items()}
+        for i, form in enumerate(formset.forms):
+            horario = form.instance
+            dados.update({
+                f'form-{i}-id': horario.id,
+                f'form-{i}-hora_inicio': '08:00', f'form-{i}-hora_fim': '19:00',
+                f'form-{i}-almoco_inicio': '12:00', f'form-{i}-almoco_fim': '13:00',
+            })
+        self._post(self.profissional, 'configurar_horarios', data=dados)
+
+        formset = self._get(self.profissional, 'gerenciar_servicos').context['formset']
+        dados = {f'form-{campo}': valor for campo, valor in formset.management_form.initial.items()}
+        for i, servico in enumerate(self.servicos):
+            dados.update({
+                f'form-{i}-id': servico.id, f'form-{i}-nome': servico.nome, f'form-{i}-preco': servico.preco,
+                f'form-{i}-duracao_minutos': servico.duracao_minutos, f'form-{i}-ativo': 'on',
+            })
+        dados.update({'form-0-preco': '55', 'form-3-nome': 'Luzes', 'form-3-preco': '120', 'form-3-duracao_minutos': '90'})
+        dados['form-TOTAL_FORMS'] = 4
+        self._post(self.profissional, 'gerenciar_servicos', data=dados)
+        self.assertTrue(Servico.objects.filter(profissional=self.profissional, nome='Luzes').exists())
+
+        self._post(self.profissional, 'upload_foto_portfolio', data={'imagem_portfolio': imagem_png(), 'descricao': 'Corte'})
+        self._get(self.profissional, 'deletar_foto_portfolio', Portfolio.objects.get().id)
+
+
+@override_settings(DATABASE_ROUTERS=[])
+class OrcamentoMiddlewareTest(TestCase):
+    """Estouro do orçamento (warning ou falha) e registro das consultas lentas."""
+
+    def setUp(self):
+        zerar_consultas_lentas()
+        self.servico = Servico.objects.create(
+            profissional=User.objects.create(username='prof', tipo='CABELEIREIRO'), nome='Corte', preco=50, duracao_minutos=30,
+        )
+
+    def _requisitar(self, maximo):
+        @orcamento_consultas(maximo)
+        def view(request):
+            list(Servico.objects.filter(nome='Corte'))
+            list(Servico.objects.filter(preco=50))
+            return HttpResponse()
+
+        request = RequestFactory().get(reverse('api_servicos', args=[self.servico.profissional_id]))
+        request.resolver_match = resolve(request.path)
+        middleware = OrcamentoMiddleware(view)
+        middleware.process_view(request, view, (), {})
+        return middleware(request)
+
+    def test_dentro_do_orcamento(self):
+        resposta = self._requisitar(2)
+        self.assertEqual(resposta.medicao_consultas.quantidade, 2)
+
+    @override_settings(ORCAMENTO_CONSULTAS_ESTRITO=False)
+    def test_estouro_vira_warning_em_producao(self):
+        with self.assertLogs('setup.orcamento', 'WARNING') as logs:
+            self._requisitar(1)
+        self.assertIn('api_servicos: 2 consultas SQL (orçamento: 1)', logs.output[0])
+
+    @override_settings(ORCAMENTO_CONSULTAS_ESTRITO=True)
+    def test_estouro_falha_nos_testes(self):
+        with self.assertRaisesMessage(OrcamentoExcedido, 'api_servicos: 2 consultas SQL (orçamento: 1)'):
+            self._requisitar(1)
+
+    @override_settings(CONSULTA_LENTA_MS=0)
+    def test_registra_consultas_lentas_com_sql_parametros_e_view(self):
+        with self.assertLogs('setup.orcamento', 'WARNING'):
+            self._requisitar(2)
+        lentas = consultas_lentas()
+        self.assertEqual(len(lentas), 2)
+        self.assertEqual(lentas[0]['view'], 'api_servicos')
+        self.assertIn('agendamento_servico', lentas[0]['sql'])
+        self.assertEqual(list(lentas[0]['params']), ['Corte'])
+
+
+class MotorDisponibilidadeTest(SimpleTestCase):
+    """Varredura de slots e validação do expediente (sem banco)."""
+
+    def setUp(self):
+        self.regra = RegraDia(time(8, 0), time(18, 0), time(12, 0), time(13, 0))
+        self.data = timezone.localdate() + timedelta(days=30)
+
+    def _momento(self, hora, minuto=0, dias=0):
+        return timezone.make_aware(datetime.combine(self.data + timedelta(days=dias), time(hora, minuto)))
+
+    def test_almoco_bloqueia_slots_que_cruzam_o_intervalo(self):
+        slots = gerar_slots(self.regra, self.data, 30, agora=False)
+        self.assertIn('11:30', slots)
+        self.assertNotIn('12:00', slots)
+        self.assertNotIn('12:30', slots)
+        self.assertIn('13:00', slots)
+        # Uma hora a partir das 11:30 invade o almoço
+        self.assertNotIn('11:30', gerar_slots(self.regra, self.data, 60, agora=False))
+        self.assertEqual(gerar_slots(self.regra, self.data, 60, agora=False)[-1], '17:00')
+
+    def test_agendamentos_sobrepostos_e_encostados(self):
+        ocupados = [
+            (self._momento(9, 0), self._momento(9, 45)),
+            (self._momento(9, 30), self._momento(10, 0)),
+            (self._momento(10, 0), self._momento(10, 30)),
+        ]
+        slots = gerar_slots(self.regra, self.data, 30, ocupados, agora=False)
+        # Terminar exatamente quando outro começa (e vice-versa) não é conflito
+        self.assertIn('08:30', slots)
+        self.assertNotIn('09:00', slots)
+        self.assertNotIn('10:00', slots)
+        self.assertIn('10:30', slots)
+        self.assertNotIn('08:30', gerar_slots(self.regra, self.data, 45, ocupados, agora=False))
+
+    def test_agendamento_que_atravessa_a_meia_noite(self):
+        madrugada = RegraDia(time(0, 0), time(23, 30))
+        ocupados = [
+            (self._momento(23, 0, dias=-1), self._momento(1, 0)),
+            (self._momento(23, 0), self._momento(1, 0, dias=1)),
+        ]
+        slots = gerar_slots(madrugada, self.data, 30, ocupados, agora=False)
+        self.assertEqual(slots[0], '01:00')
+        self.assertEqual(slots[-1], '22:30')
+
+    def test_corte_do_que_ja_passou(self):
+        agora = self._momento(10, 10)
+        slots = gerar_slots(self.regra, self.data, 30, agora=agora)
+        self.assertEqual(slots[0], '10:30')
+        # Calculado sem corte (como fica no cache) e cortado na resposta: mesmo resultado
+        inicios = gerar_inicios_livres(self.regra, self.data, 30, agora=False)
+        self.assertEqual(aplicar_corte(self.data, inicios, agora), gerar_inicios_livres(self.regra, self.data, 30, agora=agora))
+        self.assertEqual(gerar_slots(self.regra, self.data, 30, agora=self._momento(8, 0, dias=1)), [])
+
+    def test_folga_e_dia_sem_regra(self):
+        self.assertEqual(gerar_slots(RegraDia(folga=True), self.data, 30), [])
+        self.assertEqual(gerar_slots(None, self.data, 30), [])
+
+    def test_mesmas_recusas_do_clean_antigo(self):
+        def recusa_antiga(inicio, fim):
+            # Regra do Agendamento.clean() antes do motor (comparando as horas locais)
+            ini, fim = timezone.localtime(inicio).time(), timezone.localtime(fim).time()
+            if ini < self.regra.hora_inicio or fim > self.regra.hora_fim:
+                return 'expediente'
+            almoco_ini, almoco_fim = self.regra.almoco_inicio, self.regra.almoco_fim
+            if (almoco_ini <= ini < almoco_fim) or (almoco_ini < fim <= almoco_fim) or (ini <= almoco_ini and fim >= almoco_fim):
+                return 'almoço'
+            return None
+
+        def recusa_nova(inicio, fim):
+            try:
+                validar_expediente(self.regra, inicio, fim)
+            except ValidationError as erro:
+                return 'almoço' if 'almoço' in erro.messages[0] else 'expediente'
+            return None
+
+        for minuto in range(6 * 60, 20 * 60, 15):
+            for duracao in (15, 30, 45, 60, 90):
+                inicio = meia_noite(self.data) + timedelta(minutes=minuto)
+                fim = inicio + timedelta(minutes=duracao)
+                with self.subTest(inicio=inicio.time(), duracao=duracao):
+                    self.assertEqual(recusa_nova(inicio, fim), recusa_antiga(inicio, fim))
+
+        with self.assertRaisesMessage(ValidationError, 'não trabalha neste dia'):
+            validar_expediente(RegraDia(folga=True), self._momento(9), self._momento(10))
+
+
+class ProximosHorariosTest(TestCase):
+    """api_proximos_horarios: varre vários dias, pula folgas e exceções e respeita quantidade/horizonte."""
+
+    def setUp(self):
+        cache.clear()
+        self.profissional = User.objects.create(username='prof', tipo='CABELEIREIRO')
+        self.servico = Servico.objects.create(profissional=self.profissional, nome='Corte', preco=50, duracao_minutos=60)
+        self.hoje = timezone.localdate()
+        # Fechado de hoje até depois de amanhã: a busca precisa olhar os dias seguintes
+        ExcecaoHorario.objects.create(
+            profissional=self.profissional, data_inicio=self.hoje, data_fim=self.hoje + timedelta(days=2), motivo='Férias',
+        )
+
+    def _buscar(self, **params):
+        params = {'profissional_id': self.profissional.id, 'servico_id': self.servico.id, **params}
+        return self.client.get(reverse('api_proximos_horarios'), params).json()
+
+    def _datas(self, horarios):
+        return [datetime.strptime(item['data'], '%Y-%m-%d').date() for item in horarios]
+
+    def test_pula_dias_fechados_e_a_folga(self):
+        horarios = self._buscar(quantidade=20, dias=14)['horarios']
+        datas = self._datas(horarios)
+        self.assertEqual(len(horarios), 20)
+        self.assertGreaterEqual(min(datas), self.hoje + timedelta(days=3))
+        self.assertNotIn(6, {data.weekday() for data in datas})  # domingo é folga
+        # 09:00-18:00, almoço 12-13, passo de 30 min: 14 inícios de uma hora por dia, em ordem
+        self.assertEqual(horarios[0]['hora'], '09:00')
+        self.assertNotIn('11:30', {item['hora'] for item in horarios})
+        self.assertEqual(datas, sorted(datas))
+        self.assertEqual(datas.count(datas[0]), 14)
+
+    def test_agendamento_existente_empurra_o_primeiro_horario(self):
+        primeiro = self._buscar(quantidade=1)['horarios'][0]
+        data = datetime.strptime(primeiro['data'], '%Y-%m-%d').date()
+        Agendamento.objects.create(
+            cliente=User.objects.create(username='cliente'), profissional=self.profissional, servico=self.servico,
+            data_hora_inicio=timezone.make_aware(datetime.combine(data, time(9, 0))),
+        )
+        self.assertEqual(self._buscar(quantidade=1)['horarios'], [{'data': primeiro['data'], 'hora': '10:00'}])
+
+    def test_limites_de_quantidade_e_horizonte(self):
+        # Só os dias fechados dentro do horizonte: nada encontrado
+        self.assertEqual(self._buscar(dias=3)['horarios'], [])
+        # Quantidade acima do teto é limitada a 50; padrão é 5
+        self.assertEqual(len(self._buscar(quantidade=500, dias=30)['horarios']), 50)
+        self.assertEqual(len(self._buscar()['horarios']), 5)
+        self.assertEqual(self._buscar(quantidade='x')['erro'], 'Parâmetros inválidos.')
+
+    def test_servico_de_outro_profissional(self):
+        outro = User.objects.create(username='prof2', tipo='CABELEIREIRO')
+        resposta = self._buscar(profissional_id=outro.id)
+        self.assertEqual(resposta, {'horarios': [], 'erro': 'Serviço inválido'})
+
+    def test_servico_desativado(self):
+        Servico.objects.filter(pk=self.servico.pk).update(ativo=False)
+        self.assertEqual(self._buscar(), {'horarios': [], 'erro': 'Serviço inválido'})
+
+
+class QualquerProfissionalTest(TestCase):
+    """api_horarios_qualquer_profissional junta os horários de todos, cada um com o seu serviço."""
+
+    def setUp(self):
+        cache.clear()
+        self.ana = User.objects.create(username='ana', first_name='Ana', tipo='CABELEIREIRO')
+        self.bruno = User.objects.create(username='bruno', first_name='Bruno', tipo='CABELEIREIRO')
+        inativo = User.objects.create(username='caio', tipo='CABELEIREIRO')
+        self.corte_ana = Servico.objects.create(profissional=self.ana, nome='Corte', preco=50, duracao_minutos=30)
+        self.corte_bruno = Servico.objects.create(profissional=self.bruno, nome='corte', preco=70, duracao_minutos=90)
+        Servico.objects.create(profissional=inativo, nome='Corte', preco=40, duracao_minutos=30, ativo=False)
+        self.dia = proximo_dia_util(3)
+        Agendamento.objects.create(
+            cliente=User.objects.create(username='cliente'), profissional=self.ana, servico=self.corte_ana,
+            data_hora_inicio=timezone.make_aware(datetime.combine(self.dia, time(9, 0))),
+            data_hora_fim=timezone.make_aware(datetime.combine(self.dia, time(10, 0))),
+        )
+
+    def _por_hora(self, servico='Corte'):
+        resposta = self.client.get(reverse('api_horarios_qualquer_profissional'), {'servico': servico, 'data': self.dia.isoformat()})
+        return {item['hora']: item['profissionais'] for item in resposta.json()['horarios']}
+
+    def test_junta_os_profissionais_por_horario(self):
+        por_hora = self._por_hora()
+        nomes = {hora: [p['profissional'] for p in profissionais] for hora, profissionais in por_hora.items()}
+        # Ana está ocupada das 9 às 10; Bruno (90 min) não cabe antes do almoço a partir das 10:30
+        self.assertEqual(nomes['09:00'], ['Bruno'])
+        self.assertEqual(nomes['10:00'], ['Ana', 'Bruno'])
+        self.assertEqual(nomes['11:00'], ['Ana'])
+        self.assertEqual(nomes['17:30'], ['Ana'])
+        self.assertEqual(nomes['16:30'], ['Ana', 'Bruno'])
+        self.assertEqual(list(por_hora), sorted(por_hora))
+        # Profissional com o serviço inativo não aparece
+        self.assertNotIn('caio', {p['profissional'] for profissionais in por_hora.values() for p in profissionais})
+
+    def test_cada_um_com_o_seu_servico(self):
+        ana, bruno = self._por_hora('CORTE')['10:00']
+        self.assertEqual((ana['servico_id'], ana['duracao_minutos'], ana['preco']), (self.corte_ana.id, 30, '50.00'))
+        self.assertEqual((bruno['servico_id'], bruno['duracao_minutos'], bruno['preco']), (self.corte_bruno.id, 90, '70.00'))
+
+    def test_servico_que_ninguem_oferece(self):
+        resposta = self.client.get(reverse('api_horarios_qualquer_profissional'), {'servico': 'Luzes', 'data': self.dia.isoformat()})
+        self.assertEqual(resposta.json()['erro'], 'Nenhum profissional oferece este serviço.')
+
+
+@override_settings(STORAGES=STORAGES_TESTE)
+class CacheDisponibilidadeTest(TestCase):
+    """Invalidação do cache de horários no commit e contadores de acerto/erro."""
+
+    def setUp(self):
+        cache.clear()
+        zerar_estatisticas()
+        self.profissional = User.objects.create(username='prof', tipo='CABELEIREIRO')
+        self.servico = Servico.objects.create(profissional=self.profissional, nome='Corte', preco=50, duracao_minutos=30)
+        self.dia = proximo_dia_util(2)
+
+    def _horarios(self):
+        return self.client.get(reverse('api_horarios_disponiveis'), {
+            'profissional_id': self.profissional.id, 'servico_id': self.servico.id, 'data': self.dia.isoformat(),
+        }).json()['horarios']
+
+    def test_conta_acertos_e_erros(self):
+        self._horarios()
+        self._horarios()
+        self._horarios()
+        self.assertEqual(estatisticas_cache(), {'hits': 2, 'misses': 1, 'taxa_acerto': 0.6667})
+
+    def test_gravacao_invalida_de_novo_no_commit(self):
+        self.assertIn('10:00', self._horarios())
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Agendamento.objects.create(
+                cliente=User.objects.create(username='cliente'), profissional=self.profissional, servico=self.servico,
+                data_hora_inicio=timezone.make_aware(datetime.combine(self.dia, time(10, 0))),
+            )
+            # Leitura concorrente antes do commit: guarda na versão nova a agenda antiga
+            obter_disponibilidade(self.profissional.id, self.dia, 30, lambda: {'inicios': [10 * 60]})
+            self.assertIn('10:00', self._horarios())
+
+        # O commit troca a versão de novo e o horário marcado some
+        versao = versao_agenda(self.profissional.id)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(versao_agenda(self.profissional.id), versao)
+        self.assertNotIn('10:00', self._horarios())
+
+    def test_mudanca_no_expediente_invalida_no_commit(self):
+        self.assertIn('09:00', self._horarios())
+        with self.captureOnCommitCallbacks(execute=True):
+            HorarioTrabalho.objects.filter(profissional=self.profissional, dia_semana=self.dia.weekday()).update(
+                hora_inicio=time(10, 0)
+            )
+            horario = HorarioTrabalho.objects.get(profissional=self.profissional, dia_semana=self.dia.weekday())
+            horario.save()
+        self.assertEqual(self._horarios()[0], '10:00')
+
+
+class ResumoDiarioTest(TestCase):
+    """O resumo diário precisa bater com a soma direta dos agendamentos."""
+
+    def setUp(self):
+        self.profissional = User.objects.create(username='prof', tipo='CABELEIREIRO')
+        self.cliente = User.objects.create(username='cliente')
+        self.servico = Servico.objects.create(profissional=self.profissional, nome='Corte', preco=50, duracao_minutos=30)
+        self.dia = proximo_dia_util(2)
+        self.outro_dia = proximo_dia_util((self.dia - timezone.localdate()).days + 1)
+
+    def _agendar(self, dia, hora, status='AGENDADO', servico=None):
+        return Agendamento.objects.create(
+            cliente=self.cliente, profissional=self.profissional, servico=servico or self.servico, status=status,
+            data_hora_inicio=timezone.make_aware(datetime.combine(dia, time(hora, 0))),
+        )
+
+    def _assertBateComOsAgendamentos(self, dia):
+        bruto = Agendamento.objects.filter(
+            profissional=self.profissional,
+            data_hora_inicio__gte=meia_noite(dia),
+            data_hora_inicio__lt=meia_noite(dia + timedelta(days=1)),
+        ).order_by().aggregate(**AGREGACOES)
+        resumo = ResumoDiario.objects.filter(profissional=self.profissional, data=dia).first()
+        if not bruto['total_agendamentos']:
+            self.assertIsNone(resumo)
+            return
+        self.assertEqual({campo: getattr(resumo, campo) for campo in AGREGACOES},
+                         {campo: valor or 0 for campo, valor in bruto.items()})
+
+    def _estragar_resumos(self):
+        ResumoDiario.objects.filter(profissional=self.profissional).update(faturamento=999, total_agendamentos=99)
+
+    def test_mudanca_de_status(self):
+        agendamento = self._agendar(self.dia, 10)
+        self._agendar(self.dia, 11, status='CANCELADO')
+        self._assertBateComOsAgendamentos(self.dia)
+
+        agendamento.status = 'CONCLUIDO'
+        agendamento.save()
+        self._assertBateComOsAgendamentos(self.dia)
+        resumo = ResumoDiario.objects.get(profissional=self.profissional, data=self.dia)
+        self.assertEqual((resumo.faturamento, resumo.concluidos, resumo.cancelados), (50, 1, 1))
+
+    def test_mudanca_de_dia_recalcula_os_dois(self):
+        agendamento = self._agendar(self.dia, 10, status='CONCLUIDO')
+        self._agendar(self.dia, 14)
+
+        agendamento = Agendamento.objects.get(pk=agendamento.pk)
+        agendamento.data_hora_inicio = timezone.make_aware(datetime.combine(self.outro_dia, time(10, 0)))
+        agendamento.save()
+
+        self._assertBateComOsAgendamentos(self.dia)
+        self._assertBateComOsAgendamentos(self.outro_dia)
+        self.assertEqual(ResumoDiario.objects.get(profissional=self.profissional, data=self.dia).faturamento, 0)
+
+    def test_recalculo_trava_a_agenda_antes_de_somar(self):
+        agendamento = self._agendar(self.dia, 10)
+        versao = TravaAgenda.objects.get(profissional=self.profissional).versao
+
+        with CaptureQueriesContext(connection) as consultas:
+            agendamento.status = 'CONCLUIDO'
+            agendamento.save()
+        sqls = [consulta['sql'] for consulta in consultas.captured_queries]
+        trava = next(i for i, sql in enumerate(sqls) if 'agendamento_travaagenda' in sql)
+        soma = next(i for i, sql in enumerate(sqls) if 'SUM(' in sql)
+        self.assertLess(trava, soma)
+        self.assertEqual(TravaAgenda.objects.get(profissional=self.profissional).versao, versao + 1)
+
+    def test_apagar_o_ultimo_do_dia_apaga_o_resumo(self):
+        agendamento = self._agendar(self.dia, 10)
+        agendamento.delete()
+        self.assertFalse(ResumoDiario.objects.filter(profissional=self.profissional).exists())
+
+    def test_reconstruir_respeita_o_periodo(self):
+        self._agendar(self.dia, 10, status='CONCLUIDO')
+        self._agendar(self.outro_dia, 10, status='CONCLUIDO')
+        self._estragar_resumos()
+
+        self.assertEqual(reconstruir_resumos([self.profissional.id], desde=self.dia, ate=self.dia), 1)
+        self._assertBateComOsAgendamentos(self.dia)
+        # Fora do período o resumo não é tocado
+        self.assertEqual(ResumoDiario.objects.get(profissional=self.profissional, data=self.outro_dia).faturamento, 999)
+
+        reconstruir_resumos([self.profissional.id], desde=self.outro_dia)
+        self._assertBateComOsAgendamentos(self.outro_dia)
+
+    def test_preco_do_servico_alterado(self):
+        self._agendar(self.dia, 10, status='CONCLUIDO')
+        self._agendar(self.outro_dia, 10, status='CONCLUIDO')
+
+        servico = Servico.objects.get(pk=self.servico.pk)
+        servico.preco = 80
+        servico.duracao_minutos = 45
+        servico.save()
+
+        self._assertBateComOsAgendamentos(self.dia)
+        self._assertBateComOsAgendamentos(self.outro_dia)
+        self.assertEqual(ResumoDiario.objects.get(profissional=self.profissional, data=self.dia).faturamento, 80)
+
+    def test_preco_alterado_so_reconstroi_os_dias_do_servico(self):
+        barba = Servico.objects.create(profissional=self.profissional, nome='Barba', preco=30, duracao_minutos=30)
+        self._agendar(self.dia, 10, status='CONCLUIDO')
+        self._agendar(self.outro_dia, 10, status='CONCLUIDO', servico=barba)
+        self._estragar_resumos()
+
+        servico = Servico.objects.get(pk=self.servico.pk)
+        servico.preco = 80
+        servico.save()
+
+        self._assertBateComOsAgendamentos(self.dia)
+        self.assertEqual(ResumoDiario.objects.get(profissional=self.profissional, data=self.outro_dia).faturamento, 999)
+
+    def test_servico_sem_mudanca_de_preco_nao_reconstroi(self):
+        self._agendar(self.dia, 10, status='CONCLUIDO')
+        self._estragar_resumos()
+
+        servico = Servico.objects.get(pk=self.servico.pk)
+        servico.nome = 'Corte masculino'
+        servico.save()
+        self.assertEqual(ResumoDiario.objects.get(profissional=self.profissional, data=self.dia).faturamento, 999)
+
+    def test_servico_apagado(self):
+        outro = Servico.objects.create(profissional=self.profissional, nome='Barba', preco=30, duracao_minutos=30)
+        self._agendar(self.dia, 10, status='CONCLUIDO')
+        self._agendar(self.dia, 11, status='CONCLUIDO', servico=outro)
+
+        self.servico.delete()
+
+        self._assertBateComOsAgendamentos(self.dia)
+        resumo = ResumoDiario.objects.get(profissional=self.profissional, data=self.dia)
+        self.assertEqual((resumo.faturamento, resumo.concluidos), (30, 2))
+
+
+@override_settings(STORAGES=STORAGES_TESTE)
+class PaginacaoPorChaveTest(TestCase):
+    """Paginação por (data_hora_inicio, id): empates, última página e cursor inválido."""
+
+    def setUp(self):
+        self.cliente = User.objects.create(username='cliente')
+        profissional = User.objects.create(username='prof', tipo='CABELEIREIRO')
+        servico = Servico.objects.create(profissional=profissional, nome='Corte', preco=50, duracao_minutos=30)
+        inicio = timezone.make_aware(datetime.combine(proximo_dia_util(2), time(10, 0)))
+        # Cinco no mesmo horário (só o id desempata) e dois antes
+        inicios = [inicio] * 5 + [inicio - timedelta(days=1), inicio - timedelta(days=2)]
+        self.agendamentos = [
+            Agendamento.objects.create(cliente=self.cliente, profissional=profissional, servico=servico,
+                                       data_hora_inicio=momento, status='CANCELADO')
+            for momento in inicios
+        ]
+
+    def _todas_as_paginas(self, decrescente):
+        ids, cursor, paginas = [], None, 0
+        while True:
+            itens, cursor = paginar_por_chave(
+                Agendamento.objects.filter(cliente=self.cliente), cursor, tamanho=2, decrescente=decrescente
+            )
+            ids += [item.id for item in itens]
+            paginas += 1
+            if cursor is None:
+                return ids, paginas
+
+    def test_empates_desfeitos_pelo_id(self):
+        esperado = sorted(self.agendamentos, key=lambda a: (a.data_hora_inicio, a.id))
+
+        ids, paginas = self._todas_as_paginas(decrescente=False)
+        self.assertEqual(ids, [a.id for a in esperado])
+        self.assertEqual(paginas, 4)
+
+        ids, _ = self._todas_as_paginas(decrescente=True)
+        self.assertEqual(ids, [a.id for a in reversed(esperado)])
+
+    def test_ultima_pagina_sem_proximo_cursor(self):
+        itens, cursor = paginar_por_chave(Agendamento.objects.filter(cliente=self.cliente), tamanho=7)
+        self.assertEqual((len(itens), cursor), (7, None))
+
+        itens, cursor = paginar_por_chave(Agendamento.objects.filter(cliente=self.cliente), tamanho=6)
+        self.assertEqual(decodificar_cursor(cursor), (itens[-1].data_hora_inicio, itens[-1].id))
+        itens, cursor = paginar_por_chave(Agendamento.objects.filter(cliente=self.cliente), cursor, tamanho=6)
+        self.assertEqual((len(itens), cursor), (1, None))
+
+    def test_api_percorre_o_historico(self):
+        self.client.force_login(self.cliente)
+        ids, cursor = [], ''
+        while cursor is not None:
+            dados = self.client.get(reverse('api_historico_agendamentos'), {
+                'filtro': 'cancelados', 'tamanho': 3, 'cursor': cursor,
+            }).json()
+            ids += [item['id'] for item in dados['agendamentos']]
+            cursor = dados['proximo_cursor']
+        self.assertEqual(sorted(ids), sorted(a.id for a in self.agendamentos))
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_cursor_invalido_devolve_400(self):
+        self.client.force_login(self.cliente)
+        lixo = ['lixo!', 'bm9uc2Vuc2U', codificar_cursor(timezone.now(), 1)[:-3], '_-_-', '//8']
+        for cursor in lixo:
+            with self.subTest(cursor=cursor):
+                resposta = self.client.get(reverse('api_historico_agendamentos'), {'cursor': cursor})
+                self.assertEqual(resposta.status_code, 400)
+                self.assertEqual(resposta.json(), {'erro': 'Cursor inválido.'})
+
+
+class AgendaFuturaApiTest(TestCase):
+    """api_agenda_futura: agrupamento por dia/semana, cursor e respostas de erro."""
+
+    def setUp(self):
+        self.profissional = User.objects.create(username='prof', tipo='CABELEIREIRO')
+        self.cliente = User.objects.create(username='cliente', first_name='Ana', last_name='Souza')
+        servico = Servico.objects.create(profissional=self.profissional, nome='Corte', preco=50, duracao_minutos=30)
+        hoje = timezone.localdate()
+        # Segunda-feira entre amanhã e daqui a uma semana: as semanas ficam previsíveis
+        self.segunda = hoje + timedelta(days=7 - hoje.weekday())
+        datas = [
+            (self.segunda, time(10, 0)), (self.segunda, time(11, 0)),
+            (self.segunda + timedelta(days=1), time(10, 0)),
+            (self.segunda + timedelta(days=7), time(10, 0)),
+            (self.segunda + timedelta(days=9), time(15, 0)),
+        ]
+        self.agendamentos = [
+            Agendamento.objects.create(cliente=self.cliente, profissional=self.profissional, servico=servico,
+                                       data_hora_inicio=timezone.make_aware(datetime.combine(data, hora)))
+            for data, hora in datas
+        ]
+        # Fora da agenda futura: hoje e de outro profissional
+        Agendamento.objects.create(cliente=self.cliente, profissional=self.profissional, servico=servico,
+                                   data_hora_inicio=timezone.make_aware(datetime.combine(hoje, time(10, 0))))
+        outro = User.objects.create(username='outro', tipo='CABELEIREIRO')
+        Agendamento.objects.create(cliente=self.cliente, profissional=outro,
+                                   servico=Servico.objects.create(profissional=outro, nome='Barba', preco=30, duracao_minutos=30),
+                                   data_hora_inicio=self.agendamentos[0].data_hora_inicio)
+        self.client.force_login(self.profissional)
+
+    def _get(self, **params):
+        return self.client.get(reverse('api_agenda_futura'), params)
+
+    def test_agrupa_por_dia(self):
+        dados = self._get().json()
+        self.assertEqual(dados['agrupar'], 'dia')
+        self.assertIsNone(dados['proximo_cursor'])
+        self.assertEqual([grupo['data'] for grupo in dados['grupos']], [
+            self.segunda.isoformat(), (self.segunda + timedelta(days=1)).isoformat(),
+            (self.segunda + timedelta(days=7)).isoformat(), (self.segunda + timedelta(days=9)).isoformat(),
+        ])
+        primeiro = dados['grupos'][0]['itens']
+        self.assertEqual([item['hora'] for item in primeiro], ['10:00', '11:00'])
+        self.assertEqual(
+            (primeiro[0]['id'], primeiro[0]['cliente'], primeiro[0]['cliente_id'], primeiro[0]['servico']),
+            (self.agendamentos[0].id, 'Ana Souza', self.cliente.id, 'Corte'),
+        )
+
+    def test_agrupa_por_semana_na_segunda_feira(self):
+        dados = self._get(agrupar='semana').json()
+        self.assertEqual(
+            [(grupo['data'], len(grupo['itens'])) for grupo in dados['grupos']],
+            [(self.segunda.isoformat(), 3), ((self.segunda + timedelta(days=7)).isoformat(), 2)],
+        )
+
+    def test_cursor_continua_sem_repetir_nem_pular(self):
+        ids, datas, cursor, paginas = [], [], '', 0
+        while cursor is not None:
+            dados = self._get(agrupar='semana', tamanho=2, cursor=cursor).json()
+            for grupo in dados['grupos']:
+                datas.append(grupo['data'])
+                ids += [item['id'] for item in grupo['itens']]
+            cursor = dados['proximo_cursor']
+            paginas += 1
+        self.assertEqual(paginas, 3)
+        self.assertEqual(ids, [a.id for a in self.agendamentos])
+        # A semana da primeira segunda continua na página seguinte com a mesma 'data'
+        self.assertEqual(datas[:2], [self.segunda.isoformat()] * 2)
+
+    def test_cliente_recebe_403(self):
+        self.client.force_login(self.cliente)
+        resposta = self._get()
+        self.assertEqual(resposta.status_code, 403)
+        self.assertEqual(resposta.json(), {'erro': 'Acesso negado.'})
+
+    def test_agrupamento_invalido_devolve_400(self):
+        resposta = self._get(agrupar='mes')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.json(), {'erro': 'Agrupamento inválido.'})
+
+    def test_cursor_adulterado_devolve_400(self):
+        cursor = self._get(tamanho=2).json()['proximo_cursor']
+        for adulterado in (cursor[:8], 'lixo!', 'bm9uc2Vuc2U'):
+            with self.subTest(cursor=adulterado):
+                resposta = self._get(cursor=adulterado)
+                self.assertEqual(resposta.status_code, 400)
+                self.assertEqual(resposta.json(), {'erro': 'Cursor inválido.'})
+
+
+class HistoricoClienteCondicionalTest(TestCase):
+    """O prontuário responde 304 enquanto nada muda e 200 depois de uma anotação."""
+
+    def setUp(self):
+        self.profissional = User.objects.create(username='prof', tipo='CABELEIREIRO')
+        cliente = User.objects.create(username='cliente')
+        self.servico = Servico.objects.create(profissional=self.profissional, nome='Corte', preco=50, duracao_minutos=30)
+        self.corte = Agendamento.objects.create(
+            cliente=cliente, profissional=self.profissional, servico=self.servico, status='CONCLUIDO',
+            data_hora_inicio=timezone.now() - timedelta(days=3), anotacoes='Máquina 2',
+        )
+        self.url = reverse('api_historico_cliente', args=[cliente.id])
+        self.client.force_login(self.profissional)
+
+    def test_revalidacao_com_etag(self):
+        primeira = self.client.get(self.url)
+        self.assertEqual(primeira.status_code, 200)
+        etag = primeira['ETag']
+        self.assertIn('Last-Modified', primeira)
+
+        repetida = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(repetida.status_code, 304)
+        self.assertEqual(repetida.content, b'')
+        self.assertEqual(repetida['ETag'], etag)
+
+        self.corte.anotacoes = 'Máquina 1 nas laterais'
+        self.corte.save()
+        depois = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(depois.status_code, 200)
+        self.assertNotEqual(depois['ETag'], etag)
+        self.assertEqual(depois.json()['historico'][0]['nota'], 'Máquina 1 nas laterais')
+
+    def test_servico_renomeado_muda_a_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        Servico.objects.filter(pk=self.servico.pk).update(nome='Corte degradê')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(STORAGES=STORAGES_TESTE, MEDIA_ROOT=MEDIA_TESTE)
+class VariantesImagemTest(TestCase):
+    """Miniaturas WebP/JPEG geradas pelo Pillow a partir do arquivo enviado."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_TESTE, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.profissional = User.objects.create(username='prof', tipo='CABELEIREIRO')
+
+    def _foto(self, tamanho, modo='RGB', conteudo=None):
+        if conteudo is None:
+            buffer = BytesIO()
+            Image.new(modo, tamanho, (200, 30, 30, 128) if modo == 'RGBA' else 'red').save(buffer, 'PNG')
+            conteudo = buffer.getvalue()
+        return Portfolio.objects.create(
+            profissional=self.profissional, imagem=SimpleUploadedFile('foto.png', conteudo, content_type='image/png')
+        ).imagem
+
+    def _abrir(self, campo, caminho):
+        with campo.storage.open(caminho) as arquivo:
+            imagem = Image.open(arquivo)
+            imagem.load()
+        return imagem
+
+    def test_larguras_e_formatos(self):
+        campo = self._foto((800, 600), modo='RGBA')
+        variantes = gerar_variantes(campo, LARGURAS_PORTFOLIO)
+
+        self.assertEqual(set(variantes), {'webp', 'jpg'})
+        for extensao, formato in (('webp', 'WEBP'), ('jpg', 'JPEG')):
+            self.assertEqual(sorted(variantes[extensao], key=int), ['160', '640'])
+            for largura, caminho in variantes[extensao].items():
+                imagem = self._abrir(campo, caminho)
+                self.assertEqual((imagem.format, imagem.width, imagem.height), (formato, int(largura), int(largura) * 3 // 4))
+                self.assertEqual(imagem.mode, 'RGB')
+
+    def test_nao_amplia_imagem_pequena(self):
+        campo = self._foto((100, 80))
+        variantes = gerar_variantes(campo, LARGURAS_PORTFOLIO)
+        # Só a menor largura, no tamanho original
+        self.assertEqual(list(variantes['jpg']), ['100'])
+
+    def test_avatar_quadrado(self):
+        campo = self._foto((300, 200))
+        variantes = gerar_variantes(campo, LARGURAS_AVATAR, quadrado=True)
+        # 240 passa do lado menor (200) e é pulada
+        self.assertEqual(list(variantes['webp']), ['120'])
+        self.assertEqual(self._abrir(campo, variantes['webp']['120']).size, (120, 120))
+
+    def test_arquivo_corrompido(self):
+        campo = self._foto(None, conteudo=b'isto nao e uma imagem')
+        self.assertEqual(gerar_variantes(campo, LARGURAS_PORTFOLIO), {})
+
+        # Sem variações o template cai para o original
+        responsiva = ImagemResponsiva(campo, {})
+        self.assertEqual((responsiva.src, responsiva.src_webp, responsiva.srcset), (campo.url, campo.url, ''))
+
+
+class ViewsAsyncTest(TestCase):
+    """As APIs async devolvem exatamente o mesmo JSON das versões sync."""
+
+    def setUp(self):
+        self.profissional = User.objects.create(username='prof', tipo='CABELEIREIRO')
+        self.servico = Servico.objects.create(profissional=self.profissional, nome='Corte', preco=50, duracao_minutos=60)
+        Servico.objects.create(profissional=self.profissional, nome='Barba', preco='35.50', duracao_minutos=30)
+        Servico.objects.create(profissional=self.profissional, nome='Antigo', preco=10, duracao_minutos=30, ativo=False)
+        self.dia = proximo_dia_util(2)
+        Agendamento.objects.create(
+            cliente=User.objects.create(username='cliente'), profissional=self.profissional, servico=self.servico,
+            data_hora_inicio=timezone.make_aware(datetime.combine(self.dia, time(10, 0))),
+        )
+
+    def _comparar(self, view_sync, view_async, caminho, *args, **params):
+        cache.clear()
+        sync = view_sync(RequestFactory().get(caminho, params), *args)
+        cache.clear()
+        assincrona = async_to_sync(view_async)(AsyncRequestFactory().get(caminho, params), *args)
+        self.assertEqual((assincrona.status_code, json.loads(assincrona.content)), (sync.status_code, json.loads(sync.content)))
+        return json.loads(sync.content)
+
+    def test_horarios_disponiveis(self):
+        casos = {
+            'dia com agendamento': {'data': self.dia.isoformat()},
+            'domingo': {'data': (self.dia + timedelta(days=6 - self.dia.weekday())).isoformat()},
+            'serviço inválido': {'data': self.dia.isoformat(), 'servico_id': 0},
+            'sem data': {},
+        }
+        for nome, params in casos.items():
+            with self.subTest(nome):
+                params = {'profissional_id': self.profissional.id, 'servico_id': self.servico.id, **params}
+                self._comparar(views.get_horarios_disponiveis, views_async.get_horarios_disponiveis,
+                               '/agendamento/api/horarios-disponiveis/', **params)
+
+        dados = self._comparar(views.get_horarios_disponiveis, views_async.get_horarios_disponiveis,
+                               '/agendamento/api/horarios-disponiveis/', profissional_id=self.profissional.id,
+                               servico_id=self.servico.id, data=self.dia.isoformat())
+        self.assertIn('09:00', dados['horarios'])
+        self.assertNotIn('10:00', dados['horarios'])
+
+    def test_servicos_por_profissional(self):
+        dados = self._comparar(views.api_get_servicos_por_profissional, views_async.api_get_servicos_por_profissional,
+                               f'/agendamento/api/servicos/{self.profissional.id}/', self.profissional.id)
+        self.assertEqual(sorted(servico['nome'] for servico in dados['servicos']), ['Barba', 'Corte'])
+
+
+@override_settings(METRICAS_TOKEN='segredo')
+class MetricasTest(TestCase):
+    """Endpoint /metrics: acesso por token ou equipe, e o que cada requisição registra."""
+
+    def setUp(self):
+        zerar_metricas()
+        self.url = reverse('metricas')
+
+    def test_token_bearer(self):
+        resposta = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+        for cabecalho in ('Bearer errado', 'segredo', 'Bearer segredo2', ''):
+            with self.subTest(cabecalho=cabecalho):
+                self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION=cabecalho).status_code, 302)
+
+    @override_settings(METRICAS_TOKEN='')
+    def test_token_vazio_nao_libera(self):
+        for cabecalho in ('Bearer ', 'Bearer', ''):
+            with self.subTest(cabecalho=cabecalho):
+                self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION=cabecalho).status_code, 302)
+
+    def test_so_equipe_logada(self):
+        self.client.force_login(User.objects.create(username='cliente'))
+        resposta = self.client.get(self.url)
+        self.assertEqual(resposta.status_code, 302)
+        self.assertTrue(resposta['Location'].startswith(reverse('admin:login')))
+
+        self.client.force_login(User.objects.create(username='equipe', is_staff=True))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_requisicao_aparece_nas_metricas(self):
+        profissional = User.objects.create(username='prof', tipo='CABELEIREIRO')
+        Servico.objects.create(profissional=profissional, nome='Corte', preco=50, duracao_minutos=30)
+
+        resposta = self.client.get(reverse('api_servicos', args=[profissional.id]))
+        consultas = resposta.medicao_consultas.quantidade
+        self.assertEqual(consultas, 1)
+
+        linhas = exportar_metricas().splitlines()
+        self.assertIn(f'salao_consultas_por_requisicao_sum{{view="api_servicos"}} {consultas}', linhas)
+        self.assertIn('salao_consultas_por_requisicao_count{view="api_servicos"} 1', linhas)
+        self.assertIn('salao_consultas_por_requisicao_bucket{view="api_servicos",le="0"} 0', linhas)
+        self.assertIn('salao_consultas_por_requisicao_bucket{view="api_servicos",le="1"} 1', linhas)
+        self.assertIn('salao_requisicao_segundos_count{view="api_servicos"} 1', linhas)
+        # E chega ao Prometheus pelo endpoint
+        self.assertIn('salao_requisicao_segundos_count{view="api_servicos"} 1',
+                      self.client.get(self.url, HTTP_AUTHORIZATION='Bearer segredo').content.decode())
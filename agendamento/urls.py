@@ -1,5 +1,10 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, views_async
+
+# No perfil ASGI (APIS_ASYNC=True) as APIs chamadas em rajada pelo formulário de
+# agendamento usam as versões async; no WSGI continuam as sync
+apis = views_async if settings.APIS_ASYNC else views
 
 urlpatterns = [
     path('novo/', views.novo_agendamento, name='novo_agendamento'),
@@ -13,11 +18,20 @@ urlpatterns = [
     
     # APIs (já existiam)
     path('api/historico/<int:cliente_id>/', views.obter_historico_cliente, name='api_historico_cliente'),
-    path('api/horarios-disponiveis/', views.get_horarios_disponiveis, name='api_horarios_disponiveis'),
-    path('api/servicos/<int:profissional_id>/', views.api_get_servicos_por_profissional, name='api_servicos'),
+    path('api/meus-agendamentos/', views.api_historico_agendamentos, name='api_historico_agendamentos'),
+    path('api/agenda-futura/', views.api_agenda_futura, name='api_agenda_futura'),
+    path('api/agenda-periodo/', views.api_agenda_periodo, name='api_agenda_periodo'),
+    path('api/horarios-disponiveis/', apis.get_horarios_disponiveis, name='api_horarios_disponiveis'),
+    path('api/proximos-horarios/', views.get_proximos_horarios, name='api_proximos_horarios'),
+    path('api/validar-horarios/', views.api_validar_horarios, name='api_validar_horarios'),
+    path('api/horarios-qualquer-profissional/', views.get_horarios_qualquer_profissional, name='api_horarios_qualquer_profissional'),
+    path('api/servicos/<int:profissional_id>/', apis.api_get_servicos_por_profissional, name='api_servicos'),
+    path('api/cache-disponibilidade/', views.api_estatisticas_cache, name='api_estatisticas_cache'),
 
     # --- AS NOVAS ROTAS QUE FALTAVAM ---
     path('configurar-horarios/', views.configurar_horarios, name='configurar_horarios'),
+    path('configurar-horarios/excecoes/nova/', views.adicionar_excecao_horario, name='adicionar_excecao_horario'),
+    path('configurar-horarios/excecoes/<int:excecao_id>/remover/', views.remover_excecao_horario, name='remover_excecao_horario'),
     path('meus-servicos/', views.gerenciar_servicos, name='gerenciar_servicos'), # <--- ESSA AQUI RESOLVE O ERRO
     
     # Rotas de Portfolio
@@ -25,5 +39,7 @@ urlpatterns = [
     path('portfolio/delete/<int:foto_id>/', views.deletar_foto_portfolio, name='deletar_foto_portfolio'),
 
     path('cancelar/<int:agendamento_id>/', views.cancelar_agendamento, name='cancelar_agendamento'),
+    path('serie/<int:serie_id>/cancelar/', views.cancelar_serie, name='cancelar_serie'),
+    path('serie/<int:serie_id>/editar/', views.editar_serie, name='editar_serie'),
 
 ]
\ No newline at end of file
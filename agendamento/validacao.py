@@ -0,0 +1,146 @@
+"""
+Validação de vários horários candidatos de uma vez.
+
+O clean() do Agendamento valida um candidato por vez: busca o serviço, a regra do
+dia e faz um `exists()` de conflito. Para uma lista de propostas (remarcar
+arrastando na agenda, sugestões de combos) isso multiplica as consultas. Aqui
+tudo é buscado em lote: serviços e profissionais com `in_bulk`, o expediente pelo
+cache (expediente.py) e os agendamentos que podem conflitar numa única consulta
+por janela de cada profissional. As mensagens são as mesmas do clean().
+"""
+from bisect import bisect_left
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils import timezone
+
+from .disponibilidade import STATUS_OCUPAM_AGENDA, mensagem_conflito, mensagem_sem_agenda, validar_expediente
+from .expediente import obter_expedientes
+from .models import Agendamento, Servico
+
+User = get_user_model()
+
+MENSAGEM_ENTRE_SI = "Conflita com outro horário da mesma lista."
+
+# Marca, na agenda em memória, os intervalos que vieram da própria lista de candidatos
+DA_LISTA = object()
+
+
+class AgendaOcupada:
+    """
+    Agendamentos de um profissional ordenados pelo início, com o maior fim
+    acumulado: a busca de conflito para assim que nenhum anterior pode mais
+    invadir o intervalo.
+    """
+
+    def __init__(self, ocupados):
+        self.itens = sorted(ocupados, key=lambda item: item[1])
+        self.inicios = [inicio for _, inicio, _ in self.itens]
+        self.maior_fim = []
+        maior = None
+        for _, _, fim in self.itens:
+            maior = fim if maior is None or fim > maior else maior
+            self.maior_fim.append(maior)
+
+    def conflito(self, inicio, fim, excluir=None):
+        """
+        Id do agendamento que cruza [inicio, fim), DA_LISTA se só um candidato
+        aceito antes cruza, ou None se está livre.
+        """
+        encontrado = None
+        j = bisect_left(self.inicios, fim) - 1
+        while j >= 0 and self.maior_fim[j] > inicio:
+            agendamento_id, _, fim_ocupado = self.itens[j]
+            if fim_ocupado > inicio and (excluir is None or agendamento_id != excluir):
+                if agendamento_id is not DA_LISTA:
+                    return agendamento_id
+                encontrado = DA_LISTA
+            j -= 1
+        return encontrado
+
+    def incluir(self, inicio, fim):
+        """Acrescenta um candidato já aceito (para validar a lista contra ela mesma)."""
+        self.__init__(self.itens + [(DA_LISTA, inicio, fim)])
+
+
+def _normalizar(candidato):
+    profissional_id, servico_id, inicio, *resto = candidato
+    return profissional_id, servico_id, inicio, (resto[0] if resto else None)
+
+
+def validar_em_lote(candidatos, entre_si=False):
+    """
+    Valida candidatos `(profissional_id, servico_id, inicio)` ou
+    `(profissional_id, servico_id, inicio, agendamento_id)`. O quarto item é o
+    agendamento sendo remarcado, que não conflita consigo mesmo.
+
+    Com `entre_si`, cada candidato aceito passa a ocupar a agenda dos seguintes
+    (combos marcados juntos). Devolve, na mesma ordem, dicts com `valido`,
+    `erro` (a mensagem do clean() ou None) e `fim`.
+    """
+    candidatos = [_normalizar(candidato) for candidato in candidatos]
+    if not candidatos:
+        return []
+
+    servicos = Servico.objects.in_bulk({servico_id for _, servico_id, _, _ in candidatos})
+    profissionais = User.objects.in_bulk({profissional_id for profissional_id, _, _, _ in candidatos})
+    expedientes = obter_expedientes(list(profissionais))
+
+    # Janela de cada profissional (do primeiro início ao último fim) numa consulta só
+    janelas = {}
+    for profissional_id, servico_id, inicio, _ in candidatos:
+        servico = servicos.get(servico_id)
+        if profissional_id not in profissionais or servico is None:
+            continue
+        fim = inicio + timedelta(minutes=servico.duracao_minutos)
+        menor, maior = janelas.get(profissional_id, (inicio, fim))
+        janelas[profissional_id] = (min(menor, inicio), max(maior, fim))
+
+    ocupados = {profissional_id: [] for profissional_id in janelas}
+    if janelas:
+        filtro = Q()
+        for profissional_id, (menor, maior) in janelas.items():
+            filtro |= Q(profissional_id=profissional_id, data_hora_inicio__lt=maior, data_hora_fim__gt=menor)
+        for agendamento_id, profissional_id, inicio, fim in Agendamento.objects.filter(
+            filtro, status__in=STATUS_OCUPAM_AGENDA
+        ).values_list('id', 'profissional_id', 'data_hora_inicio', 'data_hora_fim'):
+            ocupados[profissional_id].append((agendamento_id, inicio, fim))
+    agendas = {profissional_id: AgendaOcupada(itens) for profissional_id, itens in ocupados.items()}
+
+    resultados = []
+    for profissional_id, servico_id, inicio, excluir in candidatos:
+        servico = servicos.get(servico_id)
+        profissional = profissionais.get(profissional_id)
+        if profissional is None:
+            resultados.append({'valido': False, 'erro': "Profissional inválido.", 'fim': None})
+            continue
+        if servico is None:
+            resultados.append({'valido': False, 'erro': "Serviço inválido.", 'fim': None})
+            continue
+
+        fim = inicio + timedelta(minutes=servico.duracao_minutos)
+        erro = _validar(expedientes[profissional_id], profissional, agendas[profissional_id], inicio, fim, excluir)
+        if erro is None and entre_si:
+            agendas[profissional_id].incluir(inicio, fim)
+        resultados.append({'valido': erro is None, 'erro': erro, 'fim': fim})
+    return resultados
+
+
+def _validar(expediente, profissional, agenda, inicio, fim, excluir):
+    """Mesma sequência do Agendamento.clean(): regra do dia, expediente e conflitos."""
+    inicio_local = timezone.localtime(inicio)
+    horario = expediente.regra(inicio_local.date())
+    if horario is None:
+        return mensagem_sem_agenda(inicio_local)
+    try:
+        validar_expediente(horario, inicio, fim)
+    except ValidationError as erro:
+        return erro.messages[0]
+    conflito = agenda.conflito(inicio, fim, excluir)
+    if conflito is DA_LISTA:
+        return MENSAGEM_ENTRE_SI
+    if conflito is not None:
+        return mensagem_conflito(profissional)
+    return None
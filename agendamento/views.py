@@ -1,18 +1,43 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Sum
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Q, Sum
 from django.forms import modelformset_factory
-from .models import Agendamento, HorarioTrabalho, Servico, Portfolio
-from .forms import AgendamentoForm
+from .models import Agendamento, ExcecaoHorario, HorarioTrabalho, SerieAgendamento, Servico, Portfolio
+from .forms import AgendamentoForm, ExcecaoHorarioForm
+from .disponibilidade import (
+    HORIZONTE_MAXIMO_DIAS, HORIZONTE_PADRAO_DIAS, STATUS_OCUPAM_AGENDA,
+    agrupar_por_dia, aplicar_corte, formatar_minutos, gerar_inicios_livres,
+    gerar_slots, meia_noite, proximos_horarios_livres,
+)
+from .cache import estatisticas_cache, obter_disponibilidade
+from .expediente import obter_expediente, obter_expedientes, regra_do_dia
+from .reservas import reservar
+from .series import cancelar_serie as cancelar_ocorrencias, criar_serie, remarcar_serie
+from .validacao import validar_em_lote
+from .resumos import DIAS_MINIMOS_RESUMO, kpis_do_resumo
+from .paginacao import TAMANHO_PAGINA, paginar_por_chave, tamanho_pagina
 from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import http_date
+from django.template.loader import render_to_string
 from datetime import datetime, timedelta, time
+import hashlib
+import json
 from django.utils.timezone import make_aware 
 
-# IMPORTAÇÃO DA FUNÇÃO DE NOTIFICAÇÃO
-from notificacoes.utils import criar_notificacao
+from setup.replica import somente_leitura
+from setup.orcamento import orcamento_consultas
 
+# IMPORTAÇÃO DA FUNÇÃO DE NOTIFICAÇÃO (outbox: só enfileira, o worker entrega)
+from notificacoes.outbox import enfileirar_notificacao
+
+# Pior caso: primeira reserva do dia, quando o resumo diário ainda não existe e é criado
+@orcamento_consultas(27)
 @login_required
 def novo_agendamento(request):
     if request.method == 'POST':
@@ -20,27 +45,61 @@ def novo_agendamento(request):
         if form.is_valid():
             agendamento = form.save(commit=False)
             agendamento.cliente = request.user # Associa o cliente logado automaticamente
+
+            if form.cleaned_data.get('repetir'):
+                return _criar_serie(request, agendamento, form.cleaned_data)
             
             try:
-                # O full_clean() chama o clean() do model onde está nossa validação de horário
-                agendamento.full_clean() 
-                agendamento.save()
-                
                 # --- NOTIFICAÇÃO: AVISA O PROFISSIONAL ---
-                msg_prof = f"Novo agendamento: {request.user.first_name or request.user.username} marcou {agendamento.servico.nome} para {agendamento.data_hora_inicio.strftime('%d/%m às %H:%M')}."
-                criar_notificacao(agendamento.profissional, msg_prof, link='/agendamento/meus-agendamentos/')
+                def avisar_profissional(agendamento):
+                    msg_prof = f"Novo agendamento: {request.user.first_name or request.user.username} marcou {agendamento.servico.nome} para {agendamento.data_hora_inicio.strftime('%d/%m às %H:%M')}."
+                    enfileirar_notificacao(agendamento.profissional, msg_prof, link='/agendamento/meus-agendamentos/', chave=f'agendamento:{agendamento.pk}:novo')
                 # -----------------------------------------
 
+                # reservar() trava a agenda do profissional e roda o full_clean() + save()
+                # e o aviso na mesma transação, então dois clientes não levam o mesmo horário
+                reservar(agendamento, notificar=avisar_profissional)
+
                 messages.success(request, 'Agendamento realizado com sucesso!')
                 return redirect('listar_agendamentos')
+            except ValidationError as e:
+                # Horário ocupado, fora do expediente... (o formulário não valida a agenda)
+                messages.error(request, " ".join(e.messages))
             except Exception as e:
-                # Se der erro de validação (horário ocupado), aparece aqui
                 messages.error(request, e)
     else:
         form = AgendamentoForm()
 
     return render(request, 'agendamento/novo_agendamento.html', {'form': form})
 
+def _criar_serie(request, agendamento, dados):
+    """Agendamento recorrente: valida todas as datas de uma vez e grava a série numa transação."""
+    try:
+        # A série e o aviso ao profissional entram juntos (ou nenhum dos dois)
+        with transaction.atomic():
+            serie, colisoes = criar_serie(
+                request.user, agendamento.profissional, agendamento.servico, agendamento.data_hora_inicio,
+                dados.get('ocorrencias') or 4, dados['repetir'], pular_ocupadas=dados.get('pular_ocupadas'),
+            )
+            marcadas = serie.ocorrencias - len(colisoes)
+            msg_prof = (
+                f"Nova série: {request.user.first_name or request.user.username} marcou {marcadas} horários de "
+                f"{agendamento.servico.nome} ({serie.get_intervalo_semanas_display().lower()}, a partir de "
+                f"{timezone.localtime(serie.primeira_data).strftime('%d/%m às %H:%M')})."
+            )
+            enfileirar_notificacao(agendamento.profissional, msg_prof, link='/agendamento/meus-agendamentos/', chave=f'serie:{serie.pk}:nova')
+    except ValidationError as e:
+        messages.error(request, " ".join(e.messages))
+        return redirect('novo_agendamento')
+
+    if colisoes:
+        datas = ", ".join(timezone.localtime(inicio).strftime('%d/%m') for inicio, _ in colisoes)
+        messages.warning(request, f"{marcadas} datas marcadas. Ficaram de fora (horário ocupado): {datas}.")
+    else:
+        messages.success(request, f"Série com {marcadas} agendamentos realizada com sucesso!")
+    return redirect('listar_agendamentos')
+
+@orcamento_consultas(5)
 @login_required
 def listar_agendamentos(request):
     # SE FOR CABELEIREIRO, VAI PARA O DASHBOARD NOVO
@@ -48,12 +107,75 @@ def listar_agendamentos(request):
         return dashboard_profissional(request)
     
     # SE FOR CLIENTE, CONTINUA COM O HISTÓRICO PADRÃO
-    agendamentos = request.user.agendamentos_cliente.all().order_by('-data_hora_inicio')
+    # Só a primeira página vem no HTML; o resto chega pela API (rolagem infinita)
+    filtro = request.GET.get('filtro', 'todos')
+    if filtro not in FILTROS_HISTORICO:
+        filtro = 'todos'
+
+    agendamentos, proximo_cursor = _pagina_historico_cliente(request.user, filtro)
     return render(request, 'agendamento/listar_agendamentos.html', {
-        'agendamentos': agendamentos
+        'agendamentos': agendamentos,
+        'filtro': filtro,
+        'proximo_cursor': proximo_cursor,
+    })
+
+
+# Filtros do histórico do cliente: próximos em ordem crescente (o mais perto primeiro),
+# o resto do mais recente para o mais antigo
+FILTROS_HISTORICO = ('todos', 'proximos', 'passados', 'cancelados')
+
+
+def _pagina_historico_cliente(cliente, filtro, cursor=None, tamanho=TAMANHO_PAGINA):
+    agendamentos = Agendamento.objects.filter(cliente=cliente).select_related('servico', 'profissional')
+    agora = timezone.now()
+    decrescente = True
+
+    if filtro == 'proximos':
+        agendamentos = agendamentos.filter(status='AGENDADO', data_hora_inicio__gte=agora)
+        decrescente = False
+    elif filtro == 'passados':
+        agendamentos = agendamentos.filter(data_hora_inicio__lt=agora).exclude(status='CANCELADO')
+    elif filtro == 'cancelados':
+        agendamentos = agendamentos.filter(status='CANCELADO')
+
+    return paginar_por_chave(agendamentos, cursor, tamanho, decrescente=decrescente)
+
+
+@orcamento_consultas(3)
+@login_required
+def api_historico_agendamentos(request):
+    """
+    Próximas páginas do histórico do cliente (rolagem infinita).
+    Devolve os dados e também as linhas já renderizadas com o mesmo template da página.
+    """
+    filtro = request.GET.get('filtro', 'todos')
+    if filtro not in FILTROS_HISTORICO:
+        return JsonResponse({'erro': 'Filtro inválido.'}, status=400)
+
+    try:
+        agendamentos, proximo_cursor = _pagina_historico_cliente(
+            request.user, filtro, request.GET.get('cursor'), tamanho_pagina(request.GET.get('tamanho'))
+        )
+    except ValueError:
+        return JsonResponse({'erro': 'Cursor inválido.'}, status=400)
+
+    html = render_to_string('agendamento/_linhas_agendamentos.html', {'agendamentos': agendamentos}, request=request)
+    return JsonResponse({
+        'agendamentos': [{
+            'id': agenda.id,
+            'servico': agenda.servico.nome if agenda.servico else None,
+            'preco': agenda.servico.preco if agenda.servico else None,
+            'profissional': agenda.profissional.first_name or agenda.profissional.username,
+            'inicio': agenda.data_hora_inicio.isoformat(),
+            'fim': agenda.data_hora_fim.isoformat() if agenda.data_hora_fim else None,
+            'status': agenda.status,
+        } for agenda in agendamentos],
+        'html': html,
+        'proximo_cursor': proximo_cursor,
     })
 
 @login_required
+@somente_leitura
 def dashboard_profissional(request):
     # Garante que só cabeleireiros acessam
     if request.user.tipo != 'CABELEIREIRO':
@@ -62,18 +184,7 @@ def dashboard_profissional(request):
     hoje = timezone.localdate()
 
     # --- 1. CONFIGURAÇÃO DO FILTRO (DATA INICIO E FIM) ---
-    data_inicio_str = request.GET.get('data_inicio')
-    data_fim_str = request.GET.get('data_fim')
-
-    # Se vierem datas na URL, usa elas. Se não, usa "Hoje" como padrão.
-    if data_inicio_str and data_fim_str:
-        try:
-            data_inicio = datetime.strptime(data_inicio_str, "%Y-%m-%d").date()
-            data_fim = datetime.strptime(data_fim_str, "%Y-%m-%d").date()
-        except ValueError:
-            data_inicio = data_fim = hoje
-    else:
-        data_inicio = data_fim = hoje
+    data_inicio, data_fim = _periodo_do_dashboard(request, hoje)
 
     # --- 2. LÓGICA VISUAL DO BOTÃO ATIVO ---
     filtro_selecionado = 'personalizado'
@@ -89,30 +200,36 @@ def dashboard_profissional(request):
 
     # --- 3. BUSCA NO BANCO DE DADOS (KPIs e TABELA) ---
     # Busca agendamentos dentro do intervalo selecionado
-    agenda_periodo = Agendamento.objects.filter(
-        profissional=request.user,
-        data_hora_inicio__date__range=[data_inicio, data_fim]
-    ).order_by('data_hora_inicio')
-
-    # KPI: Faturamento do período (Soma apenas os CONCLUÍDOS)
-    faturamento = agenda_periodo.filter(status='CONCLUIDO').aggregate(Sum('servico__preco'))['servico__preco__sum'] or 0
+    agenda_periodo = _agenda_do_periodo(request.user, data_inicio, data_fim)
+
+    # KPIs numa única consulta (agregação condicional):
+    # - Faturamento do período (soma apenas os CONCLUÍDOS)
+    # - Total de atendimentos concluídos no período
+    # - Total geral na agenda (agendados + concluídos + cancelados) no período
+    # Períodos longos (semana, mês, ano) leem do resumo diário pré-calculado
+    if (data_fim - data_inicio).days >= DIAS_MINIMOS_RESUMO:
+        kpis = kpis_do_resumo(request.user, data_inicio, data_fim)
+    else:
+        kpis = agenda_periodo.order_by().aggregate(
+            faturamento=Sum('servico__preco', filter=Q(status='CONCLUIDO')),
+            atendimentos_periodo=Count('id', filter=Q(status='CONCLUIDO')),
+            total_agendados=Count('id'),
+        )
+    faturamento = kpis['faturamento'] or 0
+    atendimentos_periodo = kpis['atendimentos_periodo']
+    total_agendados = kpis['total_agendados']
 
-    # KPI: Total de atendimentos concluídos no período
-    atendimentos_periodo = agenda_periodo.filter(status='CONCLUIDO').count()
-    
-    # KPI: Total geral na agenda (agendados + concluídos + cancelados) no período
-    total_agendados = agenda_periodo.count()
+    # Tabela do período: só a primeira página vem no HTML, o resto chega pela
+    # api_agenda_periodo (um mês ou um ano de agenda deixava a página enorme)
+    primeira_pagina, proximo_cursor = paginar_por_chave(agenda_periodo, decrescente=False)
 
     # --- 4. AGENDAMENTOS FUTUROS (ACCORDION) ---
-    # Sempre mostra o que vem pela frente (Amanhã em diante), independente do filtro
-    agenda_futura = Agendamento.objects.filter(
-        profissional=request.user,
-        data_hora_inicio__date__gt=hoje
-    ).order_by('data_hora_inicio')
+    # Não vem mais no HTML: o accordion busca em páginas pela api_agenda_futura
+    # quando é aberto (quem tem meses de agenda pela frente deixava a página enorme)
 
     context = {
-        'agenda_periodo': agenda_periodo, # Nome usado na tabela principal
-        'agenda_futura': agenda_futura,   # Nome usado no accordion
+        'agenda_periodo': primeira_pagina, # Nome usado na tabela principal
+        'proximo_cursor': proximo_cursor,
         'faturamento': faturamento,
         'atendimentos_periodo': atendimentos_periodo,
         'total_agendados': total_agendados,
@@ -126,6 +243,128 @@ def dashboard_profissional(request):
     
     return render(request, 'agendamento/dashboard_profissional.html', context)
 
+def _periodo_do_dashboard(request, hoje):
+    """(data_inicio, data_fim) do filtro do dashboard; hoje se faltar ou vier malformado."""
+    data_inicio_str = request.GET.get('data_inicio')
+    data_fim_str = request.GET.get('data_fim')
+
+    # Se vierem datas na URL, usa elas. Se não, usa "Hoje" como padrão.
+    if data_inicio_str and data_fim_str:
+        try:
+            return (
+                datetime.strptime(data_inicio_str, "%Y-%m-%d").date(),
+                datetime.strptime(data_fim_str, "%Y-%m-%d").date(),
+            )
+        except ValueError:
+            pass
+    return hoje, hoje
+
+
+def _agenda_do_periodo(profissional, data_inicio, data_fim):
+    # Intervalo semiaberto [data_inicio 00:00, data_fim+1 00:00) no fuso local:
+    # comparar a coluna direto (sem __date) deixa o banco usar o índice
+    return Agendamento.objects.filter(
+        profissional=profissional,
+        data_hora_inicio__gte=meia_noite(data_inicio),
+        data_hora_inicio__lt=meia_noite(data_fim + timedelta(days=1))
+    ).select_related('cliente', 'servico')
+
+
+@orcamento_consultas(3)
+@login_required
+def api_agenda_periodo(request):
+    """
+    Próximas páginas da tabela "Agenda do Período" do dashboard (rolagem infinita).
+    Devolve as linhas já renderizadas com o mesmo template da página.
+    """
+    if request.user.tipo != 'CABELEIREIRO':
+        return JsonResponse({'erro': 'Acesso negado.'}, status=403)
+
+    data_inicio, data_fim = _periodo_do_dashboard(request, timezone.localdate())
+    try:
+        itens, proximo_cursor = paginar_por_chave(
+            _agenda_do_periodo(request.user, data_inicio, data_fim),
+            request.GET.get('cursor'), tamanho_pagina(request.GET.get('tamanho')), decrescente=False
+        )
+    except ValueError:
+        return JsonResponse({'erro': 'Cursor inválido.'}, status=400)
+
+    html = render_to_string('agendamento/_linhas_agenda_periodo.html', {'agenda_periodo': itens}, request=request)
+    return JsonResponse({'html': html, 'proximo_cursor': proximo_cursor})
+
+
+# Quantos atendimentos o modal de prontuário mostra por vez
+TAMANHO_PRONTUARIO = 5
+
+
+# Agrupamentos aceitos pela api_agenda_futura
+AGRUPAMENTOS_AGENDA = ('dia', 'semana')
+
+
+def _inicio_do_grupo(data, agrupar):
+    """Dia local do agendamento, ou a segunda-feira da semana dele."""
+    if agrupar == 'semana':
+        return data - timedelta(days=data.weekday())
+    return data
+
+
+@orcamento_consultas(3)
+@login_required
+def api_agenda_futura(request):
+    """
+    Agenda futura do profissional (amanhã em diante) em páginas, agrupada por dia ou semana.
+    Um grupo pode continuar na página seguinte: o front junta pelo campo 'data'.
+    """
+    if request.user.tipo != 'CABELEIREIRO':
+        return JsonResponse({'erro': 'Acesso negado.'}, status=403)
+
+    agrupar = request.GET.get('agrupar', 'dia')
+    if agrupar not in AGRUPAMENTOS_AGENDA:
+        return JsonResponse({'erro': 'Agrupamento inválido.'}, status=400)
+
+    amanha = timezone.localdate() + timedelta(days=1)
+    # .values() traz cliente e serviço no mesmo JOIN, sem instanciar modelos
+    agendamentos = Agendamento.objects.filter(
+        profissional=request.user,
+        data_hora_inicio__gte=meia_noite(amanha),
+    ).values(
+        'id', 'data_hora_inicio', 'status',
+        'cliente_id', 'cliente__first_name', 'cliente__last_name', 'cliente__username',
+        'servico__nome',
+    )
+
+    try:
+        itens, proximo_cursor = paginar_por_chave(
+            agendamentos, request.GET.get('cursor'), tamanho_pagina(request.GET.get('tamanho')), decrescente=False
+        )
+    except ValueError:
+        return JsonResponse({'erro': 'Cursor inválido.'}, status=400)
+
+    grupos = []
+    for item in itens:
+        inicio = timezone.localtime(item['data_hora_inicio'])
+        data_grupo = _inicio_do_grupo(inicio.date(), agrupar)
+        if not grupos or grupos[-1]['data'] != data_grupo.isoformat():
+            grupos.append({'data': data_grupo.isoformat(), 'itens': []})
+
+        nome = f"{item['cliente__first_name']} {item['cliente__last_name']}".strip()
+        grupos[-1]['itens'].append({
+            'id': item['id'],
+            'inicio': inicio.isoformat(),
+            'hora': inicio.strftime('%H:%M'),
+            'status': item['status'],
+            'cliente_id': item['cliente_id'],
+            'cliente': nome or item['cliente__username'],
+            'servico': item['servico__nome'],
+        })
+
+    return JsonResponse({
+        'agrupar': agrupar,
+        'grupos': grupos,
+        'proximo_cursor': proximo_cursor,
+    })
+
+@orcamento_consultas(18)
 @login_required
 def mudar_status(request, agendamento_id, novo_status):
     agendamento = get_object_or_404(Agendamento, id=agendamento_id)
@@ -137,18 +376,20 @@ def mudar_status(request, agendamento_id, novo_status):
 
     if novo_status in ['CONCLUIDO', 'CANCELADO', 'NAO_COMPARECEU']:
         agendamento.status = novo_status
-        agendamento.save()
-        
-        # --- NOTIFICAÇÃO: SE O PROFISSIONAL CANCELAR, AVISA O CLIENTE ---
-        if novo_status == 'CANCELADO':
-            msg_cli = f"Atenção: Seu agendamento de {agendamento.data_hora_inicio.strftime('%d/%m às %H:%M')} foi cancelado pelo profissional."
-            criar_notificacao(agendamento.cliente, msg_cli)
-        # ---------------------------------------------------------------
+        with transaction.atomic():
+            agendamento.save()
+
+            # --- NOTIFICAÇÃO: SE O PROFISSIONAL CANCELAR, AVISA O CLIENTE ---
+            if novo_status == 'CANCELADO':
+                msg_cli = f"Atenção: Seu agendamento de {agendamento.data_hora_inicio.strftime('%d/%m às %H:%M')} foi cancelado pelo profissional."
+                enfileirar_notificacao(agendamento.cliente, msg_cli, chave=f'agendamento:{agendamento.pk}:cancelado-profissional')
+            # ---------------------------------------------------------------
 
         messages.success(request, f"Status atualizado para {agendamento.get_status_display()}")
     
     return redirect('listar_agendamentos')
 
+@orcamento_consultas(14)
 @login_required
 def concluir_agendamento(request, agendamento_id):
     if request.method == 'POST':
@@ -168,28 +409,57 @@ def concluir_agendamento(request, agendamento_id):
         messages.success(request, "Atendimento concluído e prontuário salvo!")
         return redirect('listar_agendamentos')
 
+@orcamento_consultas(3)
 @login_required
 def obter_historico_cliente(request, cliente_id):
     """
     Retorna um JSON com os cortes passados desse cliente.
     Usaremos isso para mostrar no Modal de Histórico sem recarregar a página.
+
+    Por padrão vêm os últimos 5; `?cursor=` continua pelo histórico inteiro.
+    O modal é reaberto várias vezes: com ETag/Last-Modified o navegador revalida
+    e recebe 304 quando nada mudou.
     """
     cortes_passados = Agendamento.objects.filter(
         cliente_id=cliente_id,
         profissional=request.user, # Só mostra o que esse barbeiro fez (opcional)
         status='CONCLUIDO'
-    ).order_by('-data_hora_inicio')[:5] # Pega os últimos 5
-    
+    ).values('id', 'data_hora_inicio', 'anotacoes', 'atualizado_em', 'servico__nome')
+
+    try:
+        cortes, proximo_cursor = paginar_por_chave(
+            cortes_passados, request.GET.get('cursor'),
+            tamanho_pagina(request.GET.get('tamanho'), padrao=TAMANHO_PRONTUARIO)
+        )
+    except ValueError:
+        return JsonResponse({'erro': 'Cursor inválido.'}, status=400)
+
     data = []
-    for corte in cortes_passados:
+    for corte in cortes:
         data.append({
-            'data': corte.data_hora_inicio.strftime('%d/%m/%Y'),
-            'servico': corte.servico.nome,
-            'nota': corte.anotacoes or "Sem anotações."
+            'data': timezone.localtime(corte['data_hora_inicio']).strftime('%d/%m/%Y'),
+            # servico é SET_NULL: o serviço pode ter sido apagado depois do atendimento
+            'servico': corte['servico__nome'] or "Serviço removido",
+            'nota': corte['anotacoes'] or "Sem anotações."
         })
-    
-    return JsonResponse({'historico': data})
-
+    conteudo = {'historico': data, 'proximo_cursor': proximo_cursor}
+
+    # ETag do próprio conteúdo: também muda se o serviço for renomeado ou apagado
+    etag = quote_etag(hashlib.md5(json.dumps(conteudo).encode()).hexdigest())
+    ultima_alteracao = max((corte['atualizado_em'] for corte in cortes), default=None)
+    ultima_alteracao = ultima_alteracao and int(ultima_alteracao.timestamp())
+
+    resposta = get_conditional_response(request, etag=etag, last_modified=ultima_alteracao)
+    if resposta is None:
+        resposta = JsonResponse(conteudo)
+    resposta['ETag'] = etag
+    if ultima_alteracao:
+        resposta['Last-Modified'] = http_date(ultima_alteracao)
+    # Sempre revalida (dados de prontuário são privados e mudam ao concluir um atendimento)
+    patch_cache_control(resposta, private=True, no_cache=True)
+    return resposta
+
+@orcamento_consultas(18)
 @login_required
 def configurar_horarios(request):
     if request.user.tipo != 'CABELEIREIRO':
@@ -218,122 +488,317 @@ def configurar_horarios(request):
     else:
         formset = HorarioFormSet(queryset=HorarioTrabalho.objects.filter(profissional=request.user))
 
-    return render(request, 'agendamento/configurar_horarios.html', {'formset': formset})
+    # Exceções em vigor ou futuras (feriados, férias, horário estendido)
+    excecoes = ExcecaoHorario.objects.filter(profissional=request.user, data_fim__gte=timezone.localdate())
+
+    return render(request, 'agendamento/configurar_horarios.html', {
+        'formset': formset,
+        'excecoes': excecoes,
+        'form_excecao': ExcecaoHorarioForm(),
+    })
+
+@orcamento_consultas(5)
+@login_required
+def adicionar_excecao_horario(request):
+    if request.user.tipo != 'CABELEIREIRO' or request.method != 'POST':
+        return redirect('configurar_horarios')
+
+    form = ExcecaoHorarioForm(request.POST, instance=ExcecaoHorario(profissional=request.user))
+    if not form.is_valid():
+        for erro in form.errors.get('__all__', []) or ["Verifique as datas e horários da exceção."]:
+            messages.error(request, erro)
+        return redirect('configurar_horarios')
+
+    excecao = form.save()
+    messages.success(request, "Exceção de horário cadastrada!")
+
+    # A exceção não mexe em quem já marcou: avisa para o profissional remarcar
+    afetados = Agendamento.objects.filter(
+        profissional=request.user,
+        data_hora_inicio__gte=meia_noite(excecao.data_inicio),
+        data_hora_inicio__lt=meia_noite(excecao.data_fim + timedelta(days=1)),
+        status='AGENDADO',
+    ).count()
+    if afetados:
+        messages.warning(request, f"Atenção: há {afetados} agendamento(s) neste período. Confira se ainda cabem no novo horário.")
+    return redirect('configurar_horarios')
+
+@orcamento_consultas(4)
+@login_required
+def remover_excecao_horario(request, excecao_id):
+    excecao = get_object_or_404(ExcecaoHorario, id=excecao_id, profissional=request.user)
+    if request.method == 'POST':
+        excecao.delete()
+        messages.success(request, "Exceção removida.")
+    return redirect('configurar_horarios')
 
 # agendamento/views.py
 
-def get_horarios_disponiveis(request):
+def ler_parametros_horarios(request):
+    """
+    (profissional_id, data, servico_id) da consulta de horários, ou None se faltar
+    algo ou vier malformado. Compartilhado com a versão async (views_async.py).
+    """
     profissional_id = request.GET.get('profissional_id')
     data_str = request.GET.get('data')
     servico_id = request.GET.get('servico_id')
 
-    print(f"--- DEBUG AGENDA ---")
-    print(f"Recebido: Prof={profissional_id}, Data={data_str}, Servico={servico_id}")
-
     # Validação inicial
     if not all([profissional_id, data_str, servico_id]):
-        print("ERRO: Faltando parâmetros.")
-        return JsonResponse({'horarios': []})
+        return None
 
     try:
-        data_obj = datetime.strptime(data_str, "%Y-%m-%d").date()
-        dia_semana = data_obj.weekday()
-        print(f"Dia da semana: {dia_semana} (0=Seg, 6=Dom)")
+        return int(profissional_id), datetime.strptime(data_str, "%Y-%m-%d").date(), int(servico_id)
     except ValueError:
-        print("ERRO: Formato de data inválido.")
+        return None
+
+
+def inicios_do_dia(horario_config, data_obj, duracao, ocupados):
+    """Valor guardado no cache de disponibilidade (sem o corte de "já passou")."""
+    if horario_config is None:
+        return {'erro': 'Profissional não atende neste dia.'}
+    if horario_config.folga:
+        motivo = getattr(horario_config, 'motivo', '')
+        return {'erro': f'Profissional não atende neste dia ({motivo}).' if motivo else 'Dia de folga.'}
+    return {'inicios': gerar_inicios_livres(horario_config, data_obj, duracao, ocupados, agora=False)}
+
+
+def resposta_horarios(data_obj, resultado):
+    if 'erro' in resultado:
+        return JsonResponse({'horarios': [], 'erro': resultado['erro']})
+
+    # Remove o que já passou (almoço e agenda já foram resolvidos na varredura)
+    slots_disponiveis = [formatar_minutos(inicio) for inicio in aplicar_corte(data_obj, resultado['inicios'])]
+    return JsonResponse({'horarios': slots_disponiveis})
+
+
+def ocupados_do_dia(profissional_id, data_obj):
+    # Agendamentos que encostam no dia (intervalo semiaberto, pega também
+    # quem começou no dia anterior e invade este)
+    inicio_dia = meia_noite(data_obj)
+    fim_dia = inicio_dia + timedelta(days=1)
+    return Agendamento.objects.filter(
+        profissional_id=profissional_id,
+        data_hora_inicio__lt=fim_dia,
+        data_hora_fim__gt=inicio_dia,
+        status__in=STATUS_OCUPAM_AGENDA
+    ).values_list('data_hora_inicio', 'data_hora_fim')
+
+
+@orcamento_consultas(4)
+@somente_leitura
+def get_horarios_disponiveis(request):
+    parametros = ler_parametros_horarios(request)
+    if parametros is None:
         return JsonResponse({'horarios': []})
+    profissional_id, data_obj, servico_id = parametros
 
     # 1. Busca Serviço
     try:
         servico = Servico.objects.get(id=servico_id)
         duracao = servico.duracao_minutos
-        print(f"Serviço encontrado: {servico.nome}, Duração: {duracao}min")
     except Servico.DoesNotExist:
-        print("ERRO: Serviço não encontrado.")
         return JsonResponse({'horarios': [], 'erro': 'Serviço inválido'})
 
-    # 2. Busca Horário de Trabalho
+    # 2 e 3. Regra efetiva do dia (semanal ou exceção) + agendamentos do dia, com cache por
+    # (profissional, data, duração). O cache guarda os slots sem o corte de "já passou",
+    # que é aplicado a cada chamada.
+    def calcular():
+        horario_config = regra_do_dia(profissional_id, data_obj)
+        if horario_config is None or horario_config.folga:
+            return inicios_do_dia(horario_config, data_obj, duracao, ())
+        return inicios_do_dia(horario_config, data_obj, duracao, ocupados_do_dia(profissional_id, data_obj))
+
+    resultado = obter_disponibilidade(profissional_id, data_obj, duracao, calcular)
+    return resposta_horarios(data_obj, resultado)
+
+@orcamento_consultas(4)
+@somente_leitura
+def get_proximos_horarios(request):
+    """
+    Retorna os primeiros N horários livres de um profissional para um serviço,
+    procurando a partir de hoje dentro de um horizonte de dias.
+    Evita que o front chame a API de horários dia a dia até achar vaga.
+    """
+    profissional_id = request.GET.get('profissional_id')
+    servico_id = request.GET.get('servico_id')
+
+    if not all([profissional_id, servico_id]):
+        return JsonResponse({'horarios': []})
+
     try:
-        horario_config = HorarioTrabalho.objects.get(
-            profissional_id=profissional_id, 
-            dia_semana=dia_semana
-        )
-        print(f"Horário Config: {horario_config.hora_inicio} às {horario_config.hora_fim} | Folga: {horario_config.folga}")
-    except HorarioTrabalho.DoesNotExist:
-        print("ERRO: Sem configuração de horário para este dia.")
-        return JsonResponse({'horarios': [], 'erro': 'Profissional não atende neste dia.'})
+        quantidade = max(1, min(int(request.GET.get('quantidade', 5)), 50))
+        dias = max(1, min(int(request.GET.get('dias', HORIZONTE_PADRAO_DIAS)), HORIZONTE_MAXIMO_DIAS))
+    except ValueError:
+        return JsonResponse({'horarios': [], 'erro': 'Parâmetros inválidos.'})
 
-    if horario_config.folga:
-        print("ERRO: Dia de folga.")
-        return JsonResponse({'horarios': [], 'erro': 'Dia de folga.'})
+    try:
+        servico = Servico.objects.get(id=servico_id, profissional_id=profissional_id, ativo=True)
+    except (Servico.DoesNotExist, ValueError):
+        return JsonResponse({'horarios': [], 'erro': 'Serviço inválido'})
 
-    # 3. Gera slots
-    slots_disponiveis = []
-    
-    # Datas com horário combinados (Naive - sem fuso horário para cálculo matemático)
-    hora_atual = datetime.combine(data_obj, horario_config.hora_inicio)
-    hora_fim_trab = datetime.combine(data_obj, horario_config.hora_fim)
-    
-    almoco_inicio = datetime.combine(data_obj, horario_config.almoco_inicio) if horario_config.almoco_inicio else None
-    almoco_fim = datetime.combine(data_obj, horario_config.almoco_fim) if horario_config.almoco_fim else None
+    # 1. Regra semanal + exceções (feriados, férias) já compiladas, normalmente do cache
+    expediente = obter_expediente(servico.profissional_id)
 
-    # Busca agendamentos (Aware - com fuso horário)
-    agendamentos = Agendamento.objects.filter(
+    # 2. Todos os agendamentos da janela numa única consulta por intervalo
+    hoje = timezone.localdate()
+    inicio_janela = meia_noite(hoje)
+    fim_janela = meia_noite(hoje + timedelta(days=dias))
+    ocupados = Agendamento.objects.filter(
         profissional_id=profissional_id,
-        data_hora_inicio__date=data_obj,
-        status='AGENDADO'
+        data_hora_inicio__lt=fim_janela,
+        data_hora_fim__gt=inicio_janela,
+        status__in=STATUS_OCUPAM_AGENDA
+    ).values_list('data_hora_inicio', 'data_hora_fim')
+
+    encontrados = proximos_horarios_livres(
+        expediente.regra, agrupar_por_dia(ocupados), servico.duracao_minutos,
+        hoje, dias, quantidade
     )
-    print(f"Agendamentos já existentes no dia: {agendamentos.count()}")
 
-    # Loop de slots (Intervalo de 30 min para início)
-    step = 30 
-    
-    while hora_atual + timedelta(minutes=duracao) <= hora_fim_trab:
-        hora_termino_servico = hora_atual + timedelta(minutes=duracao)
-        
-        # --- Validações ---
-        motivo_bloqueio = None
-
-        # A. Almoço (Logica Naive vs Naive)
-        if almoco_inicio and almoco_fim:
-            if (hora_atual < almoco_fim) and (hora_termino_servico > almoco_inicio):
-                motivo_bloqueio = "Almoço"
-
-        # B. Conflitos (Lógica Aware vs Aware)
-        if not motivo_bloqueio:
-            slot_inicio_aware = make_aware(hora_atual)
-            slot_fim_aware = make_aware(hora_termino_servico)
-            
-            for agendamento in agendamentos:
-                # Se slot começa antes de terminar o agendamento E termina depois de começar o agendamento
-                if (slot_inicio_aware < agendamento.data_hora_fim) and (slot_fim_aware > agendamento.data_hora_inicio):
-                    motivo_bloqueio = f"Conflito agenda ({agendamento.data_hora_inicio.time()})"
-                    break
-        
-        # C. Passado (Não deixar agendar para trás se for hoje)
-        if not motivo_bloqueio:
-            agora = timezone.now()
-            # Se for hoje e o horário já passou
-            if data_obj == agora.date() and make_aware(hora_atual) < agora:
-                 motivo_bloqueio = "Horário já passou"
-
-        # Adiciona ou Loga erro
-        if not motivo_bloqueio:
-            slots_disponiveis.append(hora_atual.strftime("%H:%M"))
-        # else:
-            # print(f"Slot {hora_atual.time()} bloqueado por: {motivo_bloqueio}") 
-
-        hora_atual += timedelta(minutes=step)
-
-    print(f"Total slots livres: {len(slots_disponiveis)}")
-    return JsonResponse({'horarios': slots_disponiveis})
+    return JsonResponse({
+        'horarios': [{'data': data.strftime('%Y-%m-%d'), 'hora': hora} for data, hora in encontrados]
+    })
+
+@orcamento_consultas(4)
+@somente_leitura
+def get_horarios_qualquer_profissional(request):
+    """
+    Modo "qualquer profissional": dado o nome de um serviço e uma data, junta a
+    disponibilidade de todos os cabeleireiros que oferecem esse serviço ativo.
+    Tudo em lote: uma consulta de serviços, uma de agendamentos e o expediente (em cache).
+    """
+    nome_servico = (request.GET.get('servico') or '').strip()
+    data_str = request.GET.get('data')
+
+    if not nome_servico or not data_str:
+        return JsonResponse({'horarios': []})
+
+    try:
+        data_obj = datetime.strptime(data_str, "%Y-%m-%d").date()
+    except ValueError:
+        return JsonResponse({'horarios': []})
+
+    # 1. Serviços equivalentes de cada profissional (cada um tem a sua duração)
+    servicos = Servico.objects.filter(
+        nome__iexact=nome_servico,
+        ativo=True,
+        profissional__tipo='CABELEIREIRO'
+    ).select_related('profissional').order_by('profissional__first_name', 'profissional__username', 'id')
+
+    servico_por_profissional = {}
+    for servico in servicos:
+        servico_por_profissional.setdefault(servico.profissional_id, servico)
+
+    if not servico_por_profissional:
+        return JsonResponse({'horarios': [], 'erro': 'Nenhum profissional oferece este serviço.'})
+
+    ids_profissionais = list(servico_por_profissional)
+
+    # 2. Expediente de todos eles (só os que não estão em cache vão ao banco)
+    expedientes = obter_expedientes(ids_profissionais)
+
+    # 3. Agendamentos do dia de todos eles, agrupados em memória
+    inicio_dia = meia_noite(data_obj)
+    fim_dia = inicio_dia + timedelta(days=1)
+    ocupados_por_profissional = {}
+    for profissional_id, inicio, fim in Agendamento.objects.filter(
+        profissional_id__in=ids_profissionais,
+        data_hora_inicio__lt=fim_dia,
+        data_hora_fim__gt=inicio_dia,
+        status__in=STATUS_OCUPAM_AGENDA
+    ).values_list('profissional_id', 'data_hora_inicio', 'data_hora_fim'):
+        ocupados_por_profissional.setdefault(profissional_id, []).append((inicio, fim))
+
+    # 4. Gera os slots de cada um e junta por horário
+    agora = timezone.now()
+    por_hora = {}
+    for profissional_id, servico in servico_por_profissional.items():
+        slots = gerar_slots(
+            expedientes[profissional_id].regra(data_obj), data_obj, servico.duracao_minutos,
+            ocupados_por_profissional.get(profissional_id, ()), agora
+        )
+        for hora in slots:
+            por_hora.setdefault(hora, []).append({
+                'profissional_id': profissional_id,
+                'profissional': servico.profissional.first_name or servico.profissional.username,
+                'servico_id': servico.id,
+                'duracao_minutos': servico.duracao_minutos,
+                'preco': servico.preco,
+            })
+
+    horarios = [{'hora': hora, 'profissionais': por_hora[hora]} for hora in sorted(por_hora)]
+    return JsonResponse({'horarios': horarios})
+
+# Teto de candidatos por chamada da api_validar_horarios
+LIMITE_CANDIDATOS = 100
+
+def _ler_candidato(item):
+    inicio = datetime.fromisoformat(item['inicio'])
+    if timezone.is_naive(inicio):
+        inicio = make_aware(inicio)
+    agendamento_id = item.get('agendamento_id')
+    return int(item['profissional_id']), int(item['servico_id']), inicio, agendamento_id and int(agendamento_id)
+
+@orcamento_consultas(7)
+@login_required
+def api_validar_horarios(request):
+    """
+    Valida vários horários propostos numa chamada (remarcação arrastando na agenda,
+    sugestões de combos). Corpo JSON:
+    {"candidatos": [{"profissional_id", "servico_id", "inicio", "agendamento_id"?}], "entre_si": false}
+    `inicio` em ISO 8601 (sem fuso = horário local). Nada é gravado.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'erro': 'Use POST.'}, status=405)
+    try:
+        corpo = json.loads(request.body)
+        candidatos = [_ler_candidato(item) for item in corpo.get('candidatos', [])]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({'erro': 'Candidatos inválidos.'}, status=400)
+    if len(candidatos) > LIMITE_CANDIDATOS:
+        return JsonResponse({'erro': f'Envie no máximo {LIMITE_CANDIDATOS} candidatos.'}, status=400)
+
+    # Só dá para ignorar (remarcar) agendamentos de que o usuário participa
+    ids_remarcados = {candidato[3] for candidato in candidatos if candidato[3]}
+    if ids_remarcados:
+        permitidos = set(Agendamento.objects.filter(
+            Q(cliente=request.user) | Q(profissional=request.user), id__in=ids_remarcados
+        ).values_list('id', flat=True))
+        candidatos = [
+            (profissional_id, servico_id, inicio, agendamento_id if agendamento_id in permitidos else None)
+            for profissional_id, servico_id, inicio, agendamento_id in candidatos
+        ]
+
+    resultados = validar_em_lote(candidatos, entre_si=bool(corpo.get('entre_si')))
+    return JsonResponse({'resultados': [
+        {
+            'profissional_id': profissional_id,
+            'servico_id': servico_id,
+            'inicio': timezone.localtime(inicio).isoformat(),
+            'fim': resultado['fim'] and timezone.localtime(resultado['fim']).isoformat(),
+            'valido': resultado['valido'],
+            'erro': resultado['erro'],
+        }
+        for (profissional_id, servico_id, inicio, _), resultado in zip(candidatos, resultados)
+    ]})
+
+@orcamento_consultas(2)
+@staff_member_required
+def api_estatisticas_cache(request):
+    """Contadores do cache de disponibilidade (só para a equipe)."""
+    return JsonResponse(estatisticas_cache())
 
 # Precisamos também de uma API para filtrar serviços pelo profissional
+@orcamento_consultas(40)
+@somente_leitura
 def api_get_servicos_por_profissional(request, profissional_id):
     servicos = Servico.objects.filter(profissional_id=profissional_id, ativo=True).values('id', 'nome', 'preco', 'duracao_minutos')
     return JsonResponse({'servicos': list(servicos)})
 
 
+# Trocar preço/duração de um serviço reconstrói os dias dele no resumo diário (7 consultas)
+@orcamento_consultas(15)
 @login_required
 def gerenciar_servicos(request):
     if request.user.tipo != 'CABELEIREIRO':
@@ -358,18 +823,22 @@ def gerenciar_servicos(request):
 
     return render(request, 'agendamento/gerenciar_servicos.html', {'formset': formset})
 
+@orcamento_consultas(4)
 @login_required
 def upload_foto_portfolio(request):
     if request.method == 'POST' and request.FILES.get('imagem_portfolio'):
-        Portfolio.objects.create(
+        foto = Portfolio.objects.create(
             profissional=request.user,
             imagem=request.FILES['imagem_portfolio'],
             descricao=request.POST.get('descricao', 'Trabalho realizado')
         )
+        # Miniaturas e WebP para a home e a galeria (o original fica para a ampliação)
+        foto.gerar_miniaturas()
         messages.success(request, "Foto adicionada ao portfólio!")
     
     return redirect('editar_perfil')
 
+@orcamento_consultas(4)
 @login_required
 def deletar_foto_portfolio(request, foto_id):
     foto = get_object_or_404(Portfolio, id=foto_id, profissional=request.user)
@@ -377,6 +846,7 @@ def deletar_foto_portfolio(request, foto_id):
     messages.success(request, "Foto removida.")
     return redirect('editar_perfil')
 
+@orcamento_consultas(18)
 @login_required
 def cancelar_agendamento(request, agendamento_id):
     agendamento = get_object_or_404(Agendamento, id=agendamento_id)
@@ -393,12 +863,86 @@ def cancelar_agendamento(request, agendamento_id):
 
     # 3. Cancela
     agendamento.status = 'CANCELADO'
-    agendamento.save()
-    
-    # --- NOTIFICAÇÃO: AVISA O PROFISSIONAL ---
-    msg_canc = f"Cancelamento: {request.user.first_name or request.user.username} cancelou o horário de {agendamento.data_hora_inicio.strftime('%d/%m às %H:%M')}."
-    criar_notificacao(agendamento.profissional, msg_canc)
-    # -----------------------------------------
+    with transaction.atomic():
+        agendamento.save()
+
+        # --- NOTIFICAÇÃO: AVISA O PROFISSIONAL ---
+        msg_canc = f"Cancelamento: {request.user.first_name or request.user.username} cancelou o horário de {agendamento.data_hora_inicio.strftime('%d/%m às %H:%M')}."
+        enfileirar_notificacao(agendamento.profissional, msg_canc, chave=f'agendamento:{agendamento.pk}:cancelado-cliente')
+        # -----------------------------------------
 
     messages.success(request, "Agendamento cancelado com sucesso.")
-    return redirect('listar_agendamentos')
\ No newline at end of file
+    return redirect('listar_agendamentos')
+
+def _serie_do_usuario(request, serie_id):
+    # Cliente e profissional da série podem mexer nela
+    return get_object_or_404(
+        SerieAgendamento.objects.filter(Q(cliente=request.user) | Q(profissional=request.user)).select_related('servico'),
+        id=serie_id,
+    )
+
+@orcamento_consultas(19)
+@login_required
+def cancelar_serie(request, serie_id):
+    serie = _serie_do_usuario(request, serie_id)
+    if request.method != 'POST':
+        return redirect('listar_agendamentos')
+
+    # O cliente segue a regra das 2 horas; o profissional cancela tudo o que ainda vem
+    eh_cliente = serie.cliente_id == request.user.id
+    a_partir = timezone.now() + timedelta(hours=2) if eh_cliente else timezone.now()
+    with transaction.atomic():
+        canceladas = cancelar_ocorrencias(serie, a_partir=a_partir)
+        if canceladas:
+            outro = serie.profissional if eh_cliente else serie.cliente
+            msg = f"Série cancelada: {request.user.first_name or request.user.username} cancelou {canceladas} horário(s) recorrente(s)."
+            enfileirar_notificacao(outro, msg, link='/agendamento/meus-agendamentos/', chave=f'serie:{serie.pk}:cancelada')
+
+    if canceladas:
+        messages.success(request, f"Série cancelada ({canceladas} agendamento(s)).")
+    else:
+        messages.info(request, "Não havia agendamentos futuros nesta série.")
+    return redirect('listar_agendamentos')
+
+@orcamento_consultas(40)
+@login_required
+def editar_serie(request, serie_id):
+    """Muda a hora e/ou o serviço de todas as ocorrências futuras de uma vez."""
+    serie = _serie_do_usuario(request, serie_id)
+    if request.method != 'POST':
+        return redirect('listar_agendamentos')
+
+    try:
+        nova_hora = datetime.strptime(request.POST['hora'], "%H:%M").time() if request.POST.get('hora') else None
+    except ValueError:
+        messages.error(request, "Horário inválido.")
+        return redirect('listar_agendamentos')
+
+    servico = serie.servico
+    if request.POST.get('servico'):
+        try:
+            servico = Servico.objects.get(id=int(request.POST['servico']), profissional_id=serie.profissional_id, ativo=True)
+        except (ValueError, Servico.DoesNotExist):
+            messages.error(request, "Serviço inválido.")
+            return redirect('listar_agendamentos')
+
+    try:
+        with transaction.atomic():
+            alteradas = remarcar_serie(serie, nova_hora=nova_hora, servico=servico, a_partir=timezone.now() + timedelta(hours=2))
+            if alteradas:
+                outro = serie.profissional if serie.cliente_id == request.user.id else serie.cliente
+                msg = f"Série alterada: {alteradas} horário(s) recorrente(s) de {servico.nome} mudaram para {nova_hora.strftime('%H:%M') if nova_hora else 'o mesmo horário'}."
+                # A versão só sobe quando a série muda: o mesmo formulário enviado duas vezes
+                # não duplica o aviso, e voltar depois para um horário já usado avisa de novo
+                chave = f"serie:{serie.pk}:alterada:{serie.versao}"
+                enfileirar_notificacao(outro, msg, link='/agendamento/meus-agendamentos/', chave=chave)
+    except ValidationError as e:
+        messages.error(request, " ".join(e.messages))
+        return redirect('listar_agendamentos')
+
+    if alteradas:
+        messages.success(request, f"Série atualizada ({alteradas} agendamento(s)).")
+    else:
+        messages.info(request, "Não havia agendamentos futuros nesta série.")
+    return redirect('listar_agendamentos')
+
@@ -0,0 +1,50 @@
+"""
+Versões async das APIs públicas chamadas em rajada pelo formulário de agendamento.
+
+Usam o ORM async do Django (afirst, async for) e o cache async, então um worker
+ASGI atende várias requisições enquanto espera o banco/cache, sem uma thread por
+requisição. Só fazem sentido servidas por ASGI (ver "Perfil ASGI" no README):
+com APIS_ASYNC=True o urls.py aponta as mesmas rotas para estas funções.
+
+A regra de negócio é a mesma das versões sync em views.py (as partes puras são
+importadas de lá).
+"""
+from django.http import JsonResponse
+
+from setup.replica import somente_leitura
+from setup.orcamento import orcamento_consultas
+
+from .cache import aobter_disponibilidade
+from .expediente import aobter_expediente
+from .models import Servico
+from .views import inicios_do_dia, ler_parametros_horarios, ocupados_do_dia, resposta_horarios
+
+
+@orcamento_consultas(4)
+@somente_leitura
+async def get_horarios_disponiveis(request):
+    parametros = ler_parametros_horarios(request)
+    if parametros is None:
+        return JsonResponse({'horarios': []})
+    profissional_id, data_obj, servico_id = parametros
+
+    duracao = await Servico.objects.filter(id=servico_id).values_list('duracao_minutos', flat=True).afirst()
+    if duracao is None:
+        return JsonResponse({'horarios': [], 'erro': 'Serviço inválido'})
+
+    async def calcular():
+        horario_config = (await aobter_expediente(profissional_id)).regra(data_obj)
+        if horario_config is None or horario_config.folga:
+            return inicios_do_dia(horario_config, data_obj, duracao, ())
+        ocupados = [par async for par in ocupados_do_dia(profissional_id, data_obj)]
+        return inicios_do_dia(horario_config, data_obj, duracao, ocupados)
+
+    resultado = await aobter_disponibilidade(profissional_id, data_obj, duracao, calcular)
+    return resposta_horarios(data_obj, resultado)
+
+
+@orcamento_consultas(1)
+@somente_leitura
+async def api_get_servicos_por_profissional(request, profissional_id):
+    servicos = Servico.objects.filter(profissional_id=profissional_id, ativo=True).values('id', 'nome', 'preco', 'duracao_minutos')
+    return JsonResponse({'servicos': [servico async for servico in servicos]})
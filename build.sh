@@ -9,4 +9,7 @@ python manage.py migrate
 python manage.py createsuperuser_auto
 
 # Popula o banco com os 8 cabeleireiros e serviços (se não existirem)
-python manage.py populate_salao
\ No newline at end of file
+python manage.py populate_salao
+
+# Gera o resumo diário do dashboard na primeira vez (depois ele se mantém sozinho)
+python manage.py reconstruir_resumos --se-vazio
\ No newline at end of file
@@ -1,8 +1,11 @@
-from .models import Notificacao
+from django.utils.functional import SimpleLazyObject
+from .utils import contar_nao_lidas
 
 def contador_notificacoes(request):
-    if request.user.is_authenticated:
-        # Conta quantas não foram lidas
-        count = Notificacao.objects.filter(destinatario=request.user, lida=False).count()
-        return {'notificacoes_nao_lidas': count}
-    return {'notificacoes_nao_lidas': 0}
\ No newline at end of file
+    # Preguiçoso: só consulta (cache ou banco) se o template realmente usar o valor.
+    # Páginas sem o sininho (admin, redirects, JSON) não pagam nada.
+    def nao_lidas():
+        if request.user.is_authenticated:
+            return contar_nao_lidas(request.user.pk)
+        return 0
+    return {'notificacoes_nao_lidas': SimpleLazyObject(nao_lidas)}
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notificacoes.outbox import MAX_TENTATIVAS, processar_lote
+
+
+class Command(BaseCommand):
+    help = 'Worker da outbox: entrega as notificações enfileiradas em lotes (o banco é a fila)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Eventos por lote')
+        parser.add_argument('--max-tentativas', type=int, default=MAX_TENTATIVAS)
+        parser.add_argument('--continuo', action='store_true', help='Fica rodando e verificando a fila')
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos de espera quando a fila está vazia (modo contínuo)')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processados = processar_lote(options['lote'], options['max_tentativas'])
+            total += processados
+
+            if processados:
+                self.stdout.write(f'{processados} eventos processados')
+                continue
+
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
+
+        self.stdout.write(self.style.SUCCESS(f'Fila vazia. {total} eventos processados nesta execução.'))
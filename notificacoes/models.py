@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 class Notificacao(models.Model):
     destinatario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notificacoes')
@@ -7,9 +8,51 @@ class Notificacao(models.Model):
     lida = models.BooleanField(default=False)
     link = models.CharField(max_length=200, blank=True, null=True) # Para clicar e ir direto pro agendamento
     criado_em = models.DateTimeField(auto_now_add=True)
+    # Chave do evento da outbox que gerou a notificação (garante entrega única)
+    chave = models.CharField(max_length=100, unique=True, blank=True, null=True)
 
     class Meta:
         ordering = ['-criado_em']
+        indexes = [
+            # Contador do sininho e "marcar todas como lidas"
+            models.Index(fields=['destinatario', 'lida'], name='notif_dest_lida_idx'),
+        ]
 
     def __str__(self):
-        return f"Para {self.destinatario}: {self.mensagem}"
\ No newline at end of file
+        return f"Para {self.destinatario}: {self.mensagem}"
+
+class EventoNotificacao(models.Model):
+    """
+    Outbox de notificações: as views só gravam o evento (um INSERT barato) e o
+    comando `processar_notificacoes` entrega em lote. O próprio banco é a fila,
+    então roda localmente sem broker externo.
+    """
+    STATUS_CHOICES = (
+        ('PENDENTE', 'Pendente'),
+        ('ENTREGUE', 'Entregue'),
+        ('FALHOU', 'Falhou'),
+    )
+
+    destinatario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='eventos_notificacao')
+    mensagem = models.CharField(max_length=255)
+    link = models.CharField(max_length=200, blank=True, null=True)
+    # Chave de idempotência: o mesmo evento enfileirado duas vezes vira uma notificação só
+    chave = models.CharField(max_length=100, unique=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDENTE')
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(default=timezone.now)
+    erro = models.TextField(blank=True)
+
+    criado_em = models.DateTimeField(auto_now_add=True)
+    processado_em = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # O worker busca "pendentes cuja vez já chegou", na ordem de chegada
+            models.Index(fields=['status', 'proxima_tentativa'], name='evento_notif_fila_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.chave} ({self.status})"
@@ -0,0 +1,114 @@
+"""
+Outbox de notificações.
+
+`enfileirar_notificacao` é o que as views chamam: grava um EventoNotificacao e
+volta. A entrega (hoje só a notificação interna do sininho; amanhã e-mail/push)
+é feita por `processar_lote`, chamado pelo comando `processar_notificacoes`.
+
+Com NOTIFICACOES_ENTREGA_IMEDIATA=True (padrão em DEBUG) o evento é entregue logo
+após o commit da requisição, sem precisar do worker rodando.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import EventoNotificacao, Notificacao
+from .utils import invalidar_nao_lidas
+
+MAX_TENTATIVAS = 5
+ESPERA_MAXIMA = timedelta(hours=1)
+
+
+def enfileirar_notificacao(destinatario, mensagem, link=None, chave=None):
+    """
+    Enfileira uma notificação. Passe uma `chave` estável (ex.: 'agendamento:42:novo')
+    para que reenvios do mesmo evento não dupliquem a notificação.
+    """
+    chave = chave or uuid.uuid4().hex
+    # ignore_conflicts: um INSERT só, e a chave repetida é simplesmente ignorada
+    EventoNotificacao.objects.bulk_create([
+        EventoNotificacao(destinatario=destinatario, mensagem=mensagem, link=link, chave=chave)
+    ], ignore_conflicts=True)
+
+    if getattr(settings, 'NOTIFICACOES_ENTREGA_IMEDIATA', False):
+        transaction.on_commit(lambda: processar_lote(chaves=[chave]))
+    return chave
+
+
+def _espera(tentativas):
+    """Backoff exponencial: 30s, 1min, 2min, ... até ESPERA_MAXIMA."""
+    return min(timedelta(seconds=30 * 2 ** (tentativas - 1)), ESPERA_MAXIMA)
+
+
+def _entregar(eventos):
+    """Grava as notificações dos eventos num savepoint próprio (tudo ou nada)."""
+    with transaction.atomic():
+        # A chave única na Notificacao torna a entrega idempotente
+        # (um evento reprocessado depois de uma falha não duplica)
+        Notificacao.objects.bulk_create([
+            Notificacao(destinatario_id=evento.destinatario_id, mensagem=evento.mensagem,
+                        link=evento.link, chave=evento.chave)
+            for evento in eventos
+        ], ignore_conflicts=True)
+        # O contador do sininho é recontado na próxima leitura, depois do commit
+        # (antes dele a recontagem ainda não veria as notificações novas)
+        destinatarios = {evento.destinatario_id for evento in eventos}
+        transaction.on_commit(lambda: invalidar_nao_lidas(destinatarios))
+
+
+def processar_lote(tamanho=500, max_tentativas=MAX_TENTATIVAS, chaves=None):
+    """
+    Entrega um lote de eventos pendentes com um único bulk_create.
+    Se o lote falhar, cada evento é tentado sozinho: só os que falharem de novo
+    são reagendados (ou marcados FALHOU); os outros são entregues normalmente.
+    Retorna quantos eventos foram processados (entregues ou reagendados).
+    """
+    agora = timezone.now()
+
+    with transaction.atomic():
+        pendentes = EventoNotificacao.objects.filter(status='PENDENTE', proxima_tentativa__lte=agora)
+        if chaves is not None:
+            pendentes = pendentes.filter(chave__in=chaves)
+        if connection.features.has_select_for_update_skip_locked:
+            # Vários workers podem rodar juntos: cada um pega linhas diferentes
+            pendentes = pendentes.select_for_update(skip_locked=True)
+        eventos = list(pendentes.order_by('id')[:tamanho])
+
+        if not eventos:
+            return 0
+
+        entregues, falhos = eventos, []
+        try:
+            _entregar(eventos)
+        except Exception as erro:
+            if len(eventos) == 1:
+                entregues, falhos = [], [(eventos[0], erro)]
+            else:
+                # Um evento ruim não pode segurar o lote inteiro
+                entregues = []
+                for evento in eventos:
+                    try:
+                        _entregar([evento])
+                    except Exception as erro_evento:
+                        falhos.append((evento, erro_evento))
+                    else:
+                        entregues.append(evento)
+
+        for evento, erro in falhos:
+            evento.tentativas += 1
+            evento.erro = str(erro)
+            if evento.tentativas >= max_tentativas:
+                evento.status = 'FALHOU'
+            else:
+                evento.proxima_tentativa = agora + _espera(evento.tentativas)
+        if falhos:
+            EventoNotificacao.objects.bulk_update([evento for evento, _ in falhos], ['tentativas', 'erro', 'status', 'proxima_tentativa'])
+
+        if entregues:
+            EventoNotificacao.objects.filter(id__in=[evento.id for evento in entregues]).update(
+                status='ENTREGUE', processado_em=agora, erro=''
+            )
+    return len(eventos)
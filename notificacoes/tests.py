@@ -1,3 +1,153 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from agendamento.tests import STORAGES_TESTE
+from setup.testes import OrcamentoTestMixin
+from users.models import User
+from .context_processors import contador_notificacoes
+from .models import EventoNotificacao, Notificacao
+from .outbox import enfileirar_notificacao, processar_lote
+from .utils import contar_nao_lidas
+
+
+@override_settings(STORAGES=STORAGES_TESTE)
+class OrcamentoConsultasNotificacoesTest(OrcamentoTestMixin, TestCase):
+    """A lista de notificações não cresce em consultas com o número de notificações."""
+
+    def test_listar_notificacoes(self):
+        usuario = User.objects.create(username='cliente')
+        for i in range(15):
+            Notificacao.objects.create(destinatario=usuario, mensagem=f'Aviso {i}', lida=i % 2 == 0)
+        self.client.force_login(usuario)
+        cache.clear()
+
+        self.assertDentroDoOrcamento(self.client.get(reverse('listar_notificacoes')))
+        self.assertFalse(usuario.notificacoes.filter(lida=False).exists())
+
+
+@override_settings(NOTIFICACOES_ENTREGA_IMEDIATA=False)
+class OutboxTest(TestCase):
+    """Enfileiramento idempotente e novas tentativas da entrega em lote."""
+
+    def setUp(self):
+        self.usuario = User.objects.create(username='cliente')
+
+    def test_mesma_chave_vira_um_evento_so(self):
+        enfileirar_notificacao(self.usuario, 'Agendamento confirmado', chave='agendamento:1:novo')
+        enfileirar_notificacao(self.usuario, 'Agendamento confirmado', chave='agendamento:1:novo')
+        self.assertEqual(EventoNotificacao.objects.count(), 1)
+
+        self.assertEqual(processar_lote(), 1)
+        self.assertEqual(processar_lote(), 0)
+        # Reenfileirar depois da entrega também não duplica a notificação
+        enfileirar_notificacao(self.usuario, 'Agendamento confirmado', chave='agendamento:1:novo')
+        self.assertEqual(processar_lote(), 0)
+        self.assertEqual(Notificacao.objects.filter(destinatario=self.usuario).count(), 1)
+        self.assertEqual(EventoNotificacao.objects.get().status, 'ENTREGUE')
+
+    def test_falha_reagenda_com_backoff_ate_desistir(self):
+        enfileirar_notificacao(self.usuario, 'Lembrete', chave='lembrete:1')
+        esperas = []
+
+        with mock.patch('notificacoes.outbox.Notificacao.objects.bulk_create', side_effect=DatabaseError('fora do ar')):
+            for _ in range(3):
+                antes = timezone.now()
+                self.assertEqual(processar_lote(max_tentativas=3), 1)
+                evento = EventoNotificacao.objects.get()
+                esperas.append(evento.proxima_tentativa - antes)
+                # Ainda não é a vez dele: o próximo lote não o pega
+                self.assertEqual(processar_lote(max_tentativas=3), 0)
+                EventoNotificacao.objects.update(proxima_tentativa=timezone.now())
+
+        evento = EventoNotificacao.objects.get()
+        self.assertEqual((evento.status, evento.tentativas, evento.erro), ('FALHOU', 3, 'fora do ar'))
+        self.assertAlmostEqual(esperas[0].total_seconds(), 30, delta=5)
+        self.assertAlmostEqual(esperas[1].total_seconds(), 60, delta=5)
+        self.assertFalse(Notificacao.objects.exists())
+        # Evento que falhou de vez não volta para a fila
+        self.assertEqual(processar_lote(), 0)
+
+    def test_evento_ruim_nao_segura_o_lote(self):
+        for chave in ('lembrete:1', 'lembrete:ruim', 'lembrete:2'):
+            enfileirar_notificacao(self.usuario, 'Lembrete', chave=chave)
+        bulk_create = Notificacao.objects.bulk_create
+
+        def falhar_no_ruim(objs, **kwargs):
+            if any(obj.chave == 'lembrete:ruim' for obj in objs):
+                raise DatabaseError('mensagem inválida')
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch('notificacoes.outbox.Notificacao.objects.bulk_create', side_effect=falhar_no_ruim):
+            self.assertEqual(processar_lote(), 3)
+
+        status = dict(EventoNotificacao.objects.values_list('chave', 'status'))
+        self.assertEqual(status, {'lembrete:1': 'ENTREGUE', 'lembrete:ruim': 'PENDENTE', 'lembrete:2': 'ENTREGUE'})
+        ruim = EventoNotificacao.objects.get(chave='lembrete:ruim')
+        self.assertEqual((ruim.tentativas, ruim.erro), (1, 'mensagem inválida'))
+        self.assertEqual(
+            set(Notificacao.objects.values_list('chave', flat=True)), {'lembrete:1', 'lembrete:2'}
+        )
+
+
+@override_settings(STORAGES=STORAGES_TESTE, NOTIFICACOES_ENTREGA_IMEDIATA=False)
+class ContadorNaoLidasTest(TestCase):
+    """Contador do sininho em cache: só conta no banco quando a chave não existe."""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create(username='cliente')
+        Notificacao.objects.create(destinatario=self.usuario, mensagem='Aviso')
+
+    def test_segunda_leitura_vem_do_cache(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(contar_nao_lidas(self.usuario.pk), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(contar_nao_lidas(self.usuario.pk), 1)
+
+    def test_contexto_so_consulta_se_o_template_usar(self):
+        request = RequestFactory().get('/')
+        request.user = self.usuario
+        with self.assertNumQueries(0):
+            contexto = contador_notificacoes(request)
+        with self.assertNumQueries(1):
+            self.assertEqual(contexto['notificacoes_nao_lidas'], 1)
+
+        # Uma resposta JSON não renderiza o sininho e não conta nada
+        self.client.force_login(self.usuario)
+        cache.clear()
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(reverse('api_horarios_disponiveis'))
+        self.assertFalse([c for c in consultas.captured_queries if 'notificacoes_notificacao' in c['sql']])
+
+    def test_listar_zera_o_contador(self):
+        self.assertEqual(contar_nao_lidas(self.usuario.pk), 1)
+        self.client.force_login(self.usuario)
+        self.client.get(reverse('listar_notificacoes'))
+        with self.assertNumQueries(0):
+            self.assertEqual(contar_nao_lidas(self.usuario.pk), 0)
+
+    def test_entrega_invalida_o_contador(self):
+        self.assertEqual(contar_nao_lidas(self.usuario.pk), 1)
+        enfileirar_notificacao(self.usuario, 'Agendamento confirmado', chave='agendamento:1:novo')
+        # Antes da entrega o contador continua o mesmo
+        self.assertEqual(contar_nao_lidas(self.usuario.pk), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            processar_lote()
+        self.assertEqual(contar_nao_lidas(self.usuario.pk), 2)
+
+    def test_falha_na_entrega_nao_invalida(self):
+        self.assertEqual(contar_nao_lidas(self.usuario.pk), 1)
+        enfileirar_notificacao(self.usuario, 'Lembrete', chave='lembrete:1')
+        with mock.patch('notificacoes.outbox.Notificacao.objects.bulk_create', side_effect=DatabaseError('fora do ar')):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                processar_lote()
+        self.assertEqual(callbacks, [])
+        with self.assertNumQueries(0):
+            self.assertEqual(contar_nao_lidas(self.usuario.pk), 1)
@@ -1,8 +1,28 @@
+from django.core.cache import cache
 from .models import Notificacao
 
-def criar_notificacao(destinatario, mensagem, link=None):
-    Notificacao.objects.create(
-        destinatario=destinatario,
-        mensagem=mensagem,
-        link=link
-    )
\ No newline at end of file
+# O contador do sininho fica em cache; a contagem no banco só roda quando a chave não existe
+# A entrega da outbox (outbox.processar_lote) apaga a chave de quem recebeu, ao gravar as notificações
+TIMEOUT_CONTADOR = 60 * 60 * 24
+
+
+def _chave_nao_lidas(usuario_id):
+    return f'notificacoes:nao_lidas:{usuario_id}'
+
+
+def contar_nao_lidas(usuario_id):
+    chave = _chave_nao_lidas(usuario_id)
+    total = cache.get(chave)
+    if total is None:
+        total = Notificacao.objects.filter(destinatario_id=usuario_id, lida=False).count()
+        cache.set(chave, total, TIMEOUT_CONTADOR)
+    return total
+
+
+def invalidar_nao_lidas(usuario_ids):
+    cache.delete_many([_chave_nao_lidas(usuario_id) for usuario_id in usuario_ids])
+
+
+def zerar_nao_lidas(usuario_id):
+    cache.set(_chave_nao_lidas(usuario_id), 0, TIMEOUT_CONTADOR)
+
@@ -1,7 +1,10 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from .models import Notificacao
+from .utils import zerar_nao_lidas
+from setup.orcamento import orcamento_consultas
 
+@orcamento_consultas(5)
 @login_required
 def listar_notificacoes(request):
     notificacoes = request.user.notificacoes.all()
@@ -9,5 +12,6 @@ def listar_notificacoes(request):
     # Marca todas como lidas ao abrir a página (simples e eficaz)
     # Ou poderíamos marcar uma por uma ao clicar, mas assim limpa o sininho rápido
     request.user.notificacoes.filter(lida=False).update(lida=True)
+    zerar_nao_lidas(request.user.pk)
     
     return render(request, 'notificacoes/listar.html', {'notificacoes': notificacoes})
\ No newline at end of file
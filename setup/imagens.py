@@ -0,0 +1,116 @@
+"""
+Variações reduzidas das fotos enviadas (portfólio e avatar), geradas com Pillow.
+
+O original continua guardado como veio (é ele que abre na galeria ampliada).
+Para cada largura são gravadas duas cópias no mesmo storage do campo (disco local
+ou S3): uma WebP e uma JPEG para navegadores sem WebP. Os caminhos ficam num
+JSONField do modelo, no formato {'webp': {'160': 'caminho'}, 'jpg': {...}}.
+
+Nos templates, `ImagemResponsiva` monta o src/srcset a partir disso e cai para o
+original quando a foto ainda não tem variações (rode `gerar_miniaturas`).
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# Portfólio: galeria (50px) e capa do cartão (~300px de largura), em 1x e 2x
+LARGURAS_PORTFOLIO = (160, 640)
+# Avatar: quadrado, até 120px na tela
+LARGURAS_AVATAR = (120, 240)
+
+QUALIDADE = 80
+FORMATOS = {
+    'webp': 'WEBP',
+    'jpg': 'JPEG',
+}
+
+
+def _abrir(campo):
+    with campo.open('rb') as arquivo:
+        imagem = Image.open(arquivo)
+        imagem.load()
+    # Celulares gravam a rotação no EXIF; aplica antes de reduzir
+    imagem = ImageOps.exif_transpose(imagem)
+    if imagem.mode in ('RGBA', 'LA', 'P'):
+        # JPEG não tem transparência: aplica sobre fundo branco
+        imagem = imagem.convert('RGBA')
+        fundo = Image.new('RGB', imagem.size, 'white')
+        fundo.paste(imagem, mask=imagem.getchannel('A'))
+        imagem = fundo
+    elif imagem.mode not in ('RGB', 'L'):
+        imagem = imagem.convert('RGB')
+    return imagem
+
+
+def gerar_variantes(campo, larguras, quadrado=False):
+    """
+    Gera as variações de um ImageField já salvo e devolve o dicionário de caminhos.
+    Devolve {} se o arquivo não for uma imagem que o Pillow consiga abrir.
+    Nunca amplia: larguras maiores que o original são puladas (menos a menor delas).
+    """
+    try:
+        original = _abrir(campo)
+    except (OSError, Image.DecompressionBombError):
+        return {}
+
+    base, _ = os.path.splitext(campo.name)
+    limite = min(original.size) if quadrado else original.width
+    variantes = {extensao: {} for extensao in FORMATOS}
+    for largura in sorted(larguras):
+        if largura > limite and variantes['jpg']:
+            break
+        if quadrado:
+            reduzida = ImageOps.fit(original, (largura, largura), Image.Resampling.LANCZOS)
+        else:
+            reduzida = original.copy()
+            reduzida.thumbnail((largura, largura * 4), Image.Resampling.LANCZOS)
+
+        for extensao, formato in FORMATOS.items():
+            buffer = BytesIO()
+            reduzida.save(buffer, formato, quality=QUALIDADE, optimize=True)
+            caminho = campo.storage.save(f'{base}_{largura}.{extensao}', ContentFile(buffer.getvalue()))
+            # A chave é a largura real, usada no descritor "w" do srcset
+            variantes[extensao][str(reduzida.width)] = caminho
+    return variantes
+
+
+class ImagemResponsiva:
+    """Acesso às variações no template: src, src_webp, srcset e srcset_webp."""
+
+    def __init__(self, campo, variantes):
+        self.campo = campo
+        self.variantes = variantes or {}
+
+    def __bool__(self):
+        return bool(self.campo)
+
+    def _ordenadas(self, extensao):
+        return sorted(self.variantes.get(extensao, {}).items(), key=lambda item: int(item[0]))
+
+    def _srcset(self, extensao):
+        storage = self.campo.storage
+        return ', '.join(f'{storage.url(caminho)} {largura}w' for largura, caminho in self._ordenadas(extensao))
+
+    def _maior(self, extensao):
+        ordenadas = self._ordenadas(extensao)
+        if ordenadas:
+            return self.campo.storage.url(ordenadas[-1][1])
+        return self.campo.url if self.campo else ''
+
+    @property
+    def src(self):
+        return self._maior('jpg')
+
+    @property
+    def src_webp(self):
+        return self._maior('webp')
+
+    @property
+    def srcset(self):
+        return self._srcset('jpg')
+
+    @property
+    def srcset_webp(self):
+        return self._srcset('webp')
@@ -0,0 +1,194 @@
+"""
+Métricas por view em memória, expostas em /metrics no formato texto do Prometheus.
+
+O MetricasMiddleware mede, para cada requisição, a latência total, quantas
+consultas SQL foram feitas e quanto tempo elas levaram, agrupando pelo nome da
+rota (o `name=` do urls.py). Os valores ficam em histogramas no próprio processo:
+com vários workers do gunicorn, cada um tem os seus e o Prometheus vê o worker
+que atendeu o scrape. Para uma visão somada, agregue por instância no Prometheus.
+
+A contagem de consultas usa `connection.execute_wrapper`, então funciona com
+DEBUG=False e não guarda o SQL.
+"""
+import threading
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_CONSULTAS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+VIEW_DESCONHECIDA = 'desconhecida'
+
+
+class Histograma:
+    """Histograma cumulativo no estilo Prometheus, com uma série por view."""
+
+    def __init__(self, nome, ajuda, buckets):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.buckets = buckets
+        self._series = {}
+        self._trava = threading.Lock()
+
+    def observar(self, view, valor):
+        with self._trava:
+            serie = self._series.get(view)
+            if serie is None:
+                serie = self._series[view] = {'buckets': [0] * len(self.buckets), 'soma': 0, 'total': 0}
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie['buckets'][i] += 1
+            serie['soma'] += valor
+            serie['total'] += 1
+
+    def zerar(self):
+        with self._trava:
+            self._series.clear()
+
+    def series(self):
+        with self._trava:
+            return {view: {'buckets': list(s['buckets']), 'soma': s['soma'], 'total': s['total']}
+                    for view, s in self._series.items()}
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} histogram']
+        for view, serie in sorted(self.series().items()):
+            rotulo = _escapar(view)
+            for limite, quantidade in zip(self.buckets, serie['buckets']):
+                linhas.append(f'{self.nome}_bucket{{view="{rotulo}",le="{limite}"}} {quantidade}')
+            linhas.append(f'{self.nome}_bucket{{view="{rotulo}",le="+Inf"}} {serie["total"]}')
+            linhas.append(f'{self.nome}_sum{{view="{rotulo}"}} {serie["soma"]}')
+            linhas.append(f'{self.nome}_count{{view="{rotulo}"}} {serie["total"]}')
+        return linhas
+
+
+def _escapar(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+LATENCIA = Histograma('salao_requisicao_segundos', 'Latência das requisições por view.', BUCKETS_SEGUNDOS)
+CONSULTAS = Histograma('salao_consultas_por_requisicao', 'Consultas SQL por requisição, por view.', BUCKETS_CONSULTAS)
+TEMPO_CONSULTAS = Histograma('salao_consultas_segundos', 'Tempo gasto em SQL por requisição, por view.', BUCKETS_SEGUNDOS)
+HISTOGRAMAS = (LATENCIA, CONSULTAS, TEMPO_CONSULTAS)
+
+
+def zerar_metricas():
+    for histograma in HISTOGRAMAS:
+        histograma.zerar()
+
+
+class ContadorConsultas:
+    """execute_wrapper que soma quantidade e tempo das consultas de todos os bancos."""
+
+    def __init__(self):
+        self.quantidade = 0
+        self.segundos = 0.0
+        self._pilha = None
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.contar(sql, params, time.perf_counter() - inicio)
+
+    def contar(self, sql, params, segundos):
+        self.segundos += segundos
+        self.quantidade += 1
+
+    def instalar(self):
+        self._pilha = ExitStack()
+        for conexao in connections.all():
+            self._pilha.enter_context(conexao.execute_wrapper(self))
+
+    def remover(self):
+        if self._pilha is not None:
+            self._pilha.close()
+            self._pilha = None
+
+
+def nome_da_view(request):
+    # view_name é o name= da rota (com namespace); sem name, o caminho da função
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is None:
+        return VIEW_DESCONHECIDA
+    return resolver_match.view_name
+
+
+def _registrar(request, segundos, contador):
+    view = nome_da_view(request)
+    LATENCIA.observar(view, segundos)
+    CONSULTAS.observar(view, contador.quantidade)
+    TEMPO_CONSULTAS.observar(view, contador.segundos)
+
+
+class MetricasMiddleware:
+    """Registra latência e consultas de cada requisição (views sync e async)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        contador = ContadorConsultas()
+        contador.instalar()
+        inicio = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            contador.remover()
+            _registrar(request, time.perf_counter() - inicio, contador)
+
+    async def __acall__(self, request):
+        # As conexões do Django são por thread: o contador é instalado na thread
+        # onde o ORM async realmente executa (a mesma durante toda a requisição)
+        contador = ContadorConsultas()
+        await sync_to_async(contador.instalar)()
+        inicio = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            await sync_to_async(contador.remover)()
+            _registrar(request, time.perf_counter() - inicio, contador)
+
+
+def exportar_metricas():
+    linhas = []
+    for histograma in HISTOGRAMAS:
+        linhas.extend(histograma.exportar())
+    return '\n'.join(linhas) + '\n'
+
+
+def _token_valido(request):
+    """O Prometheus não faz login: aceita também `Authorization: Bearer <METRICAS_TOKEN>`."""
+    token = getattr(settings, 'METRICAS_TOKEN', '')
+    cabecalho = request.headers.get('Authorization', '')
+    return bool(token) and constant_time_compare(cabecalho, f'Bearer {token}')
+
+
+def _metricas(request):
+    return HttpResponse(exportar_metricas(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+_metricas_staff = staff_member_required(_metricas)
+
+
+def metricas(request):
+    """Endpoint /metrics (só equipe logada ou scraper com token)."""
+    if _token_valido(request):
+        return _metricas(request)
+    return _metricas_staff(request)
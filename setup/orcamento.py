@@ -0,0 +1,155 @@
+"""
+Orçamento de consultas SQL por view e registro das consultas lentas.
+
+Cada view declara com @orcamento_consultas(n) quantas consultas uma requisição
+pode fazer. A conta inclui tudo o que a requisição faz no banco, inclusive
+sessão e usuário logado. O teto é fixo: uma N+1 (num template, num loop) faz o
+número crescer com os dados e estoura o orçamento.
+
+O OrcamentoMiddleware conta e cronometra as consultas com o mesmo execute_wrapper
+das métricas (setup/metricas.py):
+
+- Passou do orçamento: um warning no log. Com ORCAMENTO_CONSULTAS_ESTRITO=True,
+  ligado pelo executor de testes (setup/testes.py), a requisição falha com
+  OrcamentoExcedido e o teste que a fez quebra.
+- Consulta acima de CONSULTA_LENTA_MS: vai para o log com o SQL, os parâmetros e
+  a view, e entra na lista das últimas consultas lentas do processo
+  (consultas_lentas()).
+"""
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from .metricas import ContadorConsultas, nome_da_view
+
+logger = logging.getLogger(__name__)
+
+CONSULTA_LENTA_MS_PADRAO = 200
+# Quantas consultas lentas cada processo guarda para consulta
+LIMITE_LENTAS = 100
+
+_lentas = deque(maxlen=LIMITE_LENTAS)
+_trava_lentas = threading.Lock()
+
+
+class OrcamentoExcedido(Exception):
+    """A view fez mais consultas do que o orçamento declarado (só no modo estrito)."""
+
+
+def orcamento_consultas(maximo):
+    """Declara o máximo de consultas SQL por requisição da view (função sync/async ou classe)."""
+    def decorator(view):
+        view.orcamento_consultas = maximo
+        return view
+    return decorator
+
+
+def _limite_lenta():
+    return getattr(settings, 'CONSULTA_LENTA_MS', CONSULTA_LENTA_MS_PADRAO) / 1000
+
+
+class MedicaoConsultas(ContadorConsultas):
+    """Conta e cronometra as consultas, guardando SQL e parâmetros das lentas."""
+
+    def __init__(self, limite_lenta=None):
+        super().__init__()
+        self.limite_lenta = _limite_lenta() if limite_lenta is None else limite_lenta
+        self.lentas = []
+
+    def contar(self, sql, params, segundos):
+        super().contar(sql, params, segundos)
+        if segundos >= self.limite_lenta:
+            self.lentas.append({'sql': sql, 'params': params, 'segundos': segundos})
+
+
+@contextmanager
+def medir_consultas(limite_lenta=None):
+    """
+    Mede as consultas de um trecho (fora de uma requisição, ex.: em testes):
+    `quantidade`, `segundos` e `lentas` da medição devolvida.
+    """
+    medicao = MedicaoConsultas(limite_lenta)
+    medicao.instalar()
+    try:
+        yield medicao
+    finally:
+        medicao.remover()
+
+
+def consultas_lentas():
+    """Últimas consultas lentas deste processo, da mais antiga para a mais nova."""
+    with _trava_lentas:
+        return list(_lentas)
+
+
+def zerar_consultas_lentas():
+    with _trava_lentas:
+        _lentas.clear()
+
+
+def _conferir(request, resposta, medicao):
+    view = nome_da_view(request)
+    for lenta in medicao.lentas:
+        with _trava_lentas:
+            _lentas.append({'view': view, **lenta})
+        logger.warning(
+            "Consulta lenta em %s (%.0f ms): %s | parâmetros: %r",
+            view, lenta['segundos'] * 1000, lenta['sql'], lenta['params'],
+        )
+
+    maximo = getattr(request, 'orcamento_consultas', None)
+    # Para os testes conferirem o orçamento a partir da resposta do client
+    resposta.medicao_consultas = medicao
+    resposta.orcamento_consultas = maximo
+    if maximo is None or medicao.quantidade <= maximo:
+        return resposta
+
+    mensagem = f"{view}: {medicao.quantidade} consultas SQL (orçamento: {maximo})"
+    if getattr(settings, 'ORCAMENTO_CONSULTAS_ESTRITO', False):
+        raise OrcamentoExcedido(mensagem)
+    logger.warning("Orçamento de consultas excedido em %s", mensagem)
+    return resposta
+
+
+class OrcamentoMiddleware:
+    """Confere o orçamento de consultas de cada requisição (views sync e async)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        medicao = MedicaoConsultas()
+        medicao.instalar()
+        try:
+            resposta = self.get_response(request)
+        finally:
+            medicao.remover()
+        return _conferir(request, resposta, medicao)
+
+    async def __acall__(self, request):
+        # Como nas métricas: instalado na thread onde o ORM async executa
+        medicao = MedicaoConsultas()
+        await sync_to_async(medicao.instalar)()
+        try:
+            resposta = await self.get_response(request)
+        finally:
+            await sync_to_async(medicao.remover)()
+        return _conferir(request, resposta, medicao)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Em class-based views o decorator vai na classe (as_view() guarda em view_class)
+        request.orcamento_consultas = getattr(
+            view_func, 'orcamento_consultas', getattr(getattr(view_func, 'view_class', None), 'orcamento_consultas', None)
+        )
@@ -0,0 +1,168 @@
+"""
+Leituras numa réplica do banco.
+
+Com DATABASE_REPLICA_URL configurada, settings.py cria o alias `replica` e liga o
+RoteadorReplica e o ReplicaMiddleware. Só vai para a réplica o que foi marcado
+como somente leitura: views com o decorator @somente_leitura e trechos dentro de
+`with na_replica():`. Todo o resto, e toda escrita, continua no primário.
+
+A réplica pode estar alguns segundos atrasada. Para o usuário não deixar de ver
+o que acabou de gravar, quando uma requisição escreve no banco o middleware
+devolve um cookie e, por REPLICA_JANELA_PRIMARIO segundos, as leituras dele
+ficam no primário. Dentro da própria requisição vale o mesmo: depois da primeira
+escrita nenhuma leitura sai do primário.
+
+Quem preenche um cache a partir do banco (expediente, disponibilidade, cartões
+da home) lê com `no_primario()`: o cache fica com a versão nova por horas, e um
+valor montado com dados atrasados da réplica ficaria errado esse tempo todo.
+Como isso só acontece quando o cache falha, o custo no primário é pequeno.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+REPLICA = 'replica'
+PRIMARIO = 'default'
+COOKIE = 'leitura_primario'
+JANELA_PADRAO = 10
+
+
+class EstadoLeitura:
+    """De onde as leituras da requisição (ou do trecho) atual podem vir."""
+
+    __slots__ = ('grudado', 'escreveu', 'somente_leitura', 'primario')
+
+    def __init__(self, grudado=False):
+        self.grudado = grudado  # o usuário escreveu há pouco (cookie)
+        self.escreveu = False  # esta requisição já escreveu
+        self.somente_leitura = 0  # profundidade de @somente_leitura / na_replica()
+        self.primario = 0  # profundidade de no_primario()
+
+    @property
+    def usa_replica(self):
+        return bool(self.somente_leitura) and not (self.grudado or self.escreveu or self.primario)
+
+
+# Um objeto mutável por requisição: o ORM async roda numa thread com uma cópia do
+# contexto, e a escrita marcada lá precisa aparecer aqui
+_estado = ContextVar('estado_leitura', default=None)
+
+
+def _janela():
+    return getattr(settings, 'REPLICA_JANELA_PRIMARIO', JANELA_PADRAO)
+
+
+@contextmanager
+def _com_estado():
+    estado = _estado.get()
+    if estado is not None:
+        yield estado
+        return
+    token = _estado.set(EstadoLeitura())
+    try:
+        yield _estado.get()
+    finally:
+        _estado.reset(token)
+
+
+@contextmanager
+def na_replica():
+    """Trecho só de leitura: as consultas podem ir para a réplica."""
+    with _com_estado() as estado:
+        estado.somente_leitura += 1
+        try:
+            yield
+        finally:
+            estado.somente_leitura -= 1
+
+
+@contextmanager
+def no_primario():
+    """Força o primário dentro de um trecho somente leitura (ex.: preencher um cache)."""
+    with _com_estado() as estado:
+        estado.primario += 1
+        try:
+            yield
+        finally:
+            estado.primario -= 1
+
+
+def somente_leitura(view):
+    """Marca uma view (sync ou async) cujas consultas podem ir para a réplica."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def _view(request, *args, **kwargs):
+            with na_replica():
+                return await view(request, *args, **kwargs)
+    else:
+        @wraps(view)
+        def _view(request, *args, **kwargs):
+            with na_replica():
+                return view(request, *args, **kwargs)
+    return _view
+
+
+class RoteadorReplica:
+    """Leituras marcadas vão para a réplica; escritas (e o resto) para o primário."""
+
+    def db_for_read(self, model, **hints):
+        estado = _estado.get()
+        if estado is not None and estado.usa_replica:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        # select_for_update também passa por aqui
+        estado = _estado.get()
+        if estado is not None:
+            estado.escreveu = True
+        return PRIMARIO
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Os dois aliases têm os mesmos dados
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # A réplica recebe o schema pela replicação, nunca por migrate
+        return db != REPLICA
+
+
+class ReplicaMiddleware:
+    """Liga o estado de leitura da requisição e gruda no primário quem acabou de escrever."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        estado = EstadoLeitura(grudado=COOKIE in request.COOKIES)
+        token = _estado.set(estado)
+        try:
+            resposta = self.get_response(request)
+        finally:
+            _estado.reset(token)
+        return _marcar(resposta, estado)
+
+    async def __acall__(self, request):
+        estado = EstadoLeitura(grudado=COOKIE in request.COOKIES)
+        token = _estado.set(estado)
+        try:
+            resposta = await self.get_response(request)
+        finally:
+            _estado.reset(token)
+        return _marcar(resposta, estado)
+
+
+def _marcar(resposta, estado):
+    if estado.escreveu:
+        resposta.set_cookie(COOKIE, '1', max_age=_janela(), httponly=True, samesite='Lax')
+    return resposta
@@ -35,6 +35,10 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
      "whitenoise.middleware.WhiteNoiseMiddleware", 
+    # Depois do WhiteNoise: arquivos estáticos não entram nas métricas
+    'setup.metricas.MetricasMiddleware',
+    # Orçamento de consultas por view e log de consultas lentas (setup/orcamento.py)
+    'setup.orcamento.OrcamentoMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -75,6 +79,68 @@ DATABASES = {
     )
 }
 
+# Réplica de leitura (opcional). Só views marcadas com @somente_leitura (setup/replica.py)
+# leem dela; quem acabou de escrever fica no primário por REPLICA_JANELA_PRIMARIO segundos.
+# Local: DATABASE_REPLICA_URL=sqlite:///replica.sqlite3 (uma cópia do db.sqlite3)
+DATABASE_REPLICA_URL = config('DATABASE_REPLICA_URL', default='')
+REPLICA_JANELA_PRIMARIO = config('REPLICA_JANELA_PRIMARIO', default=10, cast=int)
+
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = dj_database_url.parse(DATABASE_REPLICA_URL)
+    # Nos testes a réplica é o próprio banco de teste do default
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['setup.replica.RoteadorReplica']
+    MIDDLEWARE.insert(MIDDLEWARE.index('setup.metricas.MetricasMiddleware') + 1, 'setup.replica.ReplicaMiddleware')
+
+# Cache
+# Sem REDIS_URL usamos o cache em memória do próprio processo (bom para desenvolvimento).
+# Em produção com vários workers, aponte REDIS_URL para um Redis compartilhado.
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Tempo (segundos) que os horários livres de um profissional/dia ficam em cache
+DISPONIBILIDADE_CACHE_TIMEOUT = config('DISPONIBILIDADE_CACHE_TIMEOUT', default=3600, cast=int)
+
+# Perfil ASGI: as APIs públicas do formulário de agendamento passam a usar as views async
+# (agendamento/views_async.py). Só ligue quando servir com um worker ASGI (ver README).
+APIS_ASYNC = config('APIS_ASYNC', default=False, cast=bool)
+
+# Token para o Prometheus ler /metrics sem login (Authorization: Bearer <token>).
+# Vazio: só usuários da equipe (is_staff) logados acessam.
+METRICAS_TOKEN = config('METRICAS_TOKEN', default='')
+
+# Orçamento de consultas por view (@orcamento_consultas): acima dele, warning no log.
+# Estrito (OrcamentoExcedido) nos testes, pelo executor abaixo.
+ORCAMENTO_CONSULTAS_ESTRITO = config('ORCAMENTO_CONSULTAS_ESTRITO', default=False, cast=bool)
+TEST_RUNNER = 'setup.testes.ExecutorTestes'
+
+# Consultas SQL acima deste tempo vão para o log com SQL, parâmetros e view
+CONSULTA_LENTA_MS = config('CONSULTA_LENTA_MS', default=200, cast=int)
+
+# Expediente compilado (regra semanal + exceções) por profissional; invalidado por signal
+EXPEDIENTE_CACHE_TIMEOUT = config('EXPEDIENTE_CACHE_TIMEOUT', default=60 * 60 * 24, cast=int)
+
+# Cartões de profissionais da home (invalidados por signal; o timeout é só um teto)
+VITRINE_CACHE_TIMEOUT = config('VITRINE_CACHE_TIMEOUT', default=60 * 60 * 24, cast=int)
+
+# Notificações
+# Em desenvolvimento a outbox é entregue logo após o commit. Em produção deixe False
+# e rode o worker: python manage.py processar_notificacoes --continuo
+NOTIFICACOES_ENTREGA_IMEDIATA = config('NOTIFICACOES_ENTREGA_IMEDIATA', default=DEBUG, cast=bool)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
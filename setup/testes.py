@@ -0,0 +1,25 @@
+"""
+Apoio aos testes do projeto: executor que liga o orçamento de consultas estrito
+e um mixin para conferir o orçamento a partir da resposta do client.
+"""
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class ExecutorTestes(DiscoverRunner):
+    """Executor de testes do projeto: view que estoura o orçamento de consultas quebra o teste."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.ORCAMENTO_CONSULTAS_ESTRITO = True
+
+
+class OrcamentoTestMixin:
+    """Para TestCase: confere o @orcamento_consultas da view pela resposta do client."""
+
+    def assertDentroDoOrcamento(self, resposta):
+        maximo = getattr(resposta, 'orcamento_consultas', None)
+        self.assertIsNotNone(maximo, "A view não declara @orcamento_consultas.")
+        quantidade = resposta.medicao_consultas.quantidade
+        self.assertLessEqual(quantidade, maximo, f"{quantidade} consultas SQL (orçamento: {maximo})")
+        return resposta
@@ -5,6 +5,7 @@ from django.conf.urls.static import static
 # Remova a importação antiga 'auth_views' se não for usar mais nada dela, 
 # ou mantenha se tiver usando PasswordReset
 from users import views as user_views 
+from .metricas import metricas
 
 urlpatterns = [
     path('', user_views.home, name='home'),
@@ -22,6 +23,9 @@ urlpatterns = [
     
     path('notificacoes/', include('notificacoes.urls')),
 
+    # Métricas por view no formato do Prometheus (só equipe ou token)
+    path('metrics', metricas, name='metricas'),
+
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,53 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from agendamento.massa import LOTE, popular_massa
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera uma massa sintética em escala de produção (profissionais, clientes, meses de agenda '
+        'e notificações) com bulk_create e seed fixa. Complementa o populate_salao, que cria só '
+        'os 8 profissionais de demonstração.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profissionais', type=int, default=50)
+        parser.add_argument('--clientes', type=int, default=5000)
+        parser.add_argument('--meses', type=int, default=12, help='Meses de histórico (para trás)')
+        parser.add_argument('--meses-futuros', type=int, default=3, help='Meses de agenda à frente')
+        parser.add_argument('--densidade', type=float, default=0.6, help='Chance de cada horário livre estar ocupado (0 a 1)')
+        parser.add_argument('--notificacoes', type=float, default=1.0, help='Chance de cada agendamento gerar notificação (0 a 1)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--lote', type=int, default=LOTE, help='Linhas por bulk_create')
+        parser.add_argument('--prefixo', default='massa', help='Prefixo dos usernames gerados')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['densidade'] <= 1 or not 0 <= options['notificacoes'] <= 1:
+            raise CommandError('--densidade e --notificacoes devem estar entre 0 e 1.')
+        if User.objects.filter(username__startswith=f"{options['prefixo']}_").exists():
+            raise CommandError(f"Já existem usuários com o prefixo '{options['prefixo']}'. Use outro --prefixo.")
+
+        inicio = time.perf_counter()
+        # Uma transação só: tudo ou nada, e bem mais rápido no SQLite
+        with transaction.atomic():
+            massa = popular_massa(
+                profissionais=options['profissionais'], clientes=options['clientes'],
+                meses_passados=options['meses'], meses_futuros=options['meses_futuros'],
+                densidade=options['densidade'], notificacoes=options['notificacoes'],
+                seed=options['seed'], prefixo=options['prefixo'], lote=options['lote'],
+                saida=self.stdout.write,
+            )
+        duracao = time.perf_counter() - inicio
+
+        linhas = massa['agendamentos'] + massa['notificacoes'] + len(massa['clientes'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{massa['agendamentos']} agendamentos, {massa['notificacoes']} notificações, "
+            f"{len(massa['profissionais'])} profissionais e {len(massa['clientes'])} clientes "
+            f"em {duracao:.1f}s ({linhas / duracao:,.0f} linhas/s)."
+        ))
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from setup.imagens import LARGURAS_AVATAR, ImagemResponsiva, gerar_variantes
 
 class User(AbstractUser):
     TYPE_CHOICES = (
@@ -12,8 +13,23 @@ class User(AbstractUser):
     tipo = models.CharField(max_length=15, choices=TYPE_CHOICES, default='CLIENTE')
     telefone = models.CharField(max_length=20, blank=True, null=True)
     foto = models.ImageField(upload_to='usuarios/', blank=True, null=True)
+    # Caminhos das versões reduzidas da foto (ver setup/imagens.py)
+    foto_variantes = models.JSONField(default=dict, blank=True)
     
     # Adicione aqui outros campos globais se precisar (ex: data_nascimento)
 
     def __str__(self):
-        return self.username
\ No newline at end of file
+        return self.username
+
+    @property
+    def foto_responsiva(self):
+        return ImagemResponsiva(self.foto, self.foto_variantes)
+
+    def gerar_miniaturas_foto(self, salvar=True):
+        # Com salvar=False quem chama grava foto e variações num único save()
+        if self.foto and not self.foto._committed:
+            # Foto recém-enviada: vai para o storage antes de virar miniatura
+            self.foto.save(self.foto.name, self.foto.file, save=False)
+        self.foto_variantes = gerar_variantes(self.foto, LARGURAS_AVATAR, quadrado=True) if self.foto else {}
+        if salvar:
+            self.save(update_fields=['foto_variantes'])
@@ -1,3 +1,128 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import BytesIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from agendamento.models import Portfolio, Servico
+from agendamento.tests import STORAGES_TESTE
+from setup.testes import OrcamentoTestMixin
+from .models import User
+
+
+MEDIA_TESTE = tempfile.mkdtemp()
+
+
+@override_settings(STORAGES=STORAGES_TESTE, MEDIA_ROOT=MEDIA_TESTE)
+class HomeVitrineTest(TestCase):
+    """Cartões da home: consultas fixas no cache frio, quase nenhuma no quente, e invalidação por signal."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_TESTE, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+
+    def _criar_profissionais(self, quantidade):
+        for _ in range(quantidade):
+            prof = User.objects.create(username=f'prof-{User.objects.count()}', tipo='CABELEIREIRO')
+            for nome in ('Corte', 'Barba', 'Escova', 'Luzes'):
+                Servico.objects.create(profissional=prof, nome=nome, preco=50, duracao_minutos=30)
+            for i in range(2):
+                Portfolio.objects.create(profissional=prof, imagem=SimpleUploadedFile(f'foto{i}.jpg', b'x'))
+
+    def test_consultas_fixas_no_cache_frio(self):
+        self._criar_profissionais(2)
+        # ids dos profissionais, profissionais, serviços e portfólio
+        with self.assertNumQueries(4):
+            self.client.get(reverse('home'))
+
+        cache.clear()
+        self._criar_profissionais(8)
+        with self.assertNumQueries(4):
+            resposta = self.client.get(reverse('home'))
+        self.assertContains(resposta, 'class="pro-card', count=10)
+
+    def test_cache_quente_so_busca_os_ids(self):
+        self._criar_profissionais(3)
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(1):
+            self.client.get(reverse('home'))
+
+    def test_alteracao_invalida_so_o_cartao_do_profissional(self):
+        self._criar_profissionais(3)
+        self.client.get(reverse('home'))
+
+        servico = Servico.objects.filter(profissional__username='prof-0').first()
+        servico.nome = 'Hidratação'
+        servico.save()
+
+        # Só o cartão alterado é renderizado de novo
+        with self.assertNumQueries(4):
+            resposta = self.client.get(reverse('home'))
+        self.assertContains(resposta, 'Hidratação')
+
+
+@override_settings(STORAGES=STORAGES_TESTE, MEDIA_ROOT=MEDIA_TESTE)
+class OrcamentoConsultasUsersTest(OrcamentoTestMixin, TestCase):
+    """As views de usuários cabem no @orcamento_consultas com o cache frio."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_TESTE, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        for i in range(5):
+            prof = User.objects.create(username=f'prof-{i}', tipo='CABELEIREIRO')
+            Servico.objects.create(profissional=prof, nome='Corte', preco=50, duracao_minutos=30)
+        self.usuario = User.objects.create_user('cliente', password='senha-forte-123', email='c@exemplo.com')
+
+    def _conferir(self, resposta):
+        cache.clear()
+        return self.assertDentroDoOrcamento(resposta)
+
+    def test_paginas_publicas(self):
+        self._conferir(self.client.get(reverse('home')))
+        self._conferir(self.client.get(reverse('registro')))
+        resposta = self._conferir(self.client.post(reverse('registro'), {
+            'username': 'novo', 'email': 'novo@exemplo.com', 'telefone': '11999999999',
+            'password1': 'senha-forte-123', 'password2': 'senha-forte-123',
+        }))
+        self.assertRedirects(resposta, reverse('login'), fetch_redirect_response=False)
+
+    def test_login_perfil_e_logout(self):
+        self._conferir(self.client.get(reverse('login')))
+        resposta = self._conferir(self.client.post(reverse('login'), {'username': 'cliente', 'password': 'senha-forte-123'}))
+        self.assertEqual(resposta.status_code, 302)
+        self._conferir(self.client.get(reverse('home')))
+        self._conferir(self.client.get(reverse('editar_perfil')))
+        resposta = self._conferir(self.client.post(reverse('editar_perfil'), {
+            'first_name': 'Carla', 'last_name': 'Souza', 'email': 'c@exemplo.com', 'telefone': '11988887777',
+        }))
+        self.assertRedirects(resposta, reverse('editar_perfil'), fetch_redirect_response=False)
+        self._conferir(self.client.get(reverse('logout')))
+
+    def test_perfil_com_foto_nova(self):
+        self.client.force_login(self.usuario)
+        buffer = BytesIO()
+        Image.new('RGB', (400, 300), 'white').save(buffer, 'PNG')
+        resposta = self._conferir(self.client.post(reverse('editar_perfil'), {
+            'first_name': 'Carla', 'email': 'c@exemplo.com', 'telefone': '11988887777',
+            'foto': SimpleUploadedFile('avatar.png', buffer.getvalue(), content_type='image/png'),
+        }))
+        self.assertRedirects(resposta, reverse('editar_perfil'), fetch_redirect_response=False)
+
+        # Foto e miniaturas gravadas no mesmo UPDATE
+        self.usuario.refresh_from_db()
+        self.assertTrue(self.usuario.foto.storage.exists(self.usuario.foto.name))
+        self.assertEqual(sorted(self.usuario.foto_variantes['webp'], key=int), ['120', '240'])
+        for caminho in self.usuario.foto_variantes['jpg'].values():
+            self.assertTrue(self.usuario.foto.storage.exists(caminho))
@@ -7,14 +7,23 @@ from django.contrib.auth.models import User
 from .forms import ClienteRegistroForm, PerfilForm
 from agendamento.models import Portfolio
 from .models import User
+from .vitrine import cartoes_profissionais
+from setup.replica import somente_leitura
+from setup.orcamento import orcamento_consultas
 
+@orcamento_consultas(7)
+@somente_leitura
 def home(request):
-    # prefetch_related('servicos', 'portfolio') faz uma mágica de performance:
-    # carrega tudo em apenas 2 ou 3 consultas ao banco, em vez de 1 consulta por cabeleireiro.
-    profissionais = User.objects.filter(tipo='CABELEIREIRO').prefetch_related('servicos', 'portfolio')
+    # Os cartões vêm prontos do cache (users/vitrine.py). Só os que mudaram são
+    # renderizados de novo, com serviços e portfólio pré-carregados (3 consultas no total).
+    profissional_ids = list(
+        User.objects.filter(tipo='CABELEIREIRO').order_by('id').values_list('id', flat=True)
+    )
+    cartoes = cartoes_profissionais(request, profissional_ids)
     
-    return render(request, 'home.html', {'profissionais': profissionais})
+    return render(request, 'home.html', {'cartoes': cartoes})
 
+@orcamento_consultas(3)
 def registro(request):
     if request.method == 'POST':
         form = ClienteRegistroForm(request.POST)
@@ -26,13 +35,18 @@ def registro(request):
         form = ClienteRegistroForm()
     return render(request, 'users/registro.html', {'form': form})
 
+@orcamento_consultas(3)
 @login_required
 def editar_perfil(request):
     if request.method == 'POST':
         # instance=request.user carrega os dados atuais do usuário no formulário
         form = PerfilForm(request.POST, request.FILES, instance=request.user)
         if form.is_valid():
-            form.save()
+            usuario = form.save(commit=False)
+            if 'foto' in form.changed_data:
+                # Miniaturas antes do save: um UPDATE só leva a foto e as variações
+                usuario.gerar_miniaturas_foto(salvar=False)
+            usuario.save()
             messages.success(request, 'Perfil atualizado com sucesso!')
             return redirect('editar_perfil')
     else:
@@ -40,6 +54,7 @@ def editar_perfil(request):
     
     return render(request, 'users/perfil.html', {'form': form})
 
+@orcamento_consultas(9)
 class CustomLoginView(LoginView):
     template_name = 'users/login.html'
 
@@ -58,11 +73,13 @@ class CustomLoginView(LoginView):
         return super().form_invalid(form)
 
 # 2. VIEW DE LOGOUT CUSTOMIZADA
+@orcamento_consultas(4)
 def custom_logout(request):
     logout(request)
     messages.info(request, "Você saiu do sistema. Até logo!") # Toast de despedida
     return redirect('home')
 
+@somente_leitura
 def lista_profissionais(request):
     # Pega apenas usuários do tipo cabeleireiro
     profissionais = User.objects.filter(tipo='CABELEIREIRO')
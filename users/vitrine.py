@@ -0,0 +1,89 @@
+"""
+Cache dos cartões de profissionais da home (a página mais acessada do site).
+
+Cada cartão é guardado já renderizado, por profissional. Como em
+agendamento/cache.py, a chave leva um número de versão do profissional: salvar ou
+apagar o usuário, um serviço ou uma foto do portfólio só troca a versão (ver
+agendamento/signals.py) e o cartão antigo expira sozinho.
+
+O botão do cartão muda para quem está logado, então existem duas variações.
+Cartões novos são montados com dados do primário, não da réplica de leitura.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+
+from agendamento.models import Portfolio, Servico
+from setup.replica import no_primario
+from .models import User
+
+PREFIXO = 'vitrine'
+TIMEOUT_PADRAO = 60 * 60 * 24
+
+
+def _timeout():
+    return getattr(settings, 'VITRINE_CACHE_TIMEOUT', TIMEOUT_PADRAO)
+
+
+def _chave_versao(profissional_id):
+    return f'{PREFIXO}:versao:{profissional_id}'
+
+
+def invalidar_cartao(profissional_id):
+    chave = _chave_versao(profissional_id)
+    try:
+        cache.incr(chave)
+    except ValueError:
+        cache.set(chave, time.time_ns(), None)
+
+
+def _versoes(profissional_ids):
+    """Versão de cada profissional numa ida só ao cache (cria as que faltam)."""
+    chaves = {pk: _chave_versao(pk) for pk in profissional_ids}
+    encontradas = cache.get_many(chaves.values())
+    versoes = {}
+    for pk, chave in chaves.items():
+        if chave not in encontradas:
+            cache.add(chave, time.time_ns(), None)
+            encontradas[chave] = cache.get(chave)
+        versoes[pk] = encontradas[chave]
+    return versoes
+
+
+def profissionais_da_vitrine(profissional_ids):
+    """
+    Profissionais com serviços e portfólio pré-carregados (3 consultas no total).
+    Os Prefetch ordenados garantem que o template só use o que veio do prefetch.
+    """
+    return User.objects.filter(id__in=profissional_ids).prefetch_related(
+        Prefetch('servicos', queryset=Servico.objects.order_by('id')),
+        Prefetch('portfolio', queryset=Portfolio.objects.order_by('id')),
+    ).order_by('id')
+
+
+def cartoes_profissionais(request, profissional_ids):
+    """
+    HTML do cartão de cada profissional, na ordem de `profissional_ids`.
+    Só os cartões que não estão em cache vão ao banco.
+    """
+    autenticado = 'logado' if request.user.is_authenticated else 'anonimo'
+    versoes = _versoes(profissional_ids)
+    chaves = {pk: f'{PREFIXO}:cartao:{pk}:{versoes[pk]}:{autenticado}' for pk in profissional_ids}
+
+    em_cache = cache.get_many(chaves.values())
+    faltando = [pk for pk in profissional_ids if chaves[pk] not in em_cache]
+
+    if faltando:
+        novos = {}
+        with no_primario():
+            for prof in profissionais_da_vitrine(faltando):
+                novos[chaves[prof.id]] = render_to_string(
+                    'users/_cartao_profissional.html', {'prof': prof}, request=request
+                )
+        cache.set_many(novos, _timeout())
+        em_cache.update(novos)
+
+    return [em_cache[chaves[pk]] for pk in profissional_ids if chaves[pk] in em_cache]